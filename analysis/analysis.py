@@ -10,21 +10,27 @@ def get_file_path():
 
 sys.path.append(os.path.join(get_file_path(), '../'))
 from nlp import utils as nlp_utils
-from utils import get_people_mentioned_new
+from utils import get_people_mentioned_new, get_required_annotations
 
 
-def get_article_info(article_text, ann=None, verbose=False, make_json=True):
+# The annotators we need CoreNLP to run for the whole pipeline.
+PIPELINE_ANNOTATORS = nlp_utils.get_annotators(get_required_annotations())
+
+
+def get_article_info(article_text, ann=None, verbose=False, make_json=True,
+                     use_cache=True):
     """
     Given a piece of text, runs it through our entire pipeline.
 
     Can optionally pass it the CoreNLP annotation if it was precomputed.
+    Otherwise, the annotation comes from the on-disk annotation cache if this
+    exact text has been annotated before (unless use_cache is False).
     """
     if ann is None:
         ann = nlp_utils.annotate_corenlp(
                 article_text,
-                annotators=['pos', 'lemma', 'ner', 'parse',
-                            'depparse', 'dcoref', 'quote',
-                            'openie'])
+                annotators=PIPELINE_ANNOTATORS,
+                use_cache=use_cache)
 
     sentences, corefs = ann['sentences'], ann['corefs']
     if verbose:
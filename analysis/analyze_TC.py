@@ -13,6 +13,7 @@ def get_file_path():
 
 sys.path.append(os.path.join(get_file_path(), '../'))
 from nlp.utils import annotate_corenlp
+from tc_partitions import iter_techcrunch
 
 # techcrunch_data =
 if __name__ == "__main__":
@@ -20,11 +21,17 @@ if __name__ == "__main__":
     parser.add_argument('--path',
                         default=os.path.join(
                             get_file_path(),
-                            '../data/techcrunch_everything.json'))
+                            '../data/techcrunch_everything.json'),
+                        help='The JSON file, or the folder of its monthly '
+                             'partitions (see tc_partitions.py).')
+    parser.add_argument('year', type=int)
+    parser.add_argument('--month', type=int, default=0,
+                        help='Which month? 0 means all.')
     args = parser.parse_args()
     print args.path
-    with open(args.path, 'r') as tc_f:
-        print time.ctime()
-        tc_data = json.load(tc_f)
-        print time.ctime()
-    print type(tc_data)
+    print time.ctime()
+    num_articles = 0
+    for url, data in iter_techcrunch(args.path, args.year, args.month):
+        num_articles += 1
+    print time.ctime()
+    print num_articles, 'articles'
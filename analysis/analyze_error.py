@@ -7,6 +7,8 @@ import os
 import json
 import time
 from analysis import get_article_info
+from annotation_io import TSVWriter, iter_annotation_lines
+from dedup import DUPLICATE_KEY
 
 
 MANUAL_HEADERS = ['Full Name', 'Gender', 'Mentions count', 'Say something?',
@@ -43,87 +45,103 @@ def load_manual_ann(manual_path, art_id, annotator):
     return info_dict
 
 
+def iter_annotated_articles(corenlp_fn):
+    """
+    Yields (art_id, art_data, ann) for the articles of the annotation TSV
+    that have an annotation. Duplicates (see dedup.py) have null instead,
+    and so do articles that CoreNLP timed out on in older TSVs; we skip
+    those, rather than have get_article_info annotate them all over again.
+    """
+    for line in iter_annotation_lines(corenlp_fn):
+        art_id, art_data, ann = line.strip().split('\t')
+        art_data = json.loads(art_data)
+        ann = json.loads(ann)
+        if not type(ann) is dict:
+            if DUPLICATE_KEY in art_data:
+                print 'Skipping {}, a duplicate of {}'.format(
+                    art_id, art_data[DUPLICATE_KEY])
+            else:
+                print 'Skipping {}, which has no annotation'.format(art_id)
+            continue
+        yield art_id, art_data, ann
+
+
 def analyze_error(corenlp_fn, manual_path, annotator):
     """
     Annotator: either 'v' or 'p'
     """
     all_errors = {}
     try:
-        with open(corenlp_fn, 'r') as corenlp_f:
-            for line in corenlp_f:
-                art_id, art_data, ann = line.strip().split('\t')
-                art_data = json.loads(art_data)
-                ann = json.loads(ann)
-
-                # print 'Analyzing art_id {}'.format(art_id)
-
-                # Load Manual
-                try:
-                    manual_ann = load_manual_ann(
-                            manual_path, art_id, annotator)
-                except IOError:
+        for art_id, art_data, ann in iter_annotated_articles(corenlp_fn):
+            # print 'Analyzing art_id {}'.format(art_id)
+
+            # Load Manual
+            try:
+                manual_ann = load_manual_ann(
+                        manual_path, art_id, annotator)
+            except IOError:
+                continue
+
+            # Load Automated
+            people_mentioned, quotes, verbs, sources, adjectives = \
+                get_article_info(art_data['text'], ann=ann)
+
+            errors = {
+                'mention_not_found': 0,
+                'extra_mention': 0,
+                'mismatch_mention_count': 0,
+                'mean_diff_mention_count': 0,
+                'mismatch_quote_count': 0,
+                'mean_diff_quote_count': 0,
+                'gender_mismatch': 0,
+                'gender_not_found': 0,
+                'total_m_count': 0,
+                'total_m_quotes': 0
+            }
+            print art_id
+            # print manual_ann.keys()
+            # print people_mentioned.keys()
+
+            errors['extra_mention'] = len(
+                    [n for n in people_mentioned if n not in manual_ann])
+            print 'Extra mentions'
+            print [n for n in people_mentioned if n not in manual_ann]
+            print 'Missing mentions'
+            print [n for n in manual_ann if n not in people_mentioned]
+            for name in manual_ann:
+                if name not in people_mentioned:
+                    print name, 'is missing from automated list ...'
+                    errors['mention_not_found'] += 1
                     continue
 
-                # Load Automated
-                people_mentioned, quotes, verbs, sources, adjectives = \
-                    get_article_info(art_data['text'], ann=ann)
-
-                errors = {
-                    'mention_not_found': 0,
-                    'extra_mention': 0,
-                    'mismatch_mention_count': 0,
-                    'mean_diff_mention_count': 0,
-                    'mismatch_quote_count': 0,
-                    'mean_diff_quote_count': 0,
-                    'gender_mismatch': 0,
-                    'gender_not_found': 0,
-                    'total_m_count': 0,
-                    'total_m_quotes': 0
-                }
-                print art_id
-                # print manual_ann.keys()
-                # print people_mentioned.keys()
-
-                errors['extra_mention'] = len(
-                        [n for n in people_mentioned if n not in manual_ann])
-                print 'Extra mentions'
-                print [n for n in people_mentioned if n not in manual_ann]
-                print 'Missing mentions'
-                print [n for n in manual_ann if n not in people_mentioned]
-                for name in manual_ann:
-                    if name not in people_mentioned:
-                        print name, 'is missing from automated list ...'
-                        errors['mention_not_found'] += 1
-                        continue
-
-                    a_count, (a_gender, _) = people_mentioned[name]
-                    m_gender, m_count, m_quotes = manual_ann[name]
-                    a_quotes = len(quotes[name])
-
-                    # print name
-                    m_count = int(m_count)
-                    m_quotes = 0 if len(m_quotes) == 0 else int(m_quotes)
-
-                    # print name
-                    if a_gender is None:
-                        errors['gender_not_found'] += 1
-                    elif a_gender.lower() != m_gender.lower():
-                        errors['gender_mismatch'] += 1
-                    if a_count != m_count:
-                        errors['mismatch_mention_count'] += 1
-                        errors['mean_diff_mention_count'] += \
-                            float(abs(a_count - m_count))
-                    if a_quotes != m_quotes:
-                        if m_quotes > 0:
-                            errors['mean_diff_quote_count'] += \
-                                float(abs(a_quotes - m_quotes))
-                        errors['mismatch_quote_count'] += 1
-
-                    errors['total_m_count'] += m_count
-                    errors['total_m_quotes'] += m_quotes
-
-                # print art_id, len(manual_ann), errors
-                all_errors[art_id] = (len(manual_ann), errors)
+                a_count, (a_gender, _) = people_mentioned[name]
+                m_gender, m_count, m_quotes = manual_ann[name]
+                a_quotes = len(quotes[name])
+
+                # print name
+                m_count = int(m_count)
+                m_quotes = 0 if len(m_quotes) == 0 else int(m_quotes)
+
+                # print name
+                if a_gender is None:
+                    errors['gender_not_found'] += 1
+                elif a_gender.lower() != m_gender.lower():
+                    errors['gender_mismatch'] += 1
+                if a_count != m_count:
+                    errors['mismatch_mention_count'] += 1
+                    errors['mean_diff_mention_count'] += \
+                        float(abs(a_count - m_count))
+                if a_quotes != m_quotes:
+                    if m_quotes > 0:
+                        errors['mean_diff_quote_count'] += \
+                            float(abs(a_quotes - m_quotes))
+                    errors['mismatch_quote_count'] += 1
+
+                errors['total_m_count'] += m_count
+                errors['total_m_quotes'] += m_quotes
+
+            # print art_id, len(manual_ann), errors
+            all_errors[art_id] = (len(manual_ann), errors)
     except IOError:
         pass
 
@@ -166,87 +184,83 @@ def dump_error(corenlp_fn, manual_path, output):
             'a_gender', 'm_count', 'a_count',
             'm_quotes', 'a_quotes', 'm_source', 'a_source']
 
-    with open(output, 'w') as output_f:
+    def write_row(to_print):
+        output_f.write('{}\n'.format(
+            '\t'.join(['{}'.format(to_print.get(key, '')) for key in KEYS])))
+
+    with TSVWriter(output, truncate=True) as output_f:
         output_f.write('{}\n'.format('\t'.join(KEYS)))
+        _dump_articles(corenlp_fn, manual_path, write_row)
 
-    with open(corenlp_fn, 'r') as corenlp_f:
-        for line in corenlp_f:
-            art_id, art_data, ann = line.strip().split('\t')
-            art_data = json.loads(art_data)
-            ann = json.loads(ann)
-            # print 'Analyzing art_id {}'.format(art_id)
 
-            # Load Manual
+def _dump_articles(corenlp_fn, manual_path, write_row):
+
+    for art_id, art_data, ann in iter_annotated_articles(corenlp_fn):
+        # print 'Analyzing art_id {}'.format(art_id)
+
+        # Load Manual
+        try:
+            manual_ann = load_manual_ann(
+                    manual_path, art_id, 'v')
+        except IOError:
             try:
                 manual_ann = load_manual_ann(
-                        manual_path, art_id, 'v')
+                        manual_path, art_id, 'p')
             except IOError:
-                try:
-                    manual_ann = load_manual_ann(
-                            manual_path, art_id, 'p')
-                except IOError:
-                    continue
-
-            # Load Automated
-            people_mentioned, quotes, verbs, sources, adjectives = \
-                get_article_info(art_data['text'], ann=ann)
-
-            for name in manual_ann:
-                to_print = {'art_id': art_id, 'url': art_data['url'],
-                            'name': name}
-                m_gender, m_count, m_quotes, m_source = manual_ann[name]
-                to_print['m_count'] = m_count
-                to_print['m_source'] = m_source
-                to_print['m_quotes'] = m_quotes
-                to_print['m_gender'] = m_gender.lower()
-                if name in people_mentioned:
-                    to_print['where'] = 'both'
-                    a_count, (a_gender, _) = people_mentioned[name]
-                    a_quotes = len(quotes[name])
-                    m_count = 0 if len(m_count) == 0 else int(m_count)
-                    m_quotes = 0 if len(m_quotes) == 0 else int(m_quotes)
-                    if type(a_gender) is str:
-                        to_print['a_gender'] = a_gender.lower()
-                    elif type(a_gender) is tuple:
-                        to_print['a_gender'] = a_gender[0].lower()
-                    else:
-                        to_print['a_gender'] = None
-                    to_print['a_count'] = a_count
-                    to_print['a_quotes'] = a_quotes
-                    # sources[name] is a list of reasons why
-                    # name is a source; it's empty if
-                    # name is not a source.
-                    to_print['a_source'] = len(sources[name]) > 0
-                else:
-                    to_print['where'] = 'manual_only'
-
-                with open(output, 'a') as output_f:
-                    for key in KEYS[:-1]:
-                        output_f.write('{}\t'.format(to_print.get(key, '')))
-                    output_f.write('{}'.format(to_print.get(KEYS[-1], '')))
-                    output_f.write('\n')
-
-            for name in people_mentioned:
-                if name in manual_ann:
-                    continue
+                continue
+
+        # Load Automated
+        people_mentioned, quotes, verbs, sources, adjectives = \
+            get_article_info(art_data['text'], ann=ann)
+
+        for name in manual_ann:
+            to_print = {'art_id': art_id, 'url': art_data['url'],
+                        'name': name}
+            m_gender, m_count, m_quotes, m_source = manual_ann[name]
+            to_print['m_count'] = m_count
+            to_print['m_source'] = m_source
+            to_print['m_quotes'] = m_quotes
+            to_print['m_gender'] = m_gender.lower()
+            if name in people_mentioned:
+                to_print['where'] = 'both'
                 a_count, (a_gender, _) = people_mentioned[name]
+                a_quotes = len(quotes[name])
+                m_count = 0 if len(m_count) == 0 else int(m_count)
+                m_quotes = 0 if len(m_quotes) == 0 else int(m_quotes)
                 if type(a_gender) is str:
-                    a_gender = a_gender.lower()
+                    to_print['a_gender'] = a_gender.lower()
                 elif type(a_gender) is tuple:
-                    a_gender = a_gender[0].lower()
+                    to_print['a_gender'] = a_gender[0].lower()
                 else:
-                    a_gender = None
-
-                to_print = {'art_id': art_id, 'url': art_data['url'],
-                            'name': name, 'where': 'auto_only',
-                            'a_gender': a_gender, 'a_count': a_count}
+                    to_print['a_gender'] = None
+                to_print['a_count'] = a_count
+                to_print['a_quotes'] = a_quotes
+                # sources[name] is a list of reasons why
+                # name is a source; it's empty if
+                # name is not a source.
                 to_print['a_source'] = len(sources[name]) > 0
-
-                with open(output, 'a') as output_f:
-                    for key in KEYS[:-1]:
-                        output_f.write('{}\t'.format(to_print.get(key, '')))
-                    output_f.write('{}'.format(to_print.get(KEYS[-1], '')))
-                    output_f.write('\n')
+            else:
+                to_print['where'] = 'manual_only'
+
+            write_row(to_print)
+
+        for name in people_mentioned:
+            if name in manual_ann:
+                continue
+            a_count, (a_gender, _) = people_mentioned[name]
+            if type(a_gender) is str:
+                a_gender = a_gender.lower()
+            elif type(a_gender) is tuple:
+                a_gender = a_gender[0].lower()
+            else:
+                a_gender = None
+
+            to_print = {'art_id': art_id, 'url': art_data['url'],
+                        'name': name, 'where': 'auto_only',
+                        'a_gender': a_gender, 'a_count': a_count}
+            to_print['a_source'] = len(sources[name]) > 0
+
+            write_row(to_print)
 
 
 if __name__ == "__main__":
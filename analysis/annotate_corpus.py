@@ -0,0 +1,560 @@
+"""
+Annotates a corpus with CoreNLP, keeping many articles in flight across the
+CoreNLP servers, and writing them to the corpus's annotation TSV as they come
+back. The corpora themselves are in sources.py.
+
+We write to the TSV file in the format:
+article id <tab> JSON with article info <tab> JSON of CoreNLP Annotation
+(If we try to write the entire thing as one big JSON, it's just way
+too slow.)
+By default, the TSV is gzipped and split into shards (see --codec and
+--shard_mb); annotation_io.iter_annotation_lines reads it back either way.
+With --status_file, the progress of the run (rates, error rates and ETAs,
+for each source and all of them, and the state of the servers) is kept in
+that file as we go; python nlp/progress.py shows it.
+
+Usage:
+python analysis/annotate_corpus.py nyt 1990 1 --port 9000 9001
+python analysis/annotate_corpus.py nyt 1990 1 2 3 --port 9000 9001 \
+    --longest_first
+python analysis/annotate_corpus.py nyt 1990 `seq 1 12` --port 9000 9001 \
+    --index_file annotated/NYT/nyt_index.npz --stratified
+python analysis/annotate_corpus.py tc 2012 --month 3 --port 9000
+python analysis/annotate_corpus.py manual --input_path annotations/
+"""
+import argparse
+import atexit
+import collections
+import json
+import os
+import sys
+import time
+
+
+def get_file_path():
+    return os.path.dirname(os.path.realpath(__file__))
+
+sys.path.append(os.path.join(get_file_path(), '../'))
+from nlp.utils import annotate_corenlp_many, CoreNLPDispatcher
+from nlp.progress import AnnotationProgress
+from nlp.telemetry import get_telemetry
+from nlp.fleet import CoreNLPFleet
+from analysis import PIPELINE_ANNOTATORS
+from annotation_io import (CODECS, AnnotationOutput, FailureJournal,
+                           get_failure_journal_path)
+from coordination import (DEFAULT_LEASE_SECONDS, LeaseDirectory,
+                          annotate_shards, get_shard_name)
+from dedup import DUPLICATE_KEY, Deduplicator
+from sampling import save_strata, stratified_order
+from sources import SOURCES
+
+
+PRINT_EVERY = 100
+METRICS_EVERY = 100
+
+
+def add_annotation_arguments(parser, with_port=True):
+    """
+    Adds the arguments for how to annotate (as opposed to what to annotate,
+    which the sources add).
+    """
+    if with_port:
+        parser.add_argument('--port', type=int, nargs='+', default=[9000],
+                            help='The port(s) of the CoreNLP server(s)!')
+    parser.add_argument('--max_in_flight', type=int, default=8,
+                        help='How many articles to annotate at once? Each '
+                             'goes to the server with the fewest in flight, '
+                             'so a few per server keeps them all busy.')
+    parser.add_argument('--protobuf', action='store_true',
+                        help='Get the (much smaller) protobuf output from '
+                             'CoreNLP, and only keep the parts we use.')
+    parser.add_argument('--chunk_chars', type=int, default=None,
+                        help='Annotate articles longer than this many '
+                             'characters a few paragraphs at a time.')
+    parser.add_argument('--batch_chars', type=int, default=None,
+                        help='Send articles shorter than this many '
+                             'characters to CoreNLP in batches of up to '
+                             'this many characters.')
+    parser.add_argument('--cache', action='store_true',
+                        help='Look articles up in the on-disk annotation '
+                             'cache, and keep a copy of each annotation '
+                             'there. (Off by default, as each article of a '
+                             'corpus is only annotated once, and the cache '
+                             'would be a second copy of the output.)')
+    parser.add_argument('--timeout', type=float, default=150.,
+                        help='Seconds to wait for a server to answer a '
+                             'request before counting it as a failure '
+                             '(longer than the servers\' own timeout, so '
+                             'that they get to say they timed out).')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='How many times to retry a failed article?')
+    parser.add_argument('--backoff', type=float, default=1.,
+                        help='Seconds to wait before the first retry.')
+    parser.add_argument('--metrics_file', default=None,
+                        help='Where to keep the CoreNLP request statistics '
+                             '(updated as we go).')
+    parser.add_argument('--status_file', default=None,
+                        help='Where to keep the progress of the run (see '
+                             'nlp/progress.py).')
+    parser.add_argument('--status_seconds', type=float, default=10.,
+                        help='How often to update the --status_file.')
+    parser.add_argument('--start_servers', action='store_true',
+                        help='Start (and afterwards stop) our own '
+                             'CoreNLP servers on the given port(s).')
+    parser.add_argument('--server_heap', default='4g',
+                        help='Java heap size for each server we start.')
+    parser.add_argument('--retry_failed', action='store_true',
+                        help='Only annotate the articles in the failure '
+                             'journal (which are skipped otherwise).')
+    parser.add_argument('--codec', choices=CODECS, default='gzip',
+                        help='How to compress the annotations.')
+    parser.add_argument('--shard_mb', type=float, default=256,
+                        help='Split the annotations of each source into '
+                             'files of about this many MB (on disk); 0 '
+                             'means one file.')
+    parser.add_argument('--dedup', action='store_true',
+                        help="Don't annotate exact or near duplicates of "
+                             "articles we've already seen (see dedup.py).")
+    parser.add_argument('--dedup_index', default=None,
+                        help='Keep the articles we dedup against in this '
+                             'file, so that later runs use them too (one '
+                             'file per node, with --lease_dir).')
+    parser.add_argument('--dedup_threshold', type=float, default=0.8,
+                        help='How similar near duplicates are (0 to 1).')
+    parser.add_argument('--lease_dir', default=None,
+                        help='Share the work with the other nodes that use '
+                             'this (shared) folder of leases; see '
+                             'coordination.py.')
+    parser.add_argument('--node', default=None,
+                        help='Our name among the nodes (default: the host '
+                             'name).')
+    parser.add_argument('--lease_seconds', type=float,
+                        default=DEFAULT_LEASE_SECONDS,
+                        help='How long a node can go without renewing its '
+                             'lease before others take it over.')
+    order = parser.add_mutually_exclusive_group()
+    order.add_argument('--longest_first', action='store_true',
+                       help='Annotate the articles of all the sources '
+                            '(e.g. all the months) together, longest '
+                            'first, so that the servers finish together.')
+    order.add_argument('--stratified', action='store_true',
+                       help='Annotate the articles of all the sources '
+                            'together, in an order in which the ones '
+                            'annotated so far are always a stratified '
+                            'random sample (see sampling.py).')
+    parser.add_argument('--sample_seed', type=int, default=0,
+                        help='The seed of the --stratified order.')
+
+
+def _no_expect(source_no, num_articles):
+    pass
+
+
+def articles_in_order(sources, skips, expect=_no_expect):
+    """
+    Yields (source_no, article_id, article_data, text) for the articles of
+    the sources, one source after the other. skips[source_no] is the skip
+    function of each source. expect(source_no, num_articles) is called
+    with how many articles each source has (to go), once we know (see
+    AnnotationProgress.expect); here, from article_count up front, if the
+    source has it, and once we've read all of them.
+    """
+    for source_no, source in enumerate(sources):
+        num_articles = _article_count(source, skips[source_no])
+        if num_articles is not None:
+            expect(source_no, num_articles)
+        num_articles = 0
+        for art_id, art_data, text in source.articles(skips[source_no]):
+            num_articles += 1
+            yield source_no, art_id, art_data, text
+        expect(source_no, num_articles)
+
+
+def _article_count(source, skip):
+    """
+    How many articles the source will yield, or None if we can't tell
+    without reading them.
+    """
+    if hasattr(source, 'article_count'):
+        return source.article_count(skip)
+    return None
+
+
+def articles_longest_first(sources, skips, expect=_no_expect):
+    """
+    Like articles_in_order, but yields the articles of all the sources
+    together, longest first. The workers take the next article whenever they
+    are free, so with the long articles out of the way first, the ones left
+    at the end are short, and the servers all run out of work at about the
+    same time (rather than one of them grinding through a long article, or a
+    big month, while the others sit idle).
+
+    The articles of sources that can tell how long their articles are
+    (article_lengths) are only read when their turn comes; the others are all
+    read in up front. Some of the former only turn out not to be annotated
+    when they're read (like the NYT articles that aren't on the front page,
+    without the index), so unless they can also tell how many articles they
+    have (article_count), we only know that at the end.
+    """
+    tasks = []
+    counted = set()
+    for source_no, source in enumerate(sources):
+        lengths = None
+        if hasattr(source, 'article_lengths'):
+            lengths = source.article_lengths(skips[source_no])
+        if lengths is not None:
+            tasks.extend((length, source_no, art_id, None)
+                         for art_id, length in lengths)
+            if _article_count(source, skips[source_no]) is not None:
+                counted.add(source_no)
+            continue
+        for art_id, art_data, text in source.articles(skips[source_no]):
+            tasks.append((len(text), source_no, art_id, (art_data, text)))
+        counted.add(source_no)
+    tasks.sort(key=lambda task: task[0], reverse=True)
+    print time.ctime(), 'Scheduled {} articles, longest first'.format(
+        len(tasks))
+    _expect_tasks(sources, [task[1] for task in tasks], expect, counted)
+
+    num_articles = collections.Counter()
+    for i in xrange(len(tasks)):
+        _, source_no, art_id, article = tasks[i]
+        # So that we don't hold on to the articles we've sent off.
+        tasks[i] = None
+        if article is None:
+            article = sources[source_no].load_article(art_id)
+            if article is None:
+                continue
+        art_data, text = article
+        num_articles[source_no] += 1
+        yield source_no, art_id, art_data, text
+    for source_no in xrange(len(sources)):
+        expect(source_no, num_articles[source_no])
+
+
+def _expect_tasks(sources, source_nos, expect, counted=None):
+    """
+    Calls expect with how many of the articles scheduled (with the sources
+    they're from in source_nos) each source has; only for the sources in
+    counted, if it's given.
+    """
+    counts = collections.Counter(source_nos)
+    for source_no in xrange(len(sources)):
+        if counted is None or source_no in counted:
+            expect(source_no, counts[source_no])
+
+
+def articles_stratified(sources, skips, seed=0, expect=_no_expect):
+    """
+    Like articles_in_order, but yields the articles of all the sources
+    together, in an order in which the ones yielded so far are always
+    (about) a proportional stratified random sample of all of them (see
+    sampling.stratified_order), so that we can estimate from them before
+    the whole corpus is annotated. How many articles each stratum of a
+    source has (including those that are skipped) goes into its strata
+    file, for the estimates.
+
+    The articles of sources that can tell the strata of their articles
+    (article_strata) are only read when their turn comes; for the others,
+    all the articles are read in up front (and those that are skipped
+    dropped again).
+
+    A shard taken over from another node (a NodeShard, see coordination.py)
+    skips the articles the other nodes have done, but its strata still
+    count all of them, so that every node's strata file is the same.
+    """
+    tasks = []
+    for source_no, source in enumerate(sources):
+        done_elsewhere = getattr(source, 'done_elsewhere', set())
+
+        def skip(art_id, skip=skips[source_no],
+                 done_elsewhere=done_elsewhere):
+            return art_id in done_elsewhere or skip(art_id)
+
+        strata = {}
+        article_strata = None
+        if hasattr(source, 'article_strata'):
+            article_strata = source.article_strata()
+        if article_strata is not None:
+            for art_id, stratum in article_strata:
+                strata[stratum] = strata.get(stratum, 0) + 1
+                if not skip(art_id):
+                    tasks.append((stratum, (source_no, art_id, None)))
+        else:
+            # If an article is there more than once, the last one wins (and
+            # it's only counted once).
+            articles = collections.OrderedDict()
+            for art_id, art_data, text in getattr(
+                    source, 'source', source).articles(lambda art_id: False):
+                stratum = u''
+                if hasattr(source, 'stratum'):
+                    stratum = source.stratum(art_id, art_data)
+                articles[art_id] = (stratum, (art_data, text))
+            for art_id, (stratum, article) in articles.iteritems():
+                strata[stratum] = strata.get(stratum, 0) + 1
+                if not skip(art_id):
+                    tasks.append((stratum, (source_no, art_id, article)))
+            del articles
+        save_strata(source.output_filename(), strata)
+    tasks.sort(key=lambda task: task[1][:2])
+    tasks = stratified_order(tasks, seed)
+    print time.ctime(), 'Scheduled {} articles, stratified'.format(
+        len(tasks))
+    _expect_tasks(sources, [task[0] for task in tasks], expect)
+
+    for i in xrange(len(tasks)):
+        source_no, art_id, article = tasks[i]
+        tasks[i] = None
+        if article is None:
+            article = sources[source_no].load_article(art_id)
+            if article is None:
+                continue
+        art_data, text = article
+        yield source_no, art_id, art_data, text
+
+
+def annotate_sources(sources, args, client, dedup=None, progress=None):
+    """
+    Annotates every article of the sources that isn't in their annotation
+    TSV yet, with client, as set up by args (see add_annotation_arguments).
+    With args.longest_first, the articles of all the sources are annotated
+    together, longest first (see articles_longest_first), and with
+    args.stratified, as a growing stratified sample (see
+    articles_stratified); otherwise, one source after the other. If a
+    Deduplicator is given, the articles it finds to be duplicates aren't
+    annotated, but written with a pointer to their canonical article once
+    that is written (see dedup.py). The articles are recorded in progress (an
+    AnnotationProgress), if it's given, with each source as a shard.
+    """
+    if progress is None:
+        progress = AnnotationProgress(client)
+    shards = [get_shard_name(source) for source in sources]
+    for shard in shards:
+        progress.add_shard(shard)
+
+    def expect(source_no, num_articles):
+        progress.expect(shards[source_no], num_articles)
+
+    outputs = []
+    journals = []
+    skips = []
+    for source in sources:
+        out_fn = source.output_filename()
+
+        shard_bytes = None
+        if args.shard_mb > 0:
+            shard_bytes = int(args.shard_mb * (1 << 20))
+        output = AnnotationOutput(out_fn, codec=args.codec,
+                                  shard_bytes=shard_bytes)
+        outputs.append(output)
+
+        # This is for cases where the annotation gets interrupted,
+        # so that we can resume without repeating any work.
+        loaded_article_ids = output.load()
+        if len(loaded_article_ids) > 0:
+            print 'Loaded data with {} articles from {}'.format(
+                len(loaded_article_ids), out_fn)
+
+        # Articles that we couldn't annotate go here instead of the TSV.
+        # Unless we're asked to retry them, we skip them.
+        journal = FailureJournal(get_failure_journal_path(out_fn))
+        journals.append(journal)
+        failed_article_ids = set(journal.load())
+
+        def skip(art_id, loaded_article_ids=loaded_article_ids,
+                 failed_article_ids=failed_article_ids):
+            return (art_id in loaded_article_ids or
+                    (art_id in failed_article_ids) != args.retry_failed)
+        skips.append(skip)
+
+    # Article data (and the length of the text) for the articles that have
+    # been sent off for annotation, but whose annotation hasn't come back
+    # yet. They are sent off as (source_no, article_id), so that we know
+    # which TSV they go to.
+    pending_art_data = {}
+    # What we've already sent off (or found to be a duplicate) in this run,
+    # in case a source has an article more than once.
+    seen = set()
+
+    # Duplicates found by the thread reading the articles, for this thread
+    # to write.
+    duplicates = collections.deque()
+    # Duplicates of canonical articles that are still being annotated, by
+    # the id of their canonical article, which they wait for.
+    waiting_duplicates = collections.defaultdict(list)
+    # Canonical articles that couldn't be annotated.
+    failed_canonical_ids = set()
+
+    def articles_to_annotate():
+        if args.longest_first:
+            articles = articles_longest_first(sources, skips, expect)
+        elif args.stratified:
+            articles = articles_stratified(sources, skips, args.sample_seed,
+                                           expect)
+        else:
+            articles = articles_in_order(sources, skips, expect)
+        for source_no, art_id, art_data, text in articles:
+            if (source_no, art_id) in seen:
+                print 'Skipping {}, which we already have'.format(art_id)
+                progress.record(shards[source_no], 0, duplicate=True)
+                continue
+            seen.add((source_no, art_id))
+            if dedup is not None:
+                canonical_id = dedup.check(art_id, text)
+                if canonical_id == art_id:
+                    # We've already got this very article (e.g. the same
+                    # URL twice).
+                    progress.record(shards[source_no], 0, duplicate=True)
+                    continue
+                if canonical_id is not None:
+                    duplicates.append((source_no, art_id, art_data,
+                                       len(text), canonical_id))
+                    continue
+            pending_art_data[(source_no, art_id)] = (art_data, len(text))
+            yield (source_no, art_id), text
+
+    def write_duplicate(source_no, art_id, art_data, num_chars,
+                        canonical_id):
+        art_data[DUPLICATE_KEY] = canonical_id
+        outputs[source_no].write('{}\t{}\t{}\n'.format(
+            art_id, json.dumps(art_data), json.dumps(None)))
+        progress.record(shards[source_no], num_chars, duplicate=True)
+
+    def fail_duplicate(source_no, art_id, art_data, num_chars, canonical_id):
+        # So that it's annotated with --retry_failed, along with its
+        # canonical article.
+        error = 'Duplicate of {}, which could not be annotated'.format(
+            canonical_id)
+        print 'Could not annotate {}: {}'.format(art_id, error)
+        journals[source_no].record(art_id, error)
+        progress.record(shards[source_no], num_chars, failed=True)
+
+    def write_duplicates():
+        """
+        Writes the duplicates found so far whose canonical article has been
+        written (or was already there), and returns how many.
+        """
+        num_duplicates = 0
+        while len(duplicates) > 0:
+            duplicate = duplicates.popleft()
+            canonical_id = duplicate[-1]
+            if canonical_id in failed_canonical_ids:
+                fail_duplicate(*duplicate)
+            elif dedup.is_pending(canonical_id):
+                waiting_duplicates[canonical_id].append(duplicate)
+            else:
+                write_duplicate(*duplicate)
+                num_duplicates += 1
+        return num_duplicates
+
+    # The annotations come back (in whatever order they finish in) to this
+    # thread, which is the only one that writes to the TSVs.
+    num_done = 0
+    num_written = 0
+    num_duplicates = 0
+    try:
+        for (source_no, art_id), ann, error in annotate_corenlp_many(
+                articles_to_annotate(),
+                annotators=PIPELINE_ANNOTATORS,
+                output_format='protobuf' if args.protobuf else 'json',
+                client=client, max_in_flight=args.max_in_flight,
+                use_cache=args.cache, max_chunk_chars=args.chunk_chars,
+                retries=args.retries, backoff=args.backoff,
+                batch_chars=args.batch_chars):
+            num_done += 1
+            if args.metrics_file and num_done % METRICS_EVERY == 0:
+                get_telemetry().dump(args.metrics_file)
+            num_duplicates += write_duplicates()
+
+            art_data, num_chars = pending_art_data.pop((source_no, art_id))
+            if error is not None:
+                print 'Could not annotate {}: {}'.format(art_id, error)
+                journals[source_no].record(art_id, error)
+                progress.record(shards[source_no], num_chars, failed=True)
+                if dedup is not None:
+                    dedup.discard(art_id)
+                    failed_canonical_ids.add(art_id)
+                    for duplicate in waiting_duplicates.pop(art_id, []):
+                        fail_duplicate(*duplicate)
+                continue
+
+            outputs[source_no].write('{}\t{}\t{}\n'.format(
+                art_id, json.dumps(art_data), json.dumps(ann)))
+            progress.record(shards[source_no], num_chars)
+            if dedup is not None:
+                dedup.confirm(art_id)
+                for duplicate in waiting_duplicates.pop(art_id, []):
+                    write_duplicate(*duplicate)
+                    num_duplicates += 1
+            num_written += 1
+            if num_written % PRINT_EVERY == 0:
+                print 'Article no {} at {}: {}'.format(
+                    num_written, time.ctime(), progress.format_line())
+        num_duplicates += write_duplicates()
+    finally:
+        # This writes out whatever is still buffered, even if we were
+        # interrupted.
+        for output in outputs:
+            output.close()
+    if num_duplicates > 0:
+        print 'Wrote {} duplicates without annotating them'.format(
+            num_duplicates)
+
+
+def annotate_corpus(sources, args):
+    """
+    Annotates the sources as set up by args: on our own (see
+    annotate_sources), or, with args.lease_dir, together with the other
+    nodes that use that lease folder, one source at a time (see
+    coordination.py).
+    """
+    if args.start_servers:
+        fleet = CoreNLPFleet(args.port, heap=args.server_heap,
+                             annotators=PIPELINE_ANNOTATORS)
+        fleet.start()
+        atexit.register(fleet.stop)
+
+    client = CoreNLPDispatcher(args.port, timeout=args.timeout)
+
+    progress = AnnotationProgress(client)
+    if args.status_file:
+        progress.start(args.status_file, args.status_seconds)
+
+    dedup = None
+    if args.dedup:
+        dedup = Deduplicator(args.dedup_index,
+                             threshold=args.dedup_threshold)
+        dedup.load()
+
+    try:
+        if args.lease_dir is None:
+            annotate_sources(sources, args, client, dedup, progress)
+        else:
+            directory = LeaseDirectory(args.lease_dir, node=args.node,
+                                       lease_seconds=args.lease_seconds)
+            annotate_shards(sources, directory,
+                            lambda shard: annotate_sources([shard], args,
+                                                           client, dedup,
+                                                           progress))
+    finally:
+        if dedup is not None:
+            dedup.close()
+        progress.stop()
+
+    print get_telemetry().format_summary()
+    if args.metrics_file:
+        get_telemetry().dump(args.metrics_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Annotate a corpus with CoreNLP')
+    subparsers = parser.add_subparsers(dest='source',
+                                       help='Which corpus to annotate?')
+    for name, source_class in sorted(SOURCES.iteritems()):
+        source_parser = subparsers.add_parser(name)
+        source_class.add_arguments(source_parser)
+        add_annotation_arguments(source_parser)
+    args = parser.parse_args()
+
+    annotate_corpus(SOURCES[args.source].from_args(args), args)
@@ -0,0 +1,673 @@
+"""
+Reading and writing the files that the annotation drivers produce.
+
+The annotations of a source (e.g. nyt_annotated_1990_1.tsv) can be in the
+TSV itself, compressed (nyt_annotated_1990_1.tsv.gz), and/or split into
+shards (nyt_annotated_1990_1-00000.tsv.gz, nyt_annotated_1990_1-00001.tsv.gz,
+...); AnnotationOutput writes them, and iter_annotation_lines reads them back,
+whichever way they were written. A compressed file is a series of gzip
+members (or bz2 streams), one per batch of lines written, so it can be read
+with zcat and the like too.
+"""
+import bz2
+import json
+import os
+import re
+import tempfile
+import time
+import zlib
+
+
+CODECS = ['none', 'gzip', 'bz2']
+_CODEC_EXTENSIONS = {'none': '', 'gzip': '.gz', 'bz2': '.bz2'}
+
+# Fed to a decompressor after the data, to find out if the data was a whole
+# member: if it was, this is left over, rather than taken as more of it.
+_SENTINEL = '\xff'
+
+
+def _get_umask():
+    # The only way to read the umask is to set it.
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+_UMASK = _get_umask()
+
+
+def set_default_permissions(path):
+    """
+    Gives path the permissions that open() would have given a new file.
+    Files from mkstemp are only readable by us, which would keep others
+    that share the folder (other users on the shared filesystem) out.
+    """
+    os.chmod(path, 0o666 & ~_UMASK)
+
+
+def _compress(data, codec):
+    """
+    Compresses data into one whole gzip member or bz2 stream.
+    """
+    if codec == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    else:
+        compressor = bz2.BZ2Compressor(9)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompressor(codec):
+    if codec == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    return bz2.BZ2Decompressor()
+
+
+def _is_whole(decompressor):
+    """
+    Whether the data fed to decompressor so far ended its member.
+    """
+    try:
+        decompressor.decompress(_SENTINEL)
+    except EOFError:
+        # bz2 decompressors don't take anything after their stream.
+        return True
+    except (zlib.error, IOError):
+        return False
+    return decompressor.unused_data.endswith(_SENTINEL)
+
+
+def _split_lines(partial, data):
+    """
+    Returns the whole lines of what's in partial (a list of the pieces of a
+    line we haven't seen the end of) followed by data, and leaves the rest
+    in partial.
+    """
+    end = data.rfind('\n')
+    if end == -1:
+        partial.append(data)
+        return []
+    partial.append(data[:end + 1])
+    text = ''.join(partial)
+    del partial[:]
+    if end + 1 < len(data):
+        partial.append(data[end + 1:])
+    return [line + '\n' for line in text.split('\n')[:-1]]
+
+
+def iter_member_lines(path, codec, start=0, chunk_size=1 << 20):
+    """
+    Reads the compressed file at path from byte start onwards, chunk_size
+    bytes at a time, and yields (offset, length, lines) as it goes: lines
+    are the whole lines decompressed since the last time, from the member
+    that starts at offset, and length is None, except at the end of the
+    member, where it's the member's length. So we only ever hold a chunk
+    and a line in memory, even for a file gzipped by hand as one member.
+
+    A line that runs on from the end of a member into the next counts as
+    the next one's. Stops at the first member that was cut off (or is
+    corrupt), after yielding the whole lines we got out of it.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        offset = start
+        decompressor = _decompressor(codec)
+        partial = []
+        consumed = 0
+        chunk = f.read(chunk_size)
+        while len(chunk) > 0:
+            try:
+                lines = _split_lines(partial, decompressor.decompress(chunk))
+                unused = decompressor.unused_data
+            except EOFError:
+                # A bz2 member that ended right at the end of the last chunk.
+                lines, unused = [], chunk
+            except (zlib.error, IOError):
+                return
+            if len(unused) == 0:
+                consumed += len(chunk)
+                if len(lines) > 0:
+                    yield offset, None, lines
+                chunk = f.read(chunk_size)
+                continue
+
+            consumed += len(chunk) - len(unused)
+            yield offset, consumed, lines
+            offset += consumed
+            decompressor = _decompressor(codec)
+            consumed = 0
+            chunk = unused
+
+        if consumed > 0 and _is_whole(decompressor):
+            yield offset, consumed, []
+
+
+def iter_members(path, codec, start=0, chunk_size=1 << 20):
+    """
+    Yields (offset, length) for every whole member of the compressed file at
+    path from byte start onwards. Stops at the first member that was cut off
+    (or is corrupt).
+    """
+    for offset, length, _ in iter_member_lines(path, codec, start,
+                                               chunk_size):
+        if length is not None:
+            yield offset, length
+
+
+def read_member(path, codec, offset, length):
+    """
+    Returns what the member of the compressed file at path that starts at
+    offset and is length bytes long decompresses to.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return _decompressor(codec).decompress(f.read(length))
+
+
+def _codec_of(path):
+    for codec, extension in _CODEC_EXTENSIONS.iteritems():
+        if extension and path.endswith(extension):
+            return codec
+    return 'none'
+
+
+def get_shard_path(out_fn, shard_no, codec):
+    """
+    Shard 3 of nyt_annotated_1990_1.tsv, with gzip, is
+    nyt_annotated_1990_1-00003.tsv.gz, in the same folder.
+    """
+    stem, ext = os.path.splitext(out_fn)
+    return '{}-{}{}{}'.format(stem, str(shard_no).zfill(5), ext,
+                              _CODEC_EXTENSIONS[codec])
+
+
+def _annotation_files(out_fn):
+    """
+    Returns (shard_no, path, codec) for every file that has annotations of
+    out_fn, with shard_no None for those that aren't shards, in the order
+    they were written.
+    """
+    folder, filename = os.path.split(out_fn)
+    stem, ext = os.path.splitext(filename)
+    pattern = re.compile(r'^{}(?:-(\d{{5}}))?{}(\.gz|\.bz2)?$'.format(
+        re.escape(stem), re.escape(ext)))
+    try:
+        filenames = os.listdir(folder or '.')
+    except OSError:
+        return []
+    files = []
+    for f in filenames:
+        match = pattern.match(f)
+        if match is None:
+            continue
+        shard_no = int(match.group(1)) if match.group(1) else None
+        files.append((shard_no, os.path.join(folder, f), _codec_of(f)))
+    # None sorts before numbers, so the unsharded files come first.
+    return sorted(files)
+
+
+def get_annotation_paths(out_fn):
+    """
+    Returns (path, codec) for every file that has annotations of out_fn:
+    out_fn itself, compressed, and its shards.
+    """
+    return [(path, codec) for _, path, codec in _annotation_files(out_fn)]
+
+
+def iter_annotation_lines(out_fn):
+    """
+    Yields every (whole) line of annotations of out_fn, from all of its
+    files, decompressing them as we go. Raises IOError if there are none.
+    """
+    paths = get_annotation_paths(out_fn)
+    if len(paths) == 0:
+        raise IOError('No annotations for {}'.format(out_fn))
+    for path, codec in paths:
+        if codec == 'none':
+            with open(path, 'r') as f:
+                for line in f:
+                    # A line cut off by a crash.
+                    if line.endswith('\n'):
+                        yield line
+            continue
+        for _, _, lines in iter_member_lines(path, codec):
+            for line in lines:
+                yield line
+
+
+def read_annotation_ids(out_fn):
+    """
+    Returns the ids of the articles in the manifests of all the files of
+    out_fn, without repairing them (for files that someone else writes).
+    """
+    ids = set()
+    for path, codec in get_annotation_paths(out_fn):
+        ids.update(ResumeManifest(get_manifest_path(path), path,
+                                  codec).read_ids())
+    return ids
+
+
+def get_failure_journal_path(out_fn):
+    """
+    The failure journal of nyt_annotated_1990_1.tsv is
+    nyt_annotated_1990_1_failures.jsonl, in the same folder.
+    """
+    return '{}_failures.jsonl'.format(os.path.splitext(out_fn)[0])
+
+
+class FailureJournal(object):
+    """
+    The articles we couldn't annotate, which we keep out of the annotation
+    TSV. It is a file with one JSON object per line:
+    {"id": ..., "reason": ..., "time": ...}
+    An article that failed on several runs has several lines.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def record(self, art_id, reason):
+        with open(self.path, 'a') as f:
+            f.write('{}\n'.format(json.dumps({
+                'id': art_id,
+                'reason': unicode(reason),
+                'time': time.ctime()
+            })))
+
+    def load(self):
+        """
+        Returns a dict from the id of every failed article to the reason it
+        last failed.
+        """
+        failures = {}
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    failures[entry['id']] = entry['reason']
+        except IOError:
+            # No journal means nothing has failed yet.
+            pass
+        return failures
+
+
+def get_manifest_path(out_fn):
+    """
+    The resume manifest of nyt_annotated_1990_1.tsv is
+    nyt_annotated_1990_1.manifest, in the same folder. (It doesn't end with
+    .tsv, so it doesn't get mixed up with the annotation TSVs.) That of a
+    compressed file, like nyt_annotated_1990_1-00000.tsv.gz, is
+    nyt_annotated_1990_1-00000.tsv.gz.manifest.
+    """
+    if _codec_of(out_fn) != 'none':
+        return '{}.manifest'.format(out_fn)
+    return '{}.manifest'.format(os.path.splitext(out_fn)[0])
+
+
+class ResumeManifest(object):
+    """
+    The ids of the articles in an annotation TSV, with where their line
+    starts in it and how long it is, so that we can resume without reading
+    the (gigabytes of) annotations. It is a file with one line per article:
+    id <tab> offset <tab> length
+
+    Each line is written with a single write, and a line that was cut off
+    (because we crashed while writing it) is ignored. If the TSV has lines
+    the manifest doesn't know about (because we crashed between writing the
+    article and writing the manifest), they are added when the manifest is
+    loaded; if there is no manifest, it is made from the TSV.
+
+    If the TSV is compressed with codec, the offset and length are those of
+    the member that the article's line is in.
+    """
+
+    def __init__(self, path, tsv_path, codec='none'):
+        self.path = path
+        self.tsv_path = tsv_path
+        self.codec = codec
+        self._f = None
+
+    def _read(self):
+        """
+        Returns the entries in the manifest, where the last of them ends in
+        the TSV, and whether every line of the manifest was whole.
+        """
+        entries = {}
+        end = 0
+        with open(self.path, 'r') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    return entries, end, False
+                art_id, offset, length = line.rstrip('\n').split('\t')
+                offset, length = int(offset), int(length)
+                entries[art_id] = (offset, length)
+                end = max(end, offset + length)
+        return entries, end, True
+
+    def _scan_tsv(self, start):
+        """
+        Returns the entries for the (whole) lines of the TSV from byte start
+        onwards.
+        """
+        entries = []
+        if self.codec != 'none':
+            # The ids of the member we're in, until we know where it ends.
+            member_ids = []
+            for offset, length, lines in iter_member_lines(
+                    self.tsv_path, self.codec, start):
+                member_ids.extend(line[:line.index('\t')] for line in lines)
+                if length is not None:
+                    entries.extend((art_id, offset, length)
+                                   for art_id in member_ids)
+                    member_ids = []
+            return entries
+
+        with open(self.tsv_path, 'r') as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                entries.append((line[:line.index('\t')], offset, len(line)))
+                offset += len(line)
+        return entries
+
+    def _write_all(self, entries):
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path)))
+        with os.fdopen(fd, 'w') as f:
+            for art_id, (offset, length) in sorted(entries.iteritems(),
+                                                   key=lambda e: e[1][0]):
+                f.write('{}\t{}\t{}\n'.format(art_id, offset, length))
+        set_default_permissions(tmp_path)
+        os.rename(tmp_path, self.path)
+
+    def load(self):
+        """
+        Returns a dict from the id of every article in the TSV to the
+        (offset, length) of its line, repairing the manifest if it needs to.
+        """
+        try:
+            tsv_size = os.path.getsize(self.tsv_path)
+        except OSError:
+            # Nothing has been written yet.
+            return {}
+
+        try:
+            entries, end, whole = self._read()
+        except IOError:
+            entries, end, whole = None, 0, False
+
+        if whole and end == tsv_size:
+            return entries
+
+        if entries is None or end > tsv_size:
+            # No manifest, or one for a different TSV: start over.
+            if tsv_size > 0:
+                print 'Rebuilding the resume manifest from {}'.format(
+                    self.tsv_path)
+            entries, end = {}, 0
+        for art_id, offset, length in self._scan_tsv(end):
+            entries[art_id] = (offset, length)
+        self._write_all(entries)
+        return entries
+
+    def end(self):
+        """
+        Where the last line in the manifest ends in the TSV (0 if there is
+        no manifest).
+        """
+        try:
+            _, end, _ = self._read()
+        except IOError:
+            return 0
+        return end
+
+    def read_ids(self):
+        """
+        Returns the ids of the articles in the manifest as it is, without
+        repairing it (for the manifest of a TSV that someone else writes).
+        """
+        try:
+            entries, _, _ = self._read()
+        except IOError:
+            return set()
+        return set(entries)
+
+    def record(self, art_id, offset, length):
+        """
+        Adds a line of the TSV to the manifest. Call load first, so that the
+        manifest is up to date with the TSV before we add to it.
+        """
+        if self._f is None:
+            self._f = open(self.path, 'a')
+        self._f.write('{}\t{}\t{}\n'.format(art_id, offset, length))
+        self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def _truncate_partial_line(path):
+    """
+    If the file at path doesn't end with a newline (because we crashed
+    while writing its last line), cuts that last line off.
+    """
+    with open(path, 'r+b') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        pos = end
+        while pos > 0:
+            block_start = max(0, pos - 65536)
+            f.seek(block_start)
+            block = f.read(pos - block_start)
+            newline = block.rfind('\n')
+            if newline >= 0:
+                pos = block_start + newline + 1
+                break
+            pos = block_start
+        if pos < end:
+            print 'Cutting off a partial last line of {}'.format(path)
+            f.truncate(pos)
+
+
+def _truncate_partial_member(path, codec, start=0):
+    """
+    Like _truncate_partial_line, for a compressed file: cuts off a member
+    at its end that was cut off. start is where a member is known to start
+    (e.g. the end of what the manifest has), to save decompressing the
+    whole file.
+    """
+    size = os.path.getsize(path)
+    if start > size:
+        start = 0
+    end = start
+    for offset, length in iter_members(path, codec, start):
+        end = offset + length
+    if end == start and start > 0 and start < size:
+        # What we were told doesn't look like the start of a member after
+        # all, so we go through the whole file.
+        return _truncate_partial_member(path, codec)
+    if end < size:
+        print 'Cutting off a partial last block of {}'.format(path)
+        with open(path, 'r+b') as f:
+            f.truncate(end)
+
+
+class TSVWriter(object):
+    """
+    Appends lines to a file that stays open, writing them out in batches:
+    when flush_bytes of them have piled up, on the first write once it's
+    been flush_seconds since the last flush, and when the writer is closed.
+    Each flush is fsynced (unless fsync is False). There's no timer, so
+    lines written just before a lull only go out with the next write (or
+    flush, or close).
+
+    Only whole lines are ever written, and a cut-off last line left by a
+    crash in an earlier run is removed when the file is opened, so the file
+    never has partial lines. If a ResumeManifest is given, every line is
+    recorded in it once it is safely on disk.
+
+    With a codec other than 'none', each batch of lines is written as one
+    compressed member (and cut-off members are removed on opening).
+
+    Can be used as a context manager:
+
+    with TSVWriter(out_fn) as writer:
+        writer.write('a\tb\n')
+    """
+
+    def __init__(self, path, truncate=False, flush_bytes=1 << 20,
+                 flush_seconds=10., fsync=True, manifest=None, codec='none'):
+        if codec not in CODECS:
+            raise ValueError('Unknown codec: {}'.format(codec))
+        self.path = path
+        self.flush_bytes = flush_bytes
+        self.flush_seconds = flush_seconds
+        self.fsync = fsync
+        self.manifest = manifest
+        self.codec = codec
+
+        if not truncate and os.path.exists(path):
+            if codec == 'none':
+                _truncate_partial_line(path)
+            else:
+                _truncate_partial_member(
+                    path, codec, manifest.end() if manifest else 0)
+        self._f = open(path, 'wb' if truncate else 'ab')
+        self._f.seek(0, os.SEEK_END)
+        # How big the file is, not counting what is still to be written.
+        self.size = self._f.tell()
+        self._pending = []
+        self._pending_bytes = 0
+        self._last_flush = time.time()
+
+    def write(self, line):
+        """
+        Queues up line (a str ending with a newline) to be written.
+        """
+        if not line.endswith('\n'):
+            raise ValueError('Lines need to end with a newline')
+        self._pending.append(line)
+        self._pending_bytes += len(line)
+        if (self._pending_bytes >= self.flush_bytes or
+                time.time() - self._last_flush >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.time()
+        if len(self._pending) == 0:
+            return
+        data = ''.join(self._pending)
+        if self.codec != 'none':
+            data = _compress(data, self.codec)
+        self._f.write(data)
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+
+        if self.manifest is not None:
+            offset = self.size
+            for line in self._pending:
+                if self.codec == 'none':
+                    self.manifest.record(line[:line.find('\t')], offset,
+                                         len(line))
+                    offset += len(line)
+                else:
+                    self.manifest.record(line[:line.find('\t')], self.size,
+                                         len(data))
+        self.size += len(data)
+        self._pending = []
+        self._pending_bytes = 0
+
+    def close(self):
+        if self._f is None:
+            return
+        self.flush()
+        self._f.close()
+        self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AnnotationOutput(object):
+    """
+    Where the annotation lines of a source go. With codec 'none' and no
+    shard_bytes, that's out_fn itself; with a codec, it's out_fn compressed
+    (e.g. nyt_annotated_1990_1.tsv.gz), and with shard_bytes, it's shards of
+    about that many bytes (on disk) each (nyt_annotated_1990_1-00000.tsv.gz,
+    ...). Every file has its own ResumeManifest. writer_args are passed on
+    to the TSVWriter.
+
+    Call load before writing.
+    """
+
+    def __init__(self, out_fn, codec='none', shard_bytes=None,
+                 **writer_args):
+        if codec not in CODECS:
+            raise ValueError('Unknown codec: {}'.format(codec))
+        self.out_fn = out_fn
+        self.codec = codec
+        self.shard_bytes = shard_bytes
+        self.writer_args = writer_args
+        self._shard_no = None
+        self._writer = None
+        self._manifest = None
+
+    def _open(self, shard_no):
+        if shard_no is None:
+            path = '{}{}'.format(self.out_fn, _CODEC_EXTENSIONS[self.codec])
+        else:
+            path = get_shard_path(self.out_fn, shard_no, self.codec)
+        self._shard_no = shard_no
+        self._manifest = ResumeManifest(get_manifest_path(path), path,
+                                        self.codec)
+        self._writer = TSVWriter(path, manifest=self._manifest,
+                                 codec=self.codec, **self.writer_args)
+
+    def load(self):
+        """
+        Opens the file we write to, and returns a dict from the id of every
+        article in the files of out_fn (however they were written) to the
+        (offset, length) of its line (or member) in its file.
+        """
+        shard_no = None
+        if self.shard_bytes is not None:
+            shards = [(n, path, codec)
+                      for n, path, codec in _annotation_files(self.out_fn)
+                      if n is not None]
+            if len(shards) == 0:
+                shard_no = 0
+            else:
+                # We add to the last shard, if it's ours and has room.
+                shard_no, path, codec = shards[-1]
+                if (codec != self.codec or
+                        os.path.getsize(path) >= self.shard_bytes):
+                    shard_no += 1
+        self._open(shard_no)
+
+        loaded = {}
+        for path, codec in get_annotation_paths(self.out_fn):
+            if path == self._writer.path:
+                loaded.update(self._manifest.load())
+            else:
+                loaded.update(ResumeManifest(get_manifest_path(path), path,
+                                             codec).load())
+        return loaded
+
+    def write(self, line):
+        self._writer.write(line)
+        if (self.shard_bytes is not None and
+                self._writer.size >= self.shard_bytes):
+            self.close()
+            self._open(self._shard_no + 1)
+            self._manifest.load()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._manifest.close()
@@ -0,0 +1,459 @@
+"""
+Sharing the annotation of a corpus between several machines, through lease
+files in a folder they can all see (on the shared filesystem), and nothing
+else.
+
+Every source (e.g. a month of the NYT) is a shard. A node claims a shard by
+creating its lease file, keeps it by renewing (touching) it while it works,
+and marks the shard done when it's finished. A lease that hasn't been renewed
+for lease_seconds belongs to a node that died (or hung), and the next node
+that looks takes it over. Nodes can come and go at any time.
+
+Each node writes its annotations to its own TSV (nyt_annotated_1990_1.tsv is
+annotated into nyt_annotated_1990_1.<node>.tsv), so that a node that only
+seemed to have died can't mix its lines into another node's. A node that
+takes over a shard skips the articles that are already in the other nodes'
+TSVs for it. At worst (two nodes taking over the same lease at the same
+moment), an article gets annotated twice, and the merge keeps one of them.
+
+Once the shards are done, running this script merges the TSVs of each shard
+into its usual annotation TSV.
+
+Nodes need distinct names (their host name by default), their clocks need
+to agree to well within lease_seconds, and the output folder has to be on the
+shared filesystem too.
+
+Usage, on every machine:
+python analysis/annotate_corpus.py nyt 1990 `seq 1 12` --port 9000 9001 \
+    --lease_dir /dfs/scratch0/viswa/leases
+and then, once they're all done:
+python analysis/coordination.py nyt 1990 `seq 1 12` \
+    --lease_dir /dfs/scratch0/viswa/leases
+"""
+import argparse
+import errno
+import json
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+import uuid
+
+from annotation_io import (CODECS, AnnotationOutput, FailureJournal,
+                           get_annotation_paths, get_failure_journal_path,
+                           get_manifest_path, iter_annotation_lines,
+                           read_annotation_ids, set_default_permissions)
+from sampling import get_strata_path, load_strata, save_strata
+from sources import SOURCES
+
+
+DEFAULT_LEASE_SECONDS = 600.
+
+# How long to wait after taking over a lease before checking that no other
+# node took it over at the same time.
+TAKE_OVER_SETTLE_SECONDS = 5.
+
+
+def get_node_name():
+    return socket.gethostname()
+
+
+def get_shard_name(source):
+    """
+    A shard is named after its annotation TSV, e.g. nyt_annotated_1990_1.
+    """
+    return os.path.splitext(os.path.basename(source.output_filename()))[0]
+
+
+def get_node_output_path(out_fn, node):
+    """
+    The TSV that node annotates out_fn into: nyt_annotated_1990_1.tsv is
+    annotated into nyt_annotated_1990_1.<node>.tsv, in the same folder.
+    """
+    stem, ext = os.path.splitext(out_fn)
+    return '{}.{}{}'.format(stem, node, ext)
+
+
+def get_node_output_paths(out_fn):
+    """
+    The TSVs that nodes annotated out_fn into, whichever nodes they were
+    (and however they were compressed and sharded; see annotation_io.py).
+    """
+    folder, filename = os.path.split(out_fn)
+    stem, ext = os.path.splitext(filename)
+    pattern = re.compile(r'^{}\.(.+?)(?:-\d{{5}})?{}(?:\.gz|\.bz2)?$'.format(
+        re.escape(stem), re.escape(ext)))
+    try:
+        filenames = os.listdir(folder or '.')
+    except OSError:
+        return []
+    nodes = set()
+    for f in filenames:
+        match = pattern.match(f)
+        if match is not None:
+            nodes.add(match.group(1))
+    return sorted(get_node_output_path(out_fn, node) for node in nodes)
+
+
+class LeaseDirectory(object):
+    """
+    The folder of lease files that the nodes share. For every shard, it has
+    shard.lease while a node works on it, and shard.done once it's done.
+    A lease file is JSON: {"node": ..., "token": ..., "claimed": ...}, where
+    the token tells apart the leases that a node took at different times.
+    """
+
+    def __init__(self, path, node=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.path = path
+        self.node = node or get_node_name()
+        self.lease_seconds = lease_seconds
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _lease_path(self, shard):
+        return os.path.join(self.path, '{}.lease'.format(shard))
+
+    def _done_path(self, shard):
+        return os.path.join(self.path, '{}.done'.format(shard))
+
+    def _read_lease(self, shard):
+        """
+        Returns the lease on shard and how many seconds ago it was last
+        renewed, or (None, None) if nobody has it.
+        """
+        path = self._lease_path(shard)
+        try:
+            with open(path, 'r') as f:
+                lease = json.load(f)
+            return lease, time.time() - os.path.getmtime(path)
+        except (IOError, OSError):
+            return None, None
+
+    def _write_lease_file(self, token):
+        """
+        Writes a lease of ours to a temporary file, which is then linked or
+        moved into place, so that a lease file is never seen half written.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'node': self.node, 'token': token,
+                       'claimed': time.ctime()}, f)
+        set_default_permissions(tmp_path)
+        return tmp_path
+
+    def is_done(self, shard):
+        return os.path.exists(self._done_path(shard))
+
+    def claim(self, shard):
+        """
+        Tries to take the lease on shard. Returns the Lease if we got it, and
+        None if the shard is done, or another node (that is still alive) has
+        it. A lease of ours from before we restarted is ours to take back.
+        """
+        if self.is_done(shard):
+            return None
+
+        token = uuid.uuid4().hex
+        tmp_path = self._write_lease_file(token)
+        lease_path = self._lease_path(shard)
+        try:
+            try:
+                # Linking fails if the file is already there, even on NFS,
+                # so only one node can create the lease.
+                os.link(tmp_path, lease_path)
+                return self._claimed(shard, token)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+            lease, age = self._read_lease(shard)
+            if lease is None:
+                # It was just released; we'll try again next time.
+                return None
+            if lease.get('node') != self.node and age < self.lease_seconds:
+                return None
+            previous_node = lease.get('node')
+            os.rename(tmp_path, lease_path)
+            tmp_path = None
+        finally:
+            if tmp_path is not None:
+                os.remove(tmp_path)
+
+        # Another node could have taken it over at the same time as us; the
+        # one that renamed its lease into place last has it.
+        time.sleep(TAKE_OVER_SETTLE_SECONDS)
+        lease, _ = self._read_lease(shard)
+        if lease is None or lease.get('token') != token:
+            return None
+        print time.ctime(), 'Took over the lease on {} from {}'.format(
+            shard, previous_node)
+        return self._claimed(shard, token)
+
+    def _claimed(self, shard, token):
+        lease = Lease(self, shard, token)
+        # It could have been finished while we were claiming it.
+        if self.is_done(shard):
+            lease.release()
+            return None
+        return lease
+
+
+class Lease(object):
+    """
+    Our lease on a shard. Once another node has taken it over (because we
+    didn't renew it in time), lost is True.
+    """
+
+    def __init__(self, directory, shard, token):
+        self.directory = directory
+        self.shard = shard
+        self.token = token
+        self.node = directory.node
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _is_ours(self):
+        lease, _ = self.directory._read_lease(self.shard)
+        return lease is not None and lease.get('token') == self.token
+
+    def renew(self):
+        """
+        Returns False (and sets lost) if the lease isn't ours anymore.
+        """
+        if not self._is_ours():
+            self.lost = True
+            return False
+        os.utime(self.directory._lease_path(self.shard), None)
+        return True
+
+    def keep_renewed(self):
+        """
+        Renews the lease from a background thread, a few times per
+        lease_seconds, until it's released (or lost).
+        """
+        def renew_until_stopped():
+            interval = self.directory.lease_seconds / 4.
+            while not self._stop.wait(interval):
+                try:
+                    if not self.renew():
+                        print time.ctime(), 'Lost the lease on {}'.format(
+                            self.shard)
+                        return
+                except (IOError, OSError) as e:
+                    # The shared filesystem can have hiccups; we try again
+                    # at the next interval.
+                    print 'Could not renew the lease on {}: {}'.format(
+                        self.shard, e)
+
+        self._thread = threading.Thread(target=renew_until_stopped)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def release(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._is_ours():
+            os.remove(self.directory._lease_path(self.shard))
+
+    def done(self):
+        """
+        Marks the shard done, and releases the lease.
+        """
+        with open(self.directory._done_path(self.shard), 'w') as f:
+            json.dump({'node': self.node, 'done': time.ctime()}, f)
+        self.release()
+
+
+class NodeShard(object):
+    """
+    A source as the node holding lease annotates it: its annotations go to
+    the node's own TSV, and the articles in the other nodes' TSVs for it are
+    skipped. Once the lease is lost, no more articles are handed out.
+    """
+
+    def __init__(self, source, lease):
+        self.source = source
+        self.lease = lease
+        self.name = source.name
+        out_fn = source.output_filename()
+        self.node_out_fn = get_node_output_path(out_fn, lease.node)
+
+        self.done_elsewhere = set()
+        for path in get_node_output_paths(out_fn):
+            if path != self.node_out_fn:
+                self.done_elsewhere.update(read_annotation_ids(path))
+
+    def output_filename(self):
+        return self.node_out_fn
+
+    def _skip(self, skip):
+        return lambda art_id: art_id in self.done_elsewhere or skip(art_id)
+
+    def articles(self, skip):
+        for article in self.source.articles(self._skip(skip)):
+            if self.lease.lost:
+                return
+            yield article
+
+    def article_lengths(self, skip):
+        if not hasattr(self.source, 'article_lengths'):
+            return None
+        return self.source.article_lengths(self._skip(skip))
+
+    def load_article(self, art_id):
+        if self.lease.lost:
+            return None
+        return self.source.load_article(art_id)
+
+    def stratum(self, art_id, art_data):
+        if not hasattr(self.source, 'stratum'):
+            return u''
+        return self.source.stratum(art_id, art_data)
+
+    def article_strata(self):
+        if not hasattr(self.source, 'article_strata'):
+            return None
+        return self.source.article_strata()
+
+
+def annotate_shards(sources, directory, annotate, poll_seconds=60.):
+    """
+    Claims the sources (shards) that aren't done yet one at a time, and
+    calls annotate(shard) with the NodeShard of each, until all of them are
+    done. When the ones left are all leased to other nodes, we check on
+    them every poll_seconds, in case one of those nodes dies.
+    """
+    while True:
+        left = [source for source in sources
+                if not directory.is_done(get_shard_name(source))]
+        if len(left) == 0:
+            return
+
+        num_claimed = 0
+        for source in left:
+            shard = get_shard_name(source)
+            lease = directory.claim(shard)
+            if lease is None:
+                continue
+            num_claimed += 1
+            print time.ctime(), 'Annotating {} on {}'.format(shard,
+                                                            directory.node)
+            lease.keep_renewed()
+            try:
+                annotate(NodeShard(source, lease))
+            except BaseException:
+                # Let another node take over right away.
+                lease.release()
+                raise
+            if lease.lost:
+                lease.release()
+            else:
+                lease.done()
+
+        if num_claimed == 0:
+            print time.ctime(), 'Waiting for {} shards on other nodes'.format(
+                len(left))
+            time.sleep(poll_seconds)
+
+
+def merge_node_outputs(out_fn, keep_node_outputs=False, codec='gzip',
+                       shard_bytes=None):
+    """
+    Adds the articles in the per-node TSVs of out_fn to it (leaving out
+    those it has already), the articles that failed on the nodes (and
+    weren't annotated by another) to its failure journal, and the strata of
+    the shard (see sampling.py) to its strata file. Then removes the
+    per-node files, unless keep_node_outputs. codec and shard_bytes are as
+    for AnnotationOutput. Returns how many articles were added.
+    """
+    node_paths = get_node_output_paths(out_fn)
+    output = AnnotationOutput(out_fn, codec=codec, shard_bytes=shard_bytes)
+    merged_ids = set(output.load())
+    num_added = 0
+    try:
+        for path in node_paths:
+            for line in iter_annotation_lines(path):
+                art_id = line[:line.index('\t')]
+                if art_id in merged_ids:
+                    continue
+                merged_ids.add(art_id)
+                output.write(line)
+                num_added += 1
+    finally:
+        output.close()
+
+    journal = FailureJournal(get_failure_journal_path(out_fn))
+    for path in node_paths:
+        failures = FailureJournal(get_failure_journal_path(path)).load()
+        for art_id, reason in sorted(failures.iteritems()):
+            if art_id not in merged_ids:
+                journal.record(art_id, reason)
+
+    # Every node that annotated the shard stratified should have counted
+    # the same strata (see articles_stratified). Nodes that only counted
+    # the articles they had left (before that was fixed) have fewer, so we
+    # take the most of each stratum, rather than whichever node is last.
+    strata = load_strata(out_fn) or {}
+    for path in node_paths:
+        node_strata = load_strata(path) or {}
+        if len(strata) > 0 and len(node_strata) > 0 and \
+                node_strata != strata:
+            print 'The strata of {} differ from the other nodes\'; ' \
+                'taking the most of each'.format(path)
+        for stratum, size in node_strata.iteritems():
+            strata[stratum] = max(size, strata.get(stratum, 0))
+    if len(strata) > 0:
+        save_strata(out_fn, strata)
+
+    if not keep_node_outputs:
+        for path in node_paths:
+            fns = [get_failure_journal_path(path), get_strata_path(path)]
+            for annotation_path, _ in get_annotation_paths(path):
+                fns.extend([annotation_path,
+                            get_manifest_path(annotation_path)])
+            for fn in fns:
+                if os.path.exists(fn):
+                    os.remove(fn)
+    return num_added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Merge the per-node annotation TSVs of finished shards')
+    subparsers = parser.add_subparsers(dest='source',
+                                       help='Which corpus to merge?')
+    for name, source_class in sorted(SOURCES.iteritems()):
+        source_parser = subparsers.add_parser(name)
+        source_class.add_arguments(source_parser)
+        source_parser.add_argument('--lease_dir', required=True)
+        source_parser.add_argument('--force', action='store_true',
+                                   help="Merge shards that aren't done too.")
+        source_parser.add_argument('--keep_node_outputs',
+                                   action='store_true')
+        source_parser.add_argument('--codec', choices=CODECS,
+                                   default='gzip')
+        source_parser.add_argument('--shard_mb', type=float, default=256,
+                                   help='0 means one file per source.')
+    args = parser.parse_args()
+
+    directory = LeaseDirectory(args.lease_dir)
+    for source in SOURCES[args.source].from_args(args):
+        shard = get_shard_name(source)
+        if not directory.is_done(shard) and not args.force:
+            print 'Skipping {}, which is not done yet'.format(shard)
+            continue
+        num_added = merge_node_outputs(
+            source.output_filename(),
+            keep_node_outputs=args.keep_node_outputs, codec=args.codec,
+            shard_bytes=(int(args.shard_mb * (1 << 20))
+                         if args.shard_mb > 0 else None))
+        print time.ctime(), 'Merged {} articles into {}'.format(
+            num_added, source.output_filename())
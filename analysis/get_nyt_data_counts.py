@@ -1,64 +1,126 @@
+"""
+Counts the mentions and quotes of men and women in the annotated NYT
+articles, one TSV of counts per month. With --estimate, it instead prints
+estimates (with 95% confidence intervals) for all the articles of the years,
+from those annotated so far with annotate_corpus.py --stratified (see
+sampling.py).
+
+Usage:
+python get_nyt_data_counts.py 1990 1995
+python get_nyt_data_counts.py 1990 1995 --estimate
+python get_nyt_data_counts.py 1990 1995 \
+    --index_file ../annotated/NYT/nyt_index.npz --front_page
+"""
+import argparse
 import json
 import sys
 import time
 from analysis import get_article_info
+from annotation_io import (TSVWriter, get_annotation_paths,
+                           iter_annotation_lines)
+from dedup import DUPLICATE_KEY
+from nyt_index import NYTIndex
+from sampling import load_strata, stratified_estimate
+from sources import NYTSource
 from utils import get_gender
 
 
-def load_nyt_data(year, month, folder='../annotated/NYT/'):
+def get_nyt_annotation_path(year, month, folder='../annotated/NYT/'):
+    return '{}nyt_annotated_{}_{}.tsv'.format(folder, year, month)
+
+
+def iter_nyt_data(year, month, folder='../annotated/NYT/', ids=None):
+    """
+    Yields (link, data, corenlp) for the annotated articles of the month,
+    one at a time; only those in ids, if it's given (e.g. picked with the
+    NYT index, see nyt_index.py). The annotations can be compressed and
+    sharded (see annotation_io.py).
+    """
+    for line in iter_annotation_lines(get_nyt_annotation_path(year, month,
+                                                              folder)):
+        if ids is not None and line[:line.find('\t')] not in ids:
+            continue
+        link, data, corenlp = line.strip().split('\t')
+        yield link, json.loads(data), json.loads(corenlp)
+
+
+def load_nyt_data(year, month, folder='../annotated/NYT/', ids=None):
+    """
+    Loads the annotated articles of the month (see iter_nyt_data).
+    """
     nyt_data = {}
-    with open('{}nyt_annotated_{}_{}.tsv'.format(
-            folder, year, month), 'r') as nyt_f:
-        for line in nyt_f:
-            link, data, corenlp = line.strip().split('\t')
-            nyt_data[link] = {
-                'data': json.loads(data),
-                'corenlp': json.loads(corenlp)
-            }
+    for link, data, corenlp in iter_nyt_data(year, month, folder, ids):
+        nyt_data[link] = {
+            'data': data,
+            'corenlp': corenlp
+        }
 
     return nyt_data
 
 
 def get_mentions_quotes(nyt_data, out_fn):
 
-    for link, values in nyt_data.iteritems():
-        data = values['data']
-        corenlp = values['corenlp']
-        if not type(corenlp) is dict:  # This happens when CoreNLP timed out
+    with TSVWriter(out_fn) as out_f:
+        _write_mentions_quotes(nyt_data, out_f)
+
+
+def get_article_counts(data, corenlp):
+    """
+    Returns (author_gender, num_distinct_mentions, num_mentions,
+    num_quoted_people, num_quoted_words) for the article, each count a dict
+    with the counts for 'MALE' and 'FEMALE', or None if the article isn't
+    counted.
+    """
+    if not type(corenlp) is dict:  # This happens when CoreNLP timed out
+        return None
+    if DUPLICATE_KEY in data:  # It's counted as its canonical article
+        return None
+    pm, quotes, _, _, _ = get_article_info('', ann=corenlp)
+    num_mentions = {'MALE': 0, 'FEMALE': 0}
+    num_distinct_mentions = {'MALE': 0, 'FEMALE': 0}
+    num_quoted_words = {'MALE': 0, 'FEMALE': 0}
+    num_quoted_people = {'MALE': 0, 'FEMALE': 0}
+    for person, info in pm.iteritems():
+        count = info[0]
+        gender = info[1][0]
+        if not type(gender) is str:
             continue
-        pm, quotes, _, _, _ = get_article_info('', ann=corenlp)
-        num_mentions = {'MALE': 0, 'FEMALE': 0}
-        num_distinct_mentions = {'MALE': 0, 'FEMALE': 0}
-        num_quoted_words = {'MALE': 0, 'FEMALE': 0}
-        num_quoted_people = {'MALE': 0, 'FEMALE': 0}
-        for person, info in pm.iteritems():
-            count = info[0]
-            gender = info[1][0]
-            if not type(gender) is str:
-                continue
-            if gender.lower() not in ['male', 'female']:
-                continue
-            num_mentions[gender.upper()] += count
-            num_distinct_mentions[gender.upper()] += 1
-            if person in quotes:
-                quote_length = len(quotes[person])
-                num_quoted_people[gender.upper()] += int(quote_length > 0)
-                num_quoted_words[gender.upper()] += quote_length
+        if gender.lower() not in ['male', 'female']:
+            continue
+        num_mentions[gender.upper()] += count
+        num_distinct_mentions[gender.upper()] += 1
+        if person in quotes:
+            quote_length = len(quotes[person])
+            num_quoted_people[gender.upper()] += int(quote_length > 0)
+            num_quoted_words[gender.upper()] += quote_length
 
+    author_gender = 'UNKNOWN'
+    if 'print_byline' in data:
+        pb = data['print_byline']
+        if pb.startswith('By'):
+            pb = pb[3:]
+        if len(pb) > 0:
+            author_gender = get_gender(pb)
+    elif 'norm_byline' in data:
+        author_gender = get_gender(
+            data['norm_byline'][data['norm_byline'].find(',') + 1:])
+    if not type(author_gender) is str:
         author_gender = 'UNKNOWN'
-        if 'print_byline' in data:
-            pb = data['print_byline']
-            if pb.startswith('By'):
-                pb = pb[3:]
-            if len(pb) > 0:
-                author_gender = get_gender(pb)
-        elif 'norm_byline' in data:
-            author_gender = get_gender(
-                data['norm_byline'][data['norm_byline'].find(',') + 1:])
-        if not type(author_gender) is str:
-            author_gender = 'UNKNOWN'
-        else:
-            author_gender = author_gender.upper()
+    else:
+        author_gender = author_gender.upper()
+    return (author_gender, num_distinct_mentions, num_mentions,
+            num_quoted_people, num_quoted_words)
+
+
+def _write_mentions_quotes(nyt_data, out_f):
+
+    for link, values in nyt_data.iteritems():
+        data = values['data']
+        counts = get_article_counts(data, values['corenlp'])
+        if counts is None:
+            continue
+        (author_gender, num_distinct_mentions, num_mentions,
+         num_quoted_people, num_quoted_words) = counts
         '''
         print author_gender
         print data['id']
@@ -67,56 +129,168 @@ def get_mentions_quotes(nyt_data, out_fn):
         print data['norm_byline']
         '''
         year, month = data['id'].split('_')[:2]
-        with open(out_fn, 'a') as out_f:
-            try:
-                out_f.write('\t'.join(
-                    [unicode(a) for a in [
-                     link, author_gender, year, month, data.get('section', ''),
-                     ','.join([unicode(d) for d in data.get('descriptors',
-                                                            [])]),
-                     num_distinct_mentions['MALE'],
-                     num_distinct_mentions['FEMALE'],
-                     num_mentions['MALE'], num_mentions['FEMALE'],
-                     num_quoted_people['MALE'], num_quoted_people['FEMALE'],
-                     num_quoted_words['MALE'], num_quoted_words['FEMALE'],
-                     ]]))
-                out_f.write('\n')
-            except UnicodeEncodeError:
-                pass
-            except:
-                print link
-                print author_gender
-                print year
-                print month
-                print data.get('section', '')
-                print data.get('descriptors')
-                print ','.join(data.get('descriptors', []))
-                print num_distinct_mentions
-                print num_mentions
-                print [
-                            link, author_gender, year, month,
-                            data.get('section', ''),
-                            ','.join(data.get('descriptors', [])),
-                            num_distinct_mentions['MALE'],
-                            num_distinct_mentions['FEMALE'],
-                            num_mentions['MALE'], num_mentions['FEMALE'],
-                        ]
-                return
+        try:
+            # Rows that aren't plain ASCII are skipped (the encode raises
+            # UnicodeEncodeError).
+            out_f.write(u'{}\n'.format(u'\t'.join(
+                [unicode(a) for a in [
+                 link, author_gender, year, month, data.get('section', ''),
+                 ','.join([unicode(d) for d in data.get('descriptors',
+                                                        [])]),
+                 num_distinct_mentions['MALE'],
+                 num_distinct_mentions['FEMALE'],
+                 num_mentions['MALE'], num_mentions['FEMALE'],
+                 num_quoted_people['MALE'], num_quoted_people['FEMALE'],
+                 num_quoted_words['MALE'], num_quoted_words['FEMALE'],
+                 ]])).encode('ascii'))
+        except UnicodeEncodeError:
+            pass
+        except:
+            print link
+            print author_gender
+            print year
+            print month
+            print data.get('section', '')
+            print data.get('descriptors')
+            print ','.join(data.get('descriptors', []))
+            print num_distinct_mentions
+            print num_mentions
+            print [
+                        link, author_gender, year, month,
+                        data.get('section', ''),
+                        ','.join(data.get('descriptors', [])),
+                        num_distinct_mentions['MALE'],
+                        num_distinct_mentions['FEMALE'],
+                        num_mentions['MALE'], num_mentions['FEMALE'],
+                    ]
+            return
+
+
+def _female_share(counts):
+    return counts['FEMALE'], counts['MALE'] + counts['FEMALE']
+
+
+# What we estimate: a name, and a function from the counts of an article
+# (see get_article_counts) to its (y, x), for the ratio of the totals of y
+# and x (see sampling.stratified_estimate).
+ESTIMATES = [
+    ('Female share of people mentioned',
+     lambda counts: _female_share(counts[1])),
+    ('Female share of mentions', lambda counts: _female_share(counts[2])),
+    ('Female share of people quoted',
+     lambda counts: _female_share(counts[3])),
+    ('Female share of quoted words',
+     lambda counts: _female_share(counts[4])),
+    ('Female share of authors (of known gender)',
+     lambda counts: (int(counts[0] == 'FEMALE'),
+                     int(counts[0] in ['MALE', 'FEMALE']))),
+]
+
+
+def estimate_nyt_counts(years, folder='../annotated/NYT/'):
+    """
+    Prints estimates of ESTIMATES for each of the years and all of them
+    together, from the articles annotated so far, as a stratified sample of
+    the articles counted in the strata files of the months (see
+    sampling.py). Months without a strata file are left out.
+    """
+    # Samples of each estimate, by stratum.
+    samples = [{} for _ in ESTIMATES]
+    population = {}
+    for year in years:
+        for month in range(1, 13):
+            out_fn = get_nyt_annotation_path(year, month, folder)
+            strata = load_strata(out_fn)
+            if strata is None:
+                continue
+            population.update(strata)
+            if len(get_annotation_paths(out_fn)) == 0:
+                # Nothing annotated yet.
+                continue
+            print time.ctime(), "Loading data for {}/{}".format(year, month)
+            for link, data, corenlp in iter_nyt_data(year, month, folder):
+                counts = get_article_counts(data, corenlp)
+                if counts is None:
+                    continue
+                stratum = NYTSource.stratum(link, data)
+                for i, (_, get_sample) in enumerate(ESTIMATES):
+                    samples[i].setdefault(stratum, []).append(
+                        get_sample(counts))
+    if len(population) == 0:
+        print 'No strata files; annotate with --stratified first.'
+        return
+
+    groups = [(str(year), str(year)) for year in years]
+    if len(years) > 1:
+        groups.append(('All', None))
+    for i, (name, _) in enumerate(ESTIMATES):
+        print
+        print name
+        print '\t'.join(['Years', 'Estimate', '95% CI', 'Sampled',
+                         'Articles', 'Covered'])
+        for group_name, year in groups:
+            group_population = dict(
+                (stratum, size) for stratum, size in population.iteritems()
+                if year is None or stratum.startswith(year + '|'))
+            estimate = stratified_estimate(samples[i], group_population)
+            if estimate is None:
+                print '{}\t-'.format(group_name)
+                continue
+            print '{}\t{:.4f}\t[{:.4f}, {:.4f}]\t{}\t{}\t{:.1%}'.format(
+                group_name, estimate.value, estimate.low, estimate.high,
+                estimate.sampled, estimate.population, estimate.covered)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Count the mentions and quotes of men and women in the '
+                    'annotated NYT articles')
+    parser.add_argument('start_year', type=int)
+    parser.add_argument('end_year', type=int, nargs='?', default=None)
+    parser.add_argument('--folder', default='../annotated/NYT/')
+    parser.add_argument('--estimate', action='store_true',
+                        help='Print estimates for all the articles, from '
+                             'the stratified sample annotated so far.')
+    parser.add_argument('--index_file', default=None,
+                        help='Only count the articles picked with the NYT '
+                             'index (see nyt_index.py) by --front_page and '
+                             '--desks.')
+    parser.add_argument('--front_page', action='store_true',
+                        help='Only count front page articles (needs '
+                             '--index_file).')
+    parser.add_argument('--desks', nargs='+', default=None,
+                        help='Only count articles from these news desks '
+                             '(needs --index_file).')
+    args = parser.parse_args()
+    if args.index_file is None and (args.front_page or
+                                    args.desks is not None):
+        parser.error('--front_page and --desks need --index_file')
 
-    start_year = int(sys.argv[1])
-    if len(sys.argv) > 2:
-        end_year = int(sys.argv[2])
+    start_year = args.start_year
+    if args.end_year is not None:
+        end_year = args.end_year
     else:
         end_year = start_year
 
+    if args.estimate:
+        estimate_nyt_counts(range(start_year, end_year + 1), args.folder)
+        sys.exit()
+
+    index = None
+    if args.index_file is not None:
+        index = NYTIndex(args.index_file)
+
     for year in range(start_year, end_year + 1):
         for month in range(1, 13):
             print time.ctime(), "Loading data for {}/{}".format(year, month)
+            ids = None
+            if index is not None:
+                ids = set(index.ids(index.mask(
+                    years=[year], months=[month],
+                    pages=[1] if args.front_page else None,
+                    desks=args.desks)))
             try:
-                nyt_data = load_nyt_data(year, month)
+                nyt_data = load_nyt_data(year, month, args.folder, ids)
             except:
                 print "Exception Occurred"
                 continue
@@ -2,19 +2,19 @@ import json
 import sys
 import time
 from analysis import get_article_info
+from annotation_io import iter_annotation_lines
 from utils import get_gender
 
 
 def load_nyt_data(year, month, folder='../annotated/NYT/'):
     nyt_data = {}
-    with open('{}nyt_annotated_{}_{}.tsv'.format(
-            folder, year, month), 'r') as nyt_f:
-        for line in nyt_f:
-            link, data, corenlp = line.strip().split('\t')
-            nyt_data[link] = {
-                'data': json.loads(data),
-                'corenlp': json.loads(corenlp)
-            }
+    for line in iter_annotation_lines('{}nyt_annotated_{}_{}.tsv'.format(
+            folder, year, month)):
+        link, data, corenlp = line.strip().split('\t')
+        nyt_data[link] = {
+            'data': json.loads(data),
+            'corenlp': json.loads(corenlp)
+        }
 
     return nyt_data
 
@@ -0,0 +1,297 @@
+"""
+An index of the NYT corpus, with one row per article: its id, date, page,
+news desk, online sections, descriptors, byline and text length. It is kept
+as columns (numpy arrays) in one .npz file, so that picking articles (front
+page only, some desks, some years...) is a vectorized filter, rather than a
+walk over millions of XML files.
+
+The text columns aren't fixed-width string arrays, which would make every
+row as wide as the longest byline. There are only a few hundred news desks
+and sections, so those are kept as a code per article, into a table of the
+desks (or sections). The descriptors and bylines are all different, so they
+are kept as one long UTF-8 buffer, with the offset of each article's in it.
+
+Build it once with:
+python analysis/nyt_index.py 1987 2007 --processes 8
+
+and then use it with e.g.
+index = NYTIndex()
+ids = index.ids(index.mask(years=[1990], pages=[1], desks=['Metro Desk']))
+desks = index.strings('news_desk', index.mask(years=[1990]))
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from sources import extract_nyt_metadata, has_nyt_month, iter_nyt_month
+
+
+def get_file_path():
+    return os.path.dirname(os.path.realpath(__file__))
+
+
+DEFAULT_NYT_PATH = os.path.join(
+    get_file_path(),
+    '../data/LDC2008T19_The-New-York-Times-Annotated-Corpus/data')
+DEFAULT_INDEX_FN = os.path.join(get_file_path(),
+                                '../annotated/NYT/nyt_index.npz')
+
+# Descriptors are kept as one string per article, joined with this.
+DESCRIPTOR_SEPARATOR = u'|'
+
+# The page number of articles that don't have one.
+NO_PAGE = -1
+
+# Text columns kept as a code per article into a table of their values...
+CATEGORICAL_COLUMNS = ['news_desk', 'section']
+# ... and as a buffer of all their values, with an offset per article.
+CONCATENATED_COLUMNS = ['descriptors', 'byline']
+
+
+def _categorize(values):
+    """
+    Returns the codes of the values (as an array), and the table of the
+    distinct values (sorted), so that values[i] == table[codes[i]].
+    """
+    table, codes = np.unique(np.array(values, dtype=object),
+                             return_inverse=True)
+    return codes.astype(np.int32), np.array(table.tolist(), dtype=unicode)
+
+
+def _concatenate(values):
+    """
+    Returns all the values, UTF-8 encoded, one after the other (as an array
+    of bytes), and the offsets of each value in that, so that value i is
+    buffer[offsets[i]:offsets[i + 1]].
+    """
+    encoded = [value.encode('utf8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return np.array(bytearray(''.join(encoded)), dtype=np.uint8), offsets
+
+
+def _index_month(job):
+    """
+    Returns the index rows for one month of the corpus, as a dict of column
+    name to list.
+    """
+    path, year, month = job
+    columns = {'id': [], 'year': [], 'month': [], 'day': [],
+               'page_number': [], 'news_desk': [], 'section': [],
+               'descriptors': [], 'byline': [], 'text_length': []}
+    if not has_nyt_month(path, year, month):
+        return columns
+
+    for art_id, xml in iter_nyt_month(path, year, month):
+        data = extract_nyt_metadata(art_id, xml)
+        columns['id'].append(art_id)
+        columns['year'].append(year)
+        columns['month'].append(month)
+        columns['day'].append(int(art_id.split('_')[2]))
+        columns['page_number'].append(data.get('page_number', NO_PAGE))
+        columns['news_desk'].append(data.get('news_desk') or u'')
+        columns['section'].append(data.get('section') or u'')
+        columns['descriptors'].append(DESCRIPTOR_SEPARATOR.join(
+            [d for d in data['descriptors'] if d is not None]))
+        columns['byline'].append(data.get('print_byline') or u'')
+        columns['text_length'].append(len(data.get('text') or u''))
+    print time.ctime(), 'Indexed {}/{}: {} articles'.format(
+        year, month, len(columns['id']))
+    return columns
+
+
+def build_nyt_index(path, years, index_fn, processes=1):
+    """
+    Indexes every article of the given years of the corpus at path
+    (extracted, or as the LDC archives), and saves the index to index_fn.
+    Months are indexed in parallel by that many processes.
+    """
+    jobs = [(path, year, month) for year in years for month in range(1, 13)]
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        results = pool.map(_index_month, jobs, chunksize=1)
+        pool.close()
+    else:
+        results = map(_index_month, jobs)
+
+    columns = {}
+    for key in results[0]:
+        values = [v for result in results for v in result[key]]
+        if key in ['id']:
+            columns[key] = np.array(values, dtype=str)
+        elif key in CATEGORICAL_COLUMNS:
+            columns[key + '_codes'], columns[key + '_table'] = (
+                _categorize(values))
+        elif key in CONCATENATED_COLUMNS:
+            columns[key + '_buffer'], columns[key + '_offsets'] = (
+                _concatenate(values))
+        elif key in ['text_length']:
+            columns[key] = np.array(values, dtype=np.int32)
+        else:
+            columns[key] = np.array(values, dtype=np.int16)
+
+    # np.savez adds .npz to names that don't end with it, so we write to a
+    # temporary name that does, and then move it into place.
+    tmp_fn = '{}.tmp.npz'.format(index_fn)
+    np.savez_compressed(tmp_fn, **columns)
+    os.rename(tmp_fn, index_fn)
+    return len(columns['id'])
+
+
+class NYTIndex(object):
+    """
+    The NYT index, loaded from index_fn. Each number column is an attribute
+    (a numpy array): id, year, month, day, page_number and text_length. The
+    text columns (news_desk, section, descriptors and byline) are read with
+    strings.
+    """
+
+    COLUMNS = ['id', 'year', 'month', 'day', 'page_number', 'text_length']
+
+    def __init__(self, index_fn=DEFAULT_INDEX_FN):
+        self._codes = {}
+        self._tables = {}
+        self._buffers = {}
+        self._offsets = {}
+        with np.load(index_fn) as index:
+            for key in self.COLUMNS:
+                setattr(self, key, index[key])
+            # Indexes built before the text columns were encoded have them
+            # as plain string arrays.
+            for key in CATEGORICAL_COLUMNS:
+                if key in index.files:
+                    self._codes[key], self._tables[key] = _categorize(
+                        index[key])
+                else:
+                    self._codes[key] = index[key + '_codes']
+                    self._tables[key] = index[key + '_table']
+            for key in CONCATENATED_COLUMNS:
+                if key in index.files:
+                    buffer_, self._offsets[key] = _concatenate(index[key])
+                else:
+                    buffer_ = index[key + '_buffer']
+                    self._offsets[key] = index[key + '_offsets']
+                # As a str, for searching it.
+                self._buffers[key] = buffer_.tostring()
+
+    def __len__(self):
+        return len(self.id)
+
+    def mask(self, years=None, months=None, pages=None, desks=None,
+             sections=None, descriptors=None, min_text_length=None):
+        """
+        Returns a boolean array that is True for the articles that match all
+        the given filters (any of the given years, any of the pages...).
+        sections and descriptors match articles that have any of them.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if years is not None:
+            mask &= np.in1d(self.year, years)
+        if months is not None:
+            mask &= np.in1d(self.month, months)
+        if pages is not None:
+            mask &= np.in1d(self.page_number, pages)
+        if desks is not None:
+            desks = set(unicode(desk) for desk in desks)
+            mask &= self._is_any('news_desk', lambda desk: desk in desks)
+        if sections is not None:
+            mask &= self._is_any('section', lambda section: any(
+                unicode(value) in section for value in sections))
+        if descriptors is not None:
+            mask &= self._contains_any('descriptors', descriptors)
+        if min_text_length is not None:
+            mask &= self.text_length >= min_text_length
+        return mask
+
+    def _is_any(self, key, matches):
+        """
+        For a categorical column: True for the articles whose value matches.
+        """
+        codes = [code for code, value in enumerate(self._tables[key])
+                 if matches(value)]
+        return np.in1d(self._codes[key], codes)
+
+    def _contains_any(self, key, values):
+        """
+        For a concatenated column: True for the articles that have any of
+        the values as one of their (DESCRIPTOR_SEPARATOR-joined) values, as
+        a whole: 'Art' doesn't match 'Arts'. An empty value matches the
+        articles that have none.
+        """
+        buffer_, offsets = self._buffers[key], self._offsets[key]
+        separator = DESCRIPTOR_SEPARATOR.encode('utf8')
+        is_separator = np.frombuffer(buffer_, dtype=np.uint8) == ord(separator)
+        found = np.zeros(len(self), dtype=bool)
+        for value in values:
+            value = unicode(value).encode('utf8')
+            if len(value) == 0:
+                found |= offsets[1:] == offsets[:-1]
+                continue
+            # Every match, even overlapping ones, as the one that's a whole
+            # value might start inside another that isn't.
+            starts = []
+            start = buffer_.find(value)
+            while start != -1:
+                starts.append(start)
+                start = buffer_.find(value, start + 1)
+            if len(starts) == 0:
+                continue
+            starts = np.array(starts, dtype=np.int64)
+            ends = starts + len(value)
+            # The article each match starts in; the match has to be all of
+            # one of its values, from a separator (or the start of the
+            # article) to a separator (or its end).
+            rows = np.searchsorted(offsets, starts, side='right') - 1
+            whole = ends <= offsets[rows + 1]
+            whole &= ((starts == offsets[rows]) |
+                      is_separator[np.maximum(starts - 1, 0)])
+            whole &= ((ends == offsets[rows + 1]) |
+                      is_separator[np.minimum(ends, len(buffer_) - 1)])
+            found[rows[whole]] = True
+        return found
+
+    def strings(self, key, mask=None):
+        """
+        Returns the values of a text column (news_desk, section, descriptors
+        or byline) for the articles in mask (or all of them), as a list.
+        The descriptors of an article are joined with DESCRIPTOR_SEPARATOR.
+        """
+        if key in self._codes:
+            codes = self._codes[key]
+            if mask is not None:
+                codes = codes[mask]
+            return self._tables[key][codes].tolist()
+
+        buffer_, offsets = self._buffers[key], self._offsets[key]
+        rows = xrange(len(self)) if mask is None else np.flatnonzero(mask)
+        return [buffer_[offsets[row]:offsets[row + 1]].decode('utf8')
+                for row in rows]
+
+    def ids(self, mask=None):
+        """
+        Returns the ids of the articles in mask (or of all of them).
+        """
+        if mask is None:
+            return list(self.id)
+        return list(self.id[mask])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Index the NYT corpus')
+    parser.add_argument('start_year', type=int)
+    parser.add_argument('end_year', type=int, nargs='?')
+    parser.add_argument('--path', default=DEFAULT_NYT_PATH)
+    parser.add_argument('--index_file', default=DEFAULT_INDEX_FN)
+    parser.add_argument('--processes', type=int, default=1,
+                        help='How many months to index at once.')
+    args = parser.parse_args()
+
+    end_year = args.end_year or args.start_year
+    num_articles = build_nyt_index(args.path,
+                                   range(args.start_year, end_year + 1),
+                                   args.index_file, processes=args.processes)
+    print time.ctime(), 'Indexed {} articles in {}'.format(num_articles,
+                                                           args.index_file)
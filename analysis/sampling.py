@@ -0,0 +1,150 @@
+"""
+Annotating a stratified random sample of a corpus first, and estimating
+from whatever has been annotated so far.
+
+A stratum is a string like 1990|01|Metro Desk (year, month and news desk for
+the NYT; year, month and category for TechCrunch, see sources.py). With
+--stratified, annotate_corpus.py goes through the articles in an order in
+which every prefix is (about) a proportional stratified random sample of
+them (see stratified_order), and it keeps how many articles each stratum of
+a source has in the source's strata file (see get_strata_path). Then at any
+point of the annotation, stratified_estimate gives estimates (with
+confidence intervals) for the whole corpus from the articles annotated so
+far.
+"""
+import collections
+import json
+import math
+import os
+import random
+
+import numpy as np
+
+
+# For 95% confidence intervals.
+Z_95 = 1.959964
+
+
+def get_strata_path(out_fn):
+    """
+    The strata file of nyt_annotated_1990_1.tsv is
+    nyt_annotated_1990_1_strata.json, in the same folder.
+    """
+    return '{}_strata.json'.format(os.path.splitext(out_fn)[0])
+
+
+def load_strata(out_fn):
+    """
+    Returns the number of articles of each stratum of the source whose
+    annotation TSV is out_fn, or None if we don't know them.
+    """
+    try:
+        with open(get_strata_path(out_fn), 'r') as f:
+            return json.load(f)
+    except IOError:
+        return None
+
+
+def save_strata(out_fn, strata):
+    path = get_strata_path(out_fn)
+    # Written to the side and renamed, so that it's never half written.
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'w') as f:
+        json.dump(strata, f, sort_keys=True, indent=1)
+    os.rename(tmp_path, path)
+
+
+def stratified_order(tasks, seed=0):
+    """
+    tasks is a list of (stratum, task). Returns the tasks in an order in
+    which every prefix is (about) a proportional stratified random sample
+    of them: the tasks of each stratum are shuffled, and the i-th of the n
+    of a stratum goes at (i + u) / n of the way through, for a random u in
+    [0, 1), so that each stratum is spread evenly over the order.
+    For the same tasks in the same order and the same seed, the order is
+    always the same.
+    """
+    random_state = random.Random(seed)
+    by_stratum = collections.OrderedDict()
+    for stratum, task in tasks:
+        by_stratum.setdefault(stratum, []).append(task)
+
+    keyed_tasks = []
+    for stratum, stratum_tasks in by_stratum.iteritems():
+        random_state.shuffle(stratum_tasks)
+        n = float(len(stratum_tasks))
+        for i, task in enumerate(stratum_tasks):
+            keyed_tasks.append(((i + random_state.random()) / n, task))
+    keyed_tasks.sort(key=lambda keyed_task: keyed_task[0])
+    return [task for _, task in keyed_tasks]
+
+
+Estimate = collections.namedtuple(
+    'Estimate', ['value', 'low', 'high', 'sampled', 'population', 'covered'])
+
+
+def stratified_estimate(samples, population, z=Z_95):
+    """
+    Estimates the ratio of the totals of y and x over the population, from
+    samples, which maps each stratum to the (y, x) of the articles sampled
+    from it (e.g. female mentions and all mentions of each article, for the
+    share of mentions that are female; with x = 1, it's the mean of y).
+    population maps each stratum to how many articles it has (see
+    load_strata); samples from strata that aren't in it are left out.
+
+    Returns an Estimate, with the confidence interval (value +- z standard
+    errors; the standard error is from the linearized ratio, with the
+    finite population correction), how many articles were sampled and are
+    in the population, and the share of the population in strata that have
+    been sampled at all. The estimate is for those strata only. The variance
+    within strata with only one article sampled is the pooled variance of
+    the others. Returns None if there is nothing to estimate from.
+    """
+    strata = [stratum for stratum, size in population.iteritems()
+              if size > 0 and len(samples.get(stratum, [])) > 0]
+    population_size = sum(population.itervalues())
+    covered_size = float(sum(population[stratum] for stratum in strata))
+    if covered_size == 0:
+        return None
+
+    weights = {}
+    stratum_samples = {}
+    y_mean = x_mean = 0.
+    for stratum in strata:
+        weights[stratum] = population[stratum] / covered_size
+        stratum_samples[stratum] = np.array(samples[stratum], dtype=float)
+        y_mean += weights[stratum] * stratum_samples[stratum][:, 0].mean()
+        x_mean += weights[stratum] * stratum_samples[stratum][:, 1].mean()
+    if x_mean == 0:
+        return None
+    ratio = y_mean / x_mean
+
+    residual_variances = {}
+    for stratum in strata:
+        residuals = (stratum_samples[stratum][:, 0] -
+                     ratio * stratum_samples[stratum][:, 1])
+        if len(residuals) > 1:
+            residual_variances[stratum] = residuals.var(ddof=1)
+    degrees = sum(len(stratum_samples[stratum]) - 1
+                  for stratum in residual_variances)
+    if degrees > 0:
+        pooled_variance = sum(
+            (len(stratum_samples[stratum]) - 1) * variance
+            for stratum, variance in residual_variances.iteritems()) / degrees
+    else:
+        pooled_variance = float('inf')
+
+    variance = 0.
+    num_sampled = 0
+    for stratum in strata:
+        n = len(stratum_samples[stratum])
+        num_sampled += n
+        sampled_fraction = min(1., n / float(population[stratum]))
+        if sampled_fraction == 1.:
+            # We have all of it, so there's nothing to estimate.
+            continue
+        variance += (weights[stratum] ** 2 * (1. - sampled_fraction) *
+                     residual_variances.get(stratum, pooled_variance) / n)
+    error = z * math.sqrt(variance) / abs(x_mean)
+    return Estimate(ratio, ratio - error, ratio + error, num_sampled,
+                    population_size, covered_size / population_size)
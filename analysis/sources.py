@@ -0,0 +1,695 @@
+"""
+The corpora we annotate. Each source knows where its articles are, how to
+read them, and what its annotation TSV is called; annotate_corpus.py does the
+rest (resuming, annotating in parallel, writing the TSV).
+
+A source is a class with:
+    name: what it's called on the annotate_corpus.py command line.
+    add_arguments(parser): (classmethod) adds its command line arguments.
+    from_args(args): (classmethod) makes the sources from them, as a list
+        (several months of the NYT are several sources, each with its own
+        TSV).
+    output_filename(): where its annotation TSV goes.
+    articles(skip): yields (article_id, article_data, text) for every article
+        for which skip(article_id) is False. article_data is what goes into
+        the second column of the TSV, and text is what gets annotated.
+
+and, if it can tell how long its articles are without reading them (which
+lets annotate_corpus.py send the longest articles first, without holding all
+of them in memory):
+    article_lengths(skip): returns (article_id, length) for the articles for
+        which skip(article_id) is False, or None if it can't after all.
+    load_article(article_id): returns (article_data, text), or None if the
+        article isn't to be annotated.
+
+and, if it can tell exactly how many articles it will yield without reading
+them (for the progress and ETAs, see nlp/progress.py):
+    article_count(skip): returns how many articles articles(skip) will
+        yield, or None if it can't tell after all.
+
+and, for annotating a stratified sample first (see sampling.py):
+    stratum(article_id, article_data): (staticmethod) the stratum of the
+        article, like 1990|01|Metro Desk. Without it, a source is one
+        stratum.
+    article_strata(): returns (article_id, stratum) for all the articles
+        (whether skipped or not) without reading them, or None if it can't.
+
+To add a corpus, write such a class and add it to SOURCES.
+"""
+import os
+import re
+import tarfile
+import time
+import xml.etree.cElementTree as ET
+
+from tc_partitions import iter_techcrunch
+
+
+def get_file_path():
+    return os.path.dirname(os.path.realpath(__file__))
+
+
+# List of XPATHS pulled from the PDF linked in extract_nyt_article_data.
+# SINGLE because these will have only one element.
+NYT_SINGLE_XPATHS = {
+    'headline': './body[1]/body.head/hedline/hl1',
+    'lead': './body/body.content/block[@class="lead_paragraph"]',
+    'text': './body/body.content/block[@class="full_text"]',
+    'print_byline': './body/body.head/byline[@class="print_byline"]',
+    'norm_byline':
+        './body/body.head/byline[@class="normalized_byline"]',
+}
+
+# These are single XPATHS where, instead of the text in the element,
+# we will need to extract the value of the attribute content.
+NYT_SINGLE_XPATHS_CONTENT = {
+    'section': './head/meta[@name="online_sections"]',
+    'news_desk': './head/meta[@name="dsk"]',
+}
+
+NYT_MULTIPLE_XPATHS = {
+    'descriptors':
+    './head/docdata/identified-content/classifier[@class="indexing_service"][@type="descriptor"]',
+    'general_online_descriptors':
+    './head/docdata/identified-content/classifier[@class="online_producer"][@type="general_descriptor"]',
+    'taxonomic_classifiers':
+    './head/docdata/identified-content/classifier[@class="online_producer"][@type="taxonomic_classifier"]',
+    'locations':
+    './head/docdata/identified-content/location[@class="indexing_service"]',
+    'people':
+    './head/docdata/identified-content/person[@class="indexing_service"]',
+    'organizations':
+    './head/docdata/identified-content/org[@class="indexing_service"]',
+    'online_locations':
+    './head/docdata/identified-content/location[@class="online_producer"]',
+    'online_people':
+    './head/docdata/identified-content/person[@class="online_producer"]',
+    'online_organizations':
+    './head/docdata/identified-content/org[@class="online_producer"]',
+}
+
+NYT_PAGE_NUMBER_XPATH = './head/meta[@name="print_page_number"]'
+
+_PREDICATE_RE = re.compile(r'\[@([\w.-]+)="([^"]*)"\]')
+
+
+def _compile_xpath(xpath):
+    """
+    Turns one of the (simple) XPATHS above into the tags on the way to the
+    element from the root, and the attributes the element needs to have.
+    """
+    steps = xpath.lstrip('./').split('/')
+    tags = tuple(step.split('[')[0] for step in steps)
+    # Only the last step has attribute conditions. (The [1] in
+    # body[1] doesn't matter, since there is only one body.)
+    return tags, dict(_PREDICATE_RE.findall(steps[-1]))
+
+
+def _compile_nyt_rules(xpaths_by_kind):
+    """
+    Compiles XPATHS into a tree of tags: each node is a pair of a dict
+    from the tags of child elements to their nodes, and a list of the
+    (key, attribute conditions, kind) of the XPATHS that end there.
+    """
+    root = ({}, [])
+    for kind, xpaths in xpaths_by_kind:
+        for key, xpath in xpaths.iteritems():
+            tags, conditions = _compile_xpath(xpath)
+            node = root
+            for tag in tags:
+                node = node[0].setdefault(tag, ({}, []))
+            node[1].append((key, conditions, kind))
+    return root
+
+_NYT_PAGE_RULES = _compile_nyt_rules(
+    [('page', {'page_number': NYT_PAGE_NUMBER_XPATH})])
+_NYT_RULES = _compile_nyt_rules([('single', NYT_SINGLE_XPATHS),
+                                 ('content', NYT_SINGLE_XPATHS_CONTENT),
+                                 ('multiple', NYT_MULTIPLE_XPATHS)])
+
+
+def _match_nyt_rules(elem, node, curr_art_data):
+    """
+    Fills in curr_art_data with everything in the children of elem that the
+    XPATHS in node (see _compile_nyt_rules) match. We only go down into
+    elements that some XPATH could match below, so we don't go through the
+    paragraphs of the text, for example.
+    """
+    children, _ = node
+    for child in elem:
+        child_node = children.get(child.tag)
+        if child_node is None:
+            continue
+        for key, conditions, kind in child_node[1]:
+            if any(child.get(attr) != value
+                   for attr, value in conditions.iteritems()):
+                continue
+            if kind == 'multiple':
+                curr_art_data[key].append(child.text)
+            elif key in curr_art_data:
+                # Like find, we only keep the first match.
+                continue
+            elif kind == 'page':
+                curr_art_data[key] = int(child.attrib['content'])
+            elif kind == 'content':
+                curr_art_data[key] = child.attrib['content']
+            elif key in ['text', 'lead']:
+                curr_art_data[key] = '\n'.join([el.text for el in child])
+            else:
+                curr_art_data[key] = child.text
+        if len(child_node[0]) > 0:
+            _match_nyt_rules(child, child_node, curr_art_data)
+
+
+_HEAD_START_RE = re.compile(r'<head[\s>]')
+_BODY_START_RE = re.compile(r'<body[\s>]')
+
+
+def extract_nyt_article_data(article_id, filename, all_pages):
+    """
+    Extracts data from the NYT article given the filename.
+    Returns the article as a dictionary with the following format:
+    {
+        'id': year_month_day_id (2001_05_25_0001234)
+        'headline': Headline (99.95%)
+        'lead': The lead paragraph (96.19%)
+        'text': Full text of the article (98.68%)
+        'print_byline': The print byline ("by Viswajith Venugopal") (60.04%)
+        'norm_byline': The normalized byline ("Venugopal, Viswajith") (48.18%)
+        'section': A list of 'online' sections this article is in (97.73%)
+        'news_desk': Which desk within NYT? Something like a section. (100%)
+        'page_number': Which page in the newspaper was this on? (99.94%)
+        'descriptors': Some tags for the article (84.84%)
+        'general_online_descriptors': More general tags for the article (79.72%)
+        'taxonomic_classifiers': Hierarchical section for the article
+                                (like Top/News/U.S/Rockies) (99.50%)
+        'locations': A list of locations (32.34%)
+        'people': A list of people mentioned (71.57%)
+        'organizations': A list of organizations (32.17%)
+        (THE ABOVE THREE FIELDS ONLY SEEM TO CONTAIN FAMOUS LOCS/PEOPLE/ORGS)
+        'online_locations': A list of locations (6.69%)
+        'online_people': A list of people mentioned (6.16%)
+        'online_organizations': A list of organizations (7.38%)
+        (THE ABOVE THREE ARE TAGGED ALGORITHMICALLY BUT VERIFIED MANUALLY
+         AND ONLY START APPEARING FROM 2000-2001)
+    }
+    NOTE: Not all these things exist for all articles. If it doesn't, the dict
+    just won't have that key. The percentages in the above format denote what
+    percentage of articles (overall) that field is present in.
+    This information was pulled from:
+    https://catalog.ldc.upenn.edu/docs/LDC2008T19/new_york_times_annotated_corpus.pdf
+
+    If all_pages is False, then we return None unless the article was on page 1.
+    """
+
+    with open(filename, 'rb') as f:
+        return parse_nyt_article(article_id, f.read(), all_pages)
+
+
+def parse_nyt_article(article_id, xml, all_pages):
+    """
+    Like extract_nyt_article_data, given the XML of the article (as a str).
+
+    The page number is in the <head>, which comes before the <body>, so we
+    parse the <head> on its own first, and only parse the <body> if we want
+    the article.
+    """
+    # The dictionary of data for the current article.
+    curr_art_data = {'id': article_id}
+    for key in NYT_MULTIPLE_XPATHS:
+        curr_art_data[key] = []
+
+    head_start = _HEAD_START_RE.search(xml)
+    head_end = xml.find('</head>')
+    body_start = _BODY_START_RE.search(xml, max(head_end, 0))
+    body_end = xml.rfind('</body>')
+    if None in (head_start, body_start) or -1 in (head_end, body_end):
+        # Not laid out the way we expect, so just parse the whole thing.
+        root = ET.fromstring(xml)
+        _match_nyt_rules(root, _NYT_PAGE_RULES, curr_art_data)
+        _match_nyt_rules(root, _NYT_RULES, curr_art_data)
+        head = body = None
+    else:
+        # We match the <head> and <body> as if they were in an <nitf>.
+        head = [ET.fromstring(
+            xml[head_start.start():head_end + len('</head>')])]
+        body = xml[body_start.start():body_end + len('</body>')]
+        _match_nyt_rules(head, _NYT_PAGE_RULES, curr_art_data)
+
+    if 'page_number' not in curr_art_data:
+        return None
+
+    # Return None if we want only first page articles, and this article is not
+    # a first page article.
+    if not all_pages and curr_art_data['page_number'] != 1:
+        return None
+
+    if head is not None:
+        _match_nyt_rules(head, _NYT_RULES, curr_art_data)
+        _match_nyt_rules([ET.fromstring(body)], _NYT_RULES, curr_art_data)
+
+    # Remove the lead paragraph from the article text
+    # by stripping off everything up to the first '\n'
+    if not 'text' in curr_art_data:
+        return None  # Nothing to annotate for articles without text
+    if curr_art_data['text'].startswith('LEAD'):
+        try:
+            lead_end = curr_art_data['text'].index('\n')
+            curr_art_data['text'] = curr_art_data['text'][
+                lead_end + 1:]
+        except ValueError:
+             pass
+    curr_art_data['text'] = curr_art_data['text'].replace("''", '"')
+
+    return curr_art_data
+
+
+def _nyt_article_id(year, month, day, filename):
+    """
+    The id of an article is the year, month and day followed by the
+    filename (except the .xml part). For example, a file named 0001234.xml
+    published on the 5th of November, 1997, will have id 1997_11_05_001234.
+    """
+    return '{}_{}_{}_{}'.format(year, str(month).zfill(2), day,
+                                filename.split('.')[0])
+
+
+def extract_nyt_metadata(article_id, xml):
+    """
+    Returns everything in the article that the XPATHS match (see
+    extract_nyt_article_data), for any page, and whether or not it has text.
+    """
+    curr_art_data = {'id': article_id}
+    for key in NYT_MULTIPLE_XPATHS:
+        curr_art_data[key] = []
+    root = ET.fromstring(xml)
+    _match_nyt_rules(root, _NYT_PAGE_RULES, curr_art_data)
+    _match_nyt_rules(root, _NYT_RULES, curr_art_data)
+    return curr_art_data
+
+
+def nyt_article_path(path, article_id):
+    """
+    Where the XML file of the article is, in the extracted corpus.
+    """
+    year, month, day, filename = article_id.split('_')
+    return os.path.join(path, year, month, day, '{}.xml'.format(filename))
+
+
+def iter_nyt_folder(path, year, month, skip=lambda art_id: False):
+    """
+    Yields (article_id, xml) for every article of the month, from the
+    extracted corpus, which has the XML files in path/year/month/day/.
+    Articles for which skip(article_id) is True aren't read.
+    """
+    # zfill(2) turns '3'->'03' and so on.
+    root_dir = os.path.join(path, str(year), str(month).zfill(2))
+
+    for root, subfolders, files in os.walk(root_dir):
+
+        # This makes sure we only look at the leaf directories,
+        # which actually contain the xml files.
+        if len(files) == 0:
+            continue
+
+        # The folder name is the day, in two digits, like 01 or 26
+        curr_day = root[-2:]
+
+        for file_ in files:
+            if not file_.endswith('xml'):
+                continue
+            art_id = _nyt_article_id(year, month, curr_day, file_)
+            if skip(art_id):
+                continue
+            with open(os.path.join(root, file_), 'rb') as f:
+                yield art_id, f.read()
+
+
+def iter_nyt_archive(path, year, month, skip=lambda art_id: False):
+    """
+    Yields (article_id, xml) for every article of the month, straight from
+    the LDC archive of the month, path/year/month.tgz (which has the XML
+    files in month/day/). The archive is read as a stream, in one go, so
+    this is one big file read instead of one small one per article.
+    Articles for which skip(article_id) is True aren't decompressed into
+    strings.
+    """
+    _, archive_fn = _nyt_month_paths(path, year, month)
+    with tarfile.open(archive_fn, 'r|gz') as archive:
+        for member in archive:
+            if not member.isfile() or not member.name.endswith('.xml'):
+                continue
+            day_dir, filename = os.path.split(member.name)
+            art_id = _nyt_article_id(year, month, os.path.basename(day_dir),
+                                     filename)
+            if skip(art_id):
+                continue
+            yield art_id, archive.extractfile(member).read()
+
+
+def _nyt_month_paths(path, year, month):
+    """
+    The folder and the archive that the month could be in.
+    """
+    month_path = os.path.join(path, str(year), str(month).zfill(2))
+    return month_path, '{}.tgz'.format(month_path)
+
+
+def has_nyt_month(path, year, month):
+    return any(os.path.exists(p) for p in _nyt_month_paths(path, year, month))
+
+
+def iter_nyt_month(path, year, month, skip=lambda art_id: False,
+                   article_ids=None):
+    """
+    Yields (article_id, xml) for every article of the month, from the
+    extracted folder if there is one, and from the LDC archive otherwise.
+    If article_ids is given, we only read those articles (and with an
+    extracted folder, we go straight to their files).
+    """
+    folder, _ = _nyt_month_paths(path, year, month)
+    if article_ids is not None:
+        article_ids = set(article_ids)
+        if os.path.isdir(folder):
+            return _iter_nyt_files(path, sorted(article_ids), skip)
+        unwanted = skip
+        skip = lambda art_id: art_id not in article_ids or unwanted(art_id)
+    if os.path.isdir(folder):
+        return iter_nyt_folder(path, year, month, skip)
+    return iter_nyt_archive(path, year, month, skip)
+
+
+def _iter_nyt_files(path, article_ids, skip):
+    for art_id in article_ids:
+        if skip(art_id):
+            continue
+        with open(nyt_article_path(path, art_id), 'rb') as f:
+            yield art_id, f.read()
+
+
+def nyt_stratum(year, month, news_desk):
+    return u'{}|{}|{}'.format(year, str(month).zfill(2), news_desk or u'')
+
+
+class NYTSource(object):
+    """
+    One month of the NYT corpus, with (by default) only the front page
+    articles. The corpus can be extracted (XML files in
+    path/year/month/day/) or not (the LDC archives, path/year/month.tgz).
+    If article_ids is given (from the NYT index, see nyt_index.py), only
+    those articles are read; text_lengths and strata (also from the index)
+    map them to the length of their text and to their stratum.
+
+    See _nyt_article_id for the ids of the articles.
+    """
+    name = 'nyt'
+
+    def __init__(self, path, output_dir, year, month, all_pages=False,
+                 article_ids=None, text_lengths=None, strata=None):
+        self.path = path
+        self.output_dir = output_dir
+        self.year = year
+        self.month = month
+        self.all_pages = all_pages
+        self.article_ids = article_ids
+        self.text_lengths = text_lengths
+        self.strata = strata
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join(
+                get_file_path(),
+                '../data/LDC2008T19_The-New-York-Times-Annotated-Corpus/data'))
+        parser.add_argument('--output_dir',
+                            default=os.path.join(get_file_path(),
+                                                 '../annotated/NYT/'))
+        parser.add_argument('year', type=int)
+        parser.add_argument('month', type=int, nargs='+')
+        parser.add_argument('--all_pages', action="store_true",
+                            help="Annotate all pages or just the front page?")
+        parser.add_argument('--index_file', default=None,
+                            help='Pick the articles with the NYT index '
+                                 '(see nyt_index.py) instead of reading '
+                                 'every one of them.')
+        parser.add_argument('--desks', nargs='+', default=None,
+                            help='Only annotate articles from these news '
+                                 'desks (needs --index_file).')
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Makes one source per month.
+        """
+        if args.index_file is None:
+            if args.desks is not None:
+                raise ValueError('--desks needs --index_file')
+            return [cls(args.path, args.output_dir, args.year, month,
+                        all_pages=args.all_pages)
+                    for month in args.month]
+
+        # (nyt_index imports this module, so we import it here.)
+        from nyt_index import NYTIndex
+        index = NYTIndex(args.index_file)
+        sources = []
+        for month in args.month:
+            mask = index.mask(years=[args.year], months=[month],
+                              pages=None if args.all_pages else [1],
+                              desks=args.desks)
+            article_ids = index.ids(mask)
+            sources.append(cls(
+                args.path, args.output_dir, args.year, month,
+                all_pages=args.all_pages, article_ids=article_ids,
+                text_lengths=dict(zip(article_ids,
+                                      index.text_length[mask].tolist())),
+                strata=dict((art_id, nyt_stratum(args.year, month, desk))
+                            for art_id, desk in zip(
+                                article_ids,
+                                index.strings('news_desk', mask)))))
+        return sources
+
+    def output_filename(self):
+        return os.path.join(self.output_dir, 'nyt_annotated_{}_{}.tsv'.format(
+            self.year, self.month))
+
+    def articles(self, skip):
+        curr_day = None
+        for curr_art_id, xml in iter_nyt_month(self.path, self.year,
+                                               self.month, skip,
+                                               self.article_ids):
+            day = curr_art_id.split('_')[2]
+            if curr_day is not None and day != curr_day:
+                print time.ctime(), 'Sent all of day no: {}.'.format(curr_day)
+            curr_day = day
+
+            curr_art_data = parse_nyt_article(curr_art_id, xml,
+                                              self.all_pages)
+            if curr_art_data is None:
+                continue
+
+            yield curr_art_id, curr_art_data, curr_art_data['text']
+
+        if curr_day is not None:
+            print time.ctime(), 'Sent all of day no: {}.'.format(curr_day)
+
+    def article_lengths(self, skip):
+        """
+        The length of an article is the length of its text if we have the
+        NYT index, and otherwise the size of its XML file (which is close
+        enough to tell long articles from short ones). We can't get at the
+        articles of an archived month one by one, so for those this returns
+        None.
+        """
+        folder, _ = _nyt_month_paths(self.path, self.year, self.month)
+        if not os.path.isdir(folder):
+            return None
+        if self.text_lengths is not None:
+            return [(art_id, length)
+                    for art_id, length in self.text_lengths.iteritems()
+                    if not skip(art_id)]
+
+        lengths = []
+        for root, subfolders, files in os.walk(folder):
+            for file_ in files:
+                if not file_.endswith('xml'):
+                    continue
+                art_id = _nyt_article_id(self.year, self.month, root[-2:],
+                                         file_)
+                if not skip(art_id):
+                    lengths.append((art_id, os.path.getsize(
+                        os.path.join(root, file_))))
+        return lengths
+
+    def article_count(self, skip):
+        """
+        Only with the NYT index: the XML files of a month include the
+        articles on every page, so without it, we don't know how many
+        articles we'll yield until we've parsed them.
+        """
+        if self.text_lengths is None:
+            return None
+        return sum(1 for art_id in self.text_lengths if not skip(art_id))
+
+    def load_article(self, art_id):
+        with open(nyt_article_path(self.path, art_id), 'rb') as f:
+            art_data = parse_nyt_article(art_id, f.read(), self.all_pages)
+        if art_data is None:
+            return None
+        return art_data, art_data['text']
+
+    @staticmethod
+    def stratum(art_id, art_data):
+        year, month = art_id.split('_')[:2]
+        return nyt_stratum(year, month, art_data.get('news_desk'))
+
+    def article_strata(self):
+        """
+        Only with the NYT index, and (as for article_lengths) an extracted
+        month.
+        """
+        folder, _ = _nyt_month_paths(self.path, self.year, self.month)
+        if self.strata is None or not os.path.isdir(folder):
+            return None
+        return sorted(self.strata.iteritems())
+
+
+class TechCrunchSource(object):
+    """
+    One year (or month) of TechCrunch articles, from the JSON file that maps
+    the URL of every article to its data, or from the monthly partitions of
+    it (see tc_partitions.py). The id of an article is its URL.
+    """
+    name = 'tc'
+
+    UNICODE_ASCII_MAP = {
+        0x2018: u'\'',
+        0x2019: u'\'',
+        0x201c: u'\"',
+        0x201d: u'\"'
+    }
+
+    def __init__(self, path, output_dir, year, month=0):
+        self.path = path
+        self.output_dir = output_dir
+        self.year = year
+        self.month = month
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument('--path',
+                            default=os.path.join(
+                                get_file_path(),
+                                '../data/techcrunch_everything.json'),
+                            help='The JSON file, or the folder of its '
+                                 'monthly partitions.')
+        parser.add_argument('--output_dir',
+                            default=os.path.join(get_file_path(),
+                                                 '../annotated/'))
+        parser.add_argument('year', type=int)
+        parser.add_argument('--month', type=int, default=0,
+                            help='Which month? 0 means all.')
+
+    @classmethod
+    def from_args(cls, args):
+        return [cls(args.path, args.output_dir, args.year, month=args.month)]
+
+    def output_filename(self):
+        return os.path.join(self.output_dir,
+                            'techcrunch_annotated_{}_{}.tsv'.format(
+                                self.year, self.month))
+
+    def articles(self, skip):
+        for url, data in iter_techcrunch(self.path, self.year, self.month):
+            if skip(url):
+                continue
+            text_str = data['text'].translate(self.UNICODE_ASCII_MAP).encode(
+                'ascii', 'ignore')
+            yield url, data, text_str
+
+    @staticmethod
+    def stratum(art_id, art_data):
+        """
+        The year and month of the article, and its first category.
+        """
+        # Timestamps look like 2012-03-01 10:00:00.
+        timestamp = art_data['timestamp']
+        categories = art_data.get('category') or [u'']
+        return u'{}|{}|{}'.format(timestamp[:4], timestamp[5:7],
+                                  categories[0])
+
+
+def extract_manual_article_data(filename):
+    """
+    For manually annotated articles, the format is simple:
+    line 1: article_id
+    line 2: url
+    line 3: headline
+    line 4: byline (';' separated list)
+    line 5 onwards: text
+    """
+
+    print filename
+    with open(filename, 'r') as f:
+        lines = f.readlines()
+
+    lines = [l.strip() for l in lines]
+    lines = [l for l in lines if len(l) > 0]
+
+    art_data = {
+        'id': lines[0],
+        'url': lines[1],
+        'headline': lines[2],
+        'byline': lines[3]
+    }
+
+    art_data['text'] = unicode('\n'.join(lines[4:]), encoding='utf-8')
+
+    return art_data
+
+
+class ManualSource(object):
+    """
+    The articles we manually tagged, one .txt file each (see
+    extract_manual_article_data). The id of an article is its filename
+    without the extension.
+    """
+    name = 'manual'
+
+    def __init__(self, input_path, output_file):
+        self.input_path = input_path
+        self.output_file = output_file
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument(
+            '--input_path',
+            default='/Users/viswa/Desktop/Box Sync/Gendermeme/Annotations')
+        parser.add_argument(
+            '--output_file',
+            default=os.path.join(get_file_path(),
+                                 '../annotated/manual/ann.tsv'))
+
+    @classmethod
+    def from_args(cls, args):
+        return [cls(args.input_path, args.output_file)]
+
+    def output_filename(self):
+        return self.output_file
+
+    def articles(self, skip):
+        for filename in os.listdir(self.input_path):
+            if not filename.endswith('.txt'):
+                continue
+
+            art_id = filename[:filename.index('.')]
+            if skip(art_id):
+                continue
+
+            art_data = extract_manual_article_data(
+                os.path.join(self.input_path, filename))
+            yield art_id, art_data, art_data['text']
+
+
+SOURCES = {source.name: source
+           for source in [NYTSource, TechCrunchSource, ManualSource]}
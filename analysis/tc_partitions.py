@@ -0,0 +1,207 @@
+"""
+Reading the TechCrunch scrape without loading all of it.
+
+techcrunch_everything.json is one big JSON object, from the URL of every
+article to its data. iter_techcrunch_json goes through it one article at a
+time, and partition_techcrunch turns it (once) into one JSONL file per month,
+partitions/year/month.jsonl, with a line {"url": ..., "data": ...} per
+article, so that annotating a month only reads that month.
+
+Usage:
+python analysis/tc_partitions.py data/techcrunch_everything.json \
+    data/techcrunch_partitions
+"""
+import argparse
+import collections
+import json
+import os
+import time
+
+
+def get_file_path():
+    return os.path.dirname(os.path.realpath(__file__))
+
+
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_techcrunch_json(path, chunk_size=1 << 20):
+    """
+    Yields (url, data) for every article in the TechCrunch JSON file at path,
+    reading it chunk_size bytes at a time, so that we only ever hold about
+    one article (and one chunk) in memory.
+
+    Like json.load, if a URL is in the file more than once, the last one
+    wins: we go through the file twice, first just to count the URLs, and
+    then yield each one only where it's last (so we also hold all the URLs
+    in memory, but not their data).
+    """
+    repeats = collections.Counter(
+        url for url, _ in _iter_json_items(path, chunk_size))
+    for url, data in _iter_json_items(path, chunk_size):
+        repeats[url] -= 1
+        if repeats[url] == 0:
+            yield url, data
+
+
+def _iter_json_items(path, chunk_size):
+    """
+    Yields (key, value) for every item of the JSON object in the file at
+    path, as they come, without dropping repeated keys.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        state = {'buf': '', 'pos': 0, 'eof': False}
+
+        def fill(size=chunk_size):
+            """
+            Reads another chunk, dropping what we've already gone through.
+            Returns False if there is nothing left to read.
+            """
+            chunk = f.read(size)
+            if len(chunk) == 0:
+                state['eof'] = True
+                return False
+            state['buf'] = state['buf'][state['pos']:] + chunk
+            state['pos'] = 0
+            return True
+
+        def next_char():
+            """
+            Skips whitespace and returns the next character ('' at the end).
+            """
+            while True:
+                buf, pos = state['buf'], state['pos']
+                while pos < len(buf) and buf[pos] in _WHITESPACE:
+                    pos += 1
+                state['pos'] = pos
+                if pos < len(buf):
+                    return buf[pos]
+                if not fill():
+                    return ''
+
+        def expect(char):
+            if next_char() != char:
+                raise ValueError('Expected {} at byte {} of {}'.format(
+                    repr(char), f.tell() - len(state['buf']) + state['pos'],
+                    path))
+            state['pos'] += 1
+
+        def decode():
+            """
+            Decodes the JSON value at the current position, reading more of
+            the file until it is all there.
+            """
+            next_char()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(state['buf'],
+                                                    state['pos'])
+                    # A value that ends where the buffer does might go on in
+                    # the next chunk.
+                    if end < len(state['buf']) or state['eof']:
+                        state['pos'] = end
+                        return value
+                except ValueError:
+                    if state['eof']:
+                        raise
+                # We read at least as much again as we have, so that a value
+                # much bigger than a chunk doesn't take many tries to decode.
+                fill(max(chunk_size, len(state['buf']) - state['pos']))
+
+        expect('{')
+        if next_char() == '}':
+            return
+        while True:
+            url = decode()
+            expect(':')
+            yield url, decode()
+            if next_char() == '}':
+                return
+            expect(',')
+
+
+def get_partition_path(partitions_path, year, month):
+    return os.path.join(partitions_path, str(year),
+                        '{}.jsonl'.format(str(month).zfill(2)))
+
+
+def partition_techcrunch(json_path, partitions_path):
+    """
+    Splits the TechCrunch JSON file into one JSONL file per month of the
+    articles' timestamps. Returns how many articles it wrote.
+    """
+    out_files = {}
+    num_articles = 0
+    try:
+        for url, data in iter_techcrunch_json(json_path):
+            # Timestamps look like 2012-03-01 10:00:00.
+            year, month = int(data['timestamp'][:4]), int(
+                data['timestamp'][5:7])
+            if (year, month) not in out_files:
+                out_fn = get_partition_path(partitions_path, year, month)
+                if not os.path.isdir(os.path.dirname(out_fn)):
+                    os.makedirs(os.path.dirname(out_fn))
+                out_files[(year, month)] = open(out_fn, 'w')
+            out_files[(year, month)].write('{}\n'.format(
+                json.dumps({'url': url, 'data': data})))
+            num_articles += 1
+    finally:
+        for out_f in out_files.itervalues():
+            out_f.close()
+    return num_articles
+
+
+def iter_techcrunch_partitions(partitions_path, year, month=0):
+    """
+    Yields (url, data) for every article of the year (or just the month, if
+    it isn't 0), from the partitions made by partition_techcrunch.
+    """
+    months = [month] if month > 0 else range(1, 13)
+    for month in months:
+        try:
+            with open(get_partition_path(partitions_path, year, month),
+                      'r') as f:
+                for line in f:
+                    article = json.loads(line)
+                    yield article['url'], article['data']
+        except IOError:
+            # No articles that month.
+            continue
+
+
+def iter_techcrunch(path, year, month=0):
+    """
+    Yields (url, data) for every article of the year (or just the month, if
+    it isn't 0). path is either the folder of partitions, or the JSON file
+    (which we then have to go through all of).
+    """
+    if os.path.isdir(path):
+        for article in iter_techcrunch_partitions(path, year, month):
+            yield article
+        return
+
+    prefix = str(year)
+    if month > 0:
+        prefix = '{}-{}'.format(year, str(month).zfill(2))
+    for url, data in iter_techcrunch_json(path):
+        if data['timestamp'].startswith(prefix):
+            yield url, data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Split the TechCrunch scrape into monthly JSONL files')
+    parser.add_argument('json_path', nargs='?',
+                        default=os.path.join(
+                            get_file_path(),
+                            '../data/techcrunch_everything.json'))
+    parser.add_argument('partitions_path', nargs='?',
+                        default=os.path.join(
+                            get_file_path(),
+                            '../data/techcrunch_partitions'))
+    args = parser.parse_args()
+
+    num_articles = partition_techcrunch(args.json_path, args.partitions_path)
+    print time.ctime(), 'Wrote {} articles to {}'.format(
+        num_articles, args.partitions_path)
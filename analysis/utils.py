@@ -42,6 +42,35 @@ CONF_KEYS = {
 # we were using collapsed-ccprocessed-dependencies
 DEPENDENCIES_KEY = 'enhancedPlusPlusDependencies'
 
+# The parts of the CoreNLP annotation that each stage of
+# get_people_mentioned_new reads. We only ask CoreNLP for the annotators
+# needed to produce these (see nlp.utils.get_annotators), so a stage that
+# starts reading another part of the annotation needs to be listed here.
+STAGE_ANNOTATIONS = {
+    # Finding the PERSON mentions and their honorifics.
+    'extract_mentions': ['tokens', 'ner'],
+    'add_corefs_info': ['corefs'],
+    'add_flag_last_name_to_be_inferred': ['tokens', 'lemma', DEPENDENCIES_KEY,
+                                          'corefs'],
+    'add_quotes': ['tokens', 'speaker', 'corefs'],
+    'add_associated_verbs': ['pos', 'lemma', DEPENDENCIES_KEY, 'corefs'],
+    'add_associated_adjectives': ['pos', DEPENDENCIES_KEY, 'corefs'],
+    'mark_companies_as_non_living': [DEPENDENCIES_KEY, 'corefs'],
+}
+
+
+def get_required_annotations(stages=None):
+    """
+    Returns the set of parts of the annotation that the given stages
+    (by default, all of them) read.
+    """
+    if stages is None:
+        stages = STAGE_ANNOTATIONS.keys()
+    required = set()
+    for stage in stages:
+        required.update(STAGE_ANNOTATIONS[stage])
+    return required
+
 
 def get_gender(name, verbose=False):
     """
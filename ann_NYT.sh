@@ -1,17 +1,59 @@
+# Usage: ann_NYT.sh year D|L port [port ...]
+# Annotates all of the year, on every given port at once.
 year=$1
-startmonth=$2
-if [ "$3" == "D" ]
+if [ "$2" == "D" ]
 then
   path=/dfs/scratch0/viswa/NYT_temp/
 else
   path=/lfs/madmax6/0/viswa/LDC2008T19_The-New-York-Times-Annotated-Corpus/data/data2/
 fi
-port=$4
+shift 2
+ports="$@"
+# The path can have the corpus extracted (year/month/day/*.xml) or just the
+# LDC archives (year/month.tgz), which annotate_NYT.py reads directly.
 
 echo $year
-echo $startmonth
 echo $path
-for i in `seq $startmonth 4 12`; do
-  echo $i
-  python2.7 analysis/annotate_NYT.py $year $i  --port $port --path $path
-done
+echo $ports
+
+# With START_SERVERS=1, we start (and warm up) our own CoreNLP servers on the
+# ports once, rather than for every month, and stop them when we're done.
+if [ -n "$START_SERVERS" ]
+then
+  ready=/tmp/corenlp_fleet_$$.ready
+  python2.7 nlp/fleet.py --ports $ports --heap ${SERVER_HEAP:-4g} \
+    --ready_file $ready &
+  fleet_pid=$!
+  trap "kill $fleet_pid" EXIT
+  while [ ! -e $ready ]; do
+    kill -0 $fleet_pid || exit 1
+    sleep 5
+  done
+fi
+
+# Rather than one process per port, each with its own months, one process
+# sends the articles of the whole year to all the servers, longest first,
+# with WORKERS_PER_SERVER articles in flight per server, so that the servers
+# finish at about the same time.
+#
+# With LEASE_DIR set (to a folder on the shared filesystem), the months are
+# shared out between all the machines running this with the same LEASE_DIR,
+# which can be started and stopped at any time; see analysis/coordination.py.
+workers=$(( ${WORKERS_PER_SERVER:-4} * $# ))
+lease_args=""
+if [ -n "$LEASE_DIR" ]
+then
+  lease_args="--lease_dir $LEASE_DIR"
+fi
+# Corrections and reprinted wire copy are only annotated once (--dedup),
+# against the articles kept in the dedup index (one per machine, as the
+# machines write theirs at the same time), so that the years we've already
+# done count too.
+dedup_index=${DEDUP_INDEX:-annotated/NYT/dedup_index_$(hostname).tsv}
+mkdir -p $(dirname $dedup_index)
+# The progress of the run is kept in the status file; to keep an eye on it:
+# python2.7 nlp/progress.py /tmp/ann_NYT_<year>_status.json --watch 10
+status_file=${STATUS_FILE:-/tmp/ann_NYT_${year}_status.json}
+python2.7 analysis/annotate_NYT.py $year `seq 1 12` --port $ports \
+  --path $path --longest_first --max_in_flight $workers --dedup \
+  --dedup_index $dedup_index $lease_args --status_file $status_file
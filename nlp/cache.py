@@ -0,0 +1,118 @@
+"""
+An on-disk cache of CoreNLP annotations.
+
+Annotations are stored one per file, gzipped JSON, under a key which is the
+SHA-1 of the text that was sent to the server, the annotators that were run,
+the output format and the CoreNLP version. So the same text annotated the same
+way is only ever sent to the server once, however many times we re-run a
+script over the manual set or the same text is submitted to the demo.
+"""
+import errno
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+
+def _get_umask():
+    # The only way to read the umask is to set it.
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+_UMASK = _get_umask()
+
+
+def set_default_permissions(path):
+    """
+    Gives path the permissions that open() would have given a new file.
+    Files from mkstemp are only readable by us, which would keep others
+    that share the folder (e.g. the webapp, running as another user) out.
+    """
+    os.chmod(path, 0o666 & ~_UMASK)
+
+
+# The version of CoreNLP our servers run. It is part of the cache key, so that
+# upgrading CoreNLP doesn't serve stale annotations: set CORENLP_VERSION in the
+# environment when running against a different version.
+CORENLP_VERSION = os.environ.get('CORENLP_VERSION', '3.8.0')
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'GENDERMEME_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                 '../annotated/corenlp_cache'))
+
+
+class AnnotationCache(object):
+    """
+    A directory of cached annotations. Files are spread over 256
+    subdirectories (by the first two hex digits of the key), so that no
+    single directory gets too big.
+
+    Writes go to a temporary file which is then renamed into place, so
+    several processes can share one cache, and a crash never leaves a
+    half-written entry behind.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR,
+                 corenlp_version=CORENLP_VERSION):
+        self.root = root
+        self.corenlp_version = corenlp_version
+
+    def key(self, text, annotators, output_format='json'):
+        """
+        text should already be normalized the way annotate_corenlp does it,
+        i.e. be exactly what we send to the server.
+        """
+        sha = hashlib.sha1()
+        sha.update(self.corenlp_version)
+        sha.update('\0')
+        sha.update(','.join(annotators))
+        sha.update('\0')
+        sha.update(output_format)
+        sha.update('\0')
+        sha.update(text)
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + '.json.gz')
+
+    def get(self, key):
+        """
+        Returns the cached annotation, or None if there isn't one.
+        """
+        try:
+            with gzip.open(self._path(key), 'rb') as f:
+                return json.loads(f.read())
+        except IOError:
+            return None
+
+    def put(self, key, ann):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as raw_f:
+                with gzip.GzipFile(fileobj=raw_f, mode='wb') as f:
+                    f.write(json.dumps(ann))
+            set_default_permissions(tmp_path)
+            os.rename(tmp_path, path)
+        except:
+            os.remove(tmp_path)
+            raise
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = AnnotationCache()
+    return _default_cache
@@ -0,0 +1,296 @@
+"""
+Splitting long texts into chunks, and stitching the CoreNLP annotations of
+the chunks back into one annotation of the whole text.
+
+Very long articles hit the server's timeout (and, when they don't, take far
+longer than the rest), so we can annotate them a few paragraphs at a time,
+in parallel, and merge the results. The merged annotation looks like the
+server had annotated the whole text at once: sentences are renumbered,
+character offsets refer to the whole text, and coref ids (and the quote
+speakers that point at them) are unique across chunks. Since CoreNLP never
+saw the chunks together, coref chains in different chunks that are about
+the same person are merged by matching their names.
+
+It also does the opposite, for short texts, where the cost of a request is
+mostly overhead: join_batch joins several documents into one text, with a
+boundary marker between them, and split_batch_annotation splits the
+annotation of that text back into one annotation per document, as if each
+had been annotated on its own.
+"""
+
+
+def split_into_chunks(text, max_chunk_chars):
+    """
+    Splits text at paragraph boundaries ('\n') into chunks of at most
+    max_chunk_chars characters (a single paragraph longer than that gets a
+    chunk of its own). Returns a list of (offset, chunk_text) pairs, where
+    the chunks are consecutive slices of text, and offset is where the chunk
+    starts in text.
+    """
+    chunks = []
+    chunk_start = 0
+    # Where the last paragraph we've seen ends (just after its '\n').
+    para_end = 0
+    while para_end < len(text):
+        next_newline = text.find('\n', para_end)
+        next_para_end = len(text) if next_newline == -1 else next_newline + 1
+        if next_para_end - chunk_start > max_chunk_chars and \
+                para_end > chunk_start:
+            chunks.append((chunk_start, text[chunk_start:para_end]))
+            chunk_start = para_end
+        para_end = next_para_end
+    if chunk_start < len(text) or len(chunks) == 0:
+        chunks.append((chunk_start, text[chunk_start:]))
+    return chunks
+
+
+def _shift_speaker(speaker, id_shift):
+    # Quoted tokens have the id of the speaker's coref mention as their
+    # speaker; other tokens have things like 'PER0', which we leave alone.
+    if speaker.isdigit():
+        return unicode(int(speaker) + id_shift)
+    return speaker
+
+
+def _shift_annotation(ann, char_shift, sent_shift, token_shift, id_shift,
+                      quote_shift):
+    """
+    Shifts (in place) all the document-level numbering in one chunk's
+    annotation, so that it can be put after the chunks before it.
+    Returns the largest coref id in the chunk after shifting.
+    """
+    for sentence in ann['sentences']:
+        sentence['index'] += sent_shift
+        for token in sentence['tokens']:
+            token['characterOffsetBegin'] += char_shift
+            token['characterOffsetEnd'] += char_shift
+            if 'speaker' in token:
+                token['speaker'] = _shift_speaker(token['speaker'], id_shift)
+
+    quote_key_shifts = [('id', quote_shift),
+                        ('beginIndex', char_shift), ('endIndex', char_shift),
+                        ('beginToken', token_shift), ('endToken', token_shift),
+                        ('beginSentence', sent_shift),
+                        ('endSentence', sent_shift)]
+    for quote in ann.get('quotes', []):
+        for key, shift in quote_key_shifts:
+            if key in quote:
+                quote[key] += shift
+
+    max_id = id_shift
+    shifted_corefs = {}
+    for chain_id, chain in ann['corefs'].iteritems():
+        new_chain_id = int(chain_id) + id_shift
+        max_id = max(max_id, new_chain_id)
+        for mention in chain:
+            mention['id'] += id_shift
+            mention['sentNum'] += sent_shift
+            if 'position' in mention:
+                mention['position'][0] += sent_shift
+            max_id = max(max_id, mention['id'])
+        shifted_corefs[unicode(new_chain_id)] = chain
+    ann['corefs'] = shifted_corefs
+    return max_id
+
+
+def _representative_name(chain):
+    """
+    Returns the text of the chain's representative mention if it is a
+    proper name, and None otherwise.
+    """
+    for mention in chain:
+        if mention.get('isRepresentativeMention'):
+            if mention['type'] == 'PROPER':
+                return mention['text']
+            return None
+    return None
+
+
+def _merge_chains_by_name(corefs, chain_to_chunk):
+    """
+    Merges (in place) coref chains from different chunks whose
+    representative mentions are the same name, or where a later chunk only
+    uses the last name of exactly one person named in an earlier chunk
+    (like 'Smith' after 'Jane Smith'). Chains from the same chunk are never
+    merged: CoreNLP has already decided about those.
+    """
+    # Maps a full name to the id of the chain we merge other chains into,
+    # and a last name to the full names it could be short for.
+    name_to_chain = {}
+    last_name_to_names = {}
+
+    for chain_id in sorted(corefs, key=int):
+        name = _representative_name(corefs[chain_id])
+        if name is None:
+            continue
+
+        target = name_to_chain.get(name)
+        if target is None and len(name.split()) == 1:
+            full_names = last_name_to_names.get(name, set())
+            if len(full_names) == 1:
+                target = name_to_chain[next(iter(full_names))]
+
+        if target is not None and \
+                chain_to_chunk[target] != chain_to_chunk[chain_id]:
+            for mention in corefs[chain_id]:
+                mention['isRepresentativeMention'] = False
+            corefs[target].extend(corefs.pop(chain_id))
+            continue
+
+        if name not in name_to_chain:
+            name_to_chain[name] = chain_id
+            if len(name.split()) > 1:
+                last_name_to_names.setdefault(name.split()[-1],
+                                              set()).add(name)
+
+
+def merge_annotations(anns, offsets):
+    """
+    Given the annotations of consecutive chunks of a text, and the offset of
+    each chunk in the text (as returned by split_into_chunks), returns one
+    annotation of the whole text. The chunk annotations are modified in
+    place, and their sentences and chains reused.
+    """
+    merged = {'sentences': [], 'corefs': {}}
+    chain_to_chunk = {}
+    num_tokens = 0
+    id_shift = 0
+    for chunk_i, (ann, offset) in enumerate(zip(anns, offsets)):
+        next_id_shift = _shift_annotation(ann, offset,
+                                          len(merged['sentences']),
+                                          num_tokens, id_shift,
+                                          len(merged.get('quotes', [])))
+        merged['sentences'].extend(ann['sentences'])
+        merged['corefs'].update(ann['corefs'])
+        if 'quotes' in ann:
+            merged.setdefault('quotes', []).extend(ann['quotes'])
+        for chain_id in ann['corefs']:
+            chain_to_chunk[chain_id] = chunk_i
+        num_tokens += sum(len(s['tokens']) for s in ann['sentences'])
+        id_shift = next_id_shift
+
+    _merge_chains_by_name(merged['corefs'], chain_to_chunk)
+    return merged
+
+
+# The marker we put between documents in a batch. The blank lines around it
+# make CoreNLP's sentence splitter (whose ssplit.newlineIsSentenceBreak is
+# 'two' by default) put it in a sentence of its own.
+BATCH_BOUNDARY = 'GendermemeDocumentBoundary'
+_BATCH_SEPARATOR = '\n\n{}.\n\n'.format(BATCH_BOUNDARY)
+
+
+def join_batch(texts):
+    """
+    Joins texts into one, with boundary markers between them. Returns the
+    joined text, and the offset of each text in it.
+    """
+    offsets = []
+    position = 0
+    for i, text in enumerate(texts):
+        if i > 0:
+            position += len(_BATCH_SEPARATOR)
+        offsets.append(position)
+        position += len(text)
+    return _BATCH_SEPARATOR.join(texts), offsets
+
+
+def _is_boundary(sentence):
+    tokens = sentence['tokens']
+    return len(tokens) > 0 and tokens[0]['word'] == BATCH_BOUNDARY
+
+
+def split_batch_annotation(ann, offsets):
+    """
+    Given the annotation of a text made by join_batch, and the offsets it
+    returned, returns a list with the annotation of each document, with
+    sentences, character offsets and coref ids renumbered as if it had been
+    annotated on its own. The annotation is modified in place.
+
+    CoreNLP may put mentions from different documents in one coref chain (or
+    make someone in one document the speaker of a quote in another), which
+    could never happen if the documents were annotated separately. Such
+    documents get None instead of an annotation, and need to be annotated on
+    their own.
+
+    Raises ValueError if the boundary markers didn't come out as sentences of
+    their own, so that the documents can't be told apart.
+    """
+    # The sentences of each document, and which document each (1-based)
+    # sentence number is in (None for the boundaries).
+    doc_sentences = [[]]
+    sent_num_to_doc = {}
+    # The 0-based index of each document's first sentence, and how many
+    # tokens there are before it.
+    first_sentence = [0]
+    tokens_before = [0]
+    num_tokens = 0
+    for sentence in ann['sentences']:
+        sent_num = sentence['index'] + 1
+        num_tokens += len(sentence['tokens'])
+        if _is_boundary(sentence):
+            sent_num_to_doc[sent_num] = None
+            doc_sentences.append([])
+            first_sentence.append(sentence['index'] + 1)
+            tokens_before.append(num_tokens)
+        else:
+            sent_num_to_doc[sent_num] = len(doc_sentences) - 1
+            doc_sentences[-1].append(sentence)
+
+    if len(doc_sentences) != len(offsets):
+        raise ValueError('Found {} documents in a batch of {}'.format(
+            len(doc_sentences), len(offsets)))
+
+    rejected = set()
+    doc_corefs = [{} for _ in offsets]
+    mention_to_doc = {}
+    for chain_id, chain in ann['corefs'].iteritems():
+        docs = set(sent_num_to_doc[m['sentNum']] for m in chain)
+        for mention in chain:
+            mention_to_doc[mention['id']] = sent_num_to_doc[mention['sentNum']]
+        if len(docs) > 1 or None in docs:
+            rejected.update(d for d in docs if d is not None)
+        else:
+            doc_corefs[docs.pop()][chain_id] = chain
+
+    for doc_i, sentences in enumerate(doc_sentences):
+        for sentence in sentences:
+            for token in sentence['tokens']:
+                speaker = token.get('speaker', '')
+                if speaker.isdigit() and \
+                        mention_to_doc.get(int(speaker), doc_i) != doc_i:
+                    rejected.add(doc_i)
+
+    doc_quotes = [[] for _ in offsets]
+    for quote in ann.get('quotes', []):
+        doc_i = sent_num_to_doc.get(quote.get('beginSentence', -1) + 1)
+        if doc_i is not None:
+            doc_quotes[doc_i].append(quote)
+
+    doc_anns = []
+    for doc_i, offset in enumerate(offsets):
+        if doc_i in rejected:
+            doc_anns.append(None)
+            continue
+        sentences = doc_sentences[doc_i]
+        # The whitespace around the boundary marker isn't part of the
+        # document.
+        if len(sentences) > 0:
+            sentences[0]['tokens'][0]['before'] = ''
+            sentences[-1]['tokens'][-1]['after'] = ''
+        doc_ann = {'sentences': sentences, 'corefs': doc_corefs[doc_i]}
+        if 'quotes' in ann:
+            doc_ann['quotes'] = doc_quotes[doc_i]
+
+        # Shift the coref ids so that they start at 1, and the quote ids so
+        # that they start at 0.
+        ids = [int(chain_id) for chain_id in doc_ann['corefs']]
+        ids.extend(m['id'] for chain in doc_ann['corefs'].itervalues()
+                   for m in chain)
+        id_base = min(ids) - 1 if len(ids) > 0 else 0
+        quote_base = min([q['id'] for q in doc_quotes[doc_i]] or [0])
+
+        _shift_annotation(doc_ann, -offset, -first_sentence[doc_i],
+                          -tokens_before[doc_i], -id_base, -quote_base)
+        doc_anns.append(doc_ann)
+    return doc_anns
@@ -0,0 +1,123 @@
+"""
+Decoding of CoreNLP's serialized (protocol buffer) output.
+
+The server's JSON for a long article with parse, depparse, dcoref and openie
+output runs to hundreds of KB, most of which we never look at. Asking for
+outputFormat 'serialized' instead gets us a much smaller binary Document,
+and decode_document builds only the parts of the JSON view that the analysis
+code reads: the 'sentences' (tokens and enhancedPlusPlusDependencies) and the
+'corefs', keyed and shaped exactly as in the JSON.
+
+Needs the corenlp-protobuf package (pip install corenlp-protobuf).
+"""
+try:
+    from corenlp_protobuf import Document, parseFromDelimitedString
+except ImportError:
+    Document = None
+
+# The properties that make the server send protocol buffers.
+PROTOBUF_PROPERTIES = {
+    'outputFormat': 'serialized',
+    'serializer':
+        'edu.stanford.nlp.pipeline.ProtobufAnnotationSerializer'
+}
+
+
+def _decode_token(token, index):
+    return {
+        'index': index,
+        'word': token.word,
+        'originalText': token.originalText,
+        'lemma': token.lemma,
+        'pos': token.pos,
+        'ner': token.ner,
+        'speaker': token.speaker,
+        'before': token.before,
+        'after': token.after,
+        'characterOffsetBegin': token.beginChar,
+        'characterOffsetEnd': token.endChar
+    }
+
+
+def _decode_dependencies(graph, tokens):
+    """
+    Turns a DependencyGraph into the list of
+    {'dep', 'governor', 'governorGloss', 'dependent', 'dependentGloss'}
+    dicts the JSON has, including the ROOT entries.
+    """
+    deps = []
+    for root in graph.root:
+        deps.append({
+            'dep': 'ROOT',
+            'governor': 0,
+            'governorGloss': 'ROOT',
+            'dependent': int(root),
+            'dependentGloss': tokens[root - 1]['word']
+        })
+
+    for edge in sorted(graph.edge, key=lambda e: (e.target, e.source)):
+        deps.append({
+            'dep': edge.dep,
+            'governor': edge.source,
+            'governorGloss': tokens[edge.source - 1]['word'],
+            'dependent': edge.target,
+            'dependentGloss': tokens[edge.target - 1]['word']
+        })
+    return deps
+
+
+def _decode_coref_chain(chain, sentences):
+    """
+    Returns the list of mention dicts in this chain, as in the JSON's
+    'corefs'. Sentence and token numbers become 1-based, like in the JSON.
+    """
+    mentions = []
+    for i, mention in enumerate(chain.mention):
+        tokens = sentences[mention.sentenceIndex]['tokens']
+        sent_num = mention.sentenceIndex + 1
+        mentions.append({
+            'id': mention.mentionID,
+            'text': ' '.join(t['word'] for t in
+                             tokens[mention.beginIndex:mention.endIndex]),
+            'type': mention.mentionType,
+            'number': mention.number,
+            'gender': mention.gender,
+            'animacy': mention.animacy,
+            'startIndex': mention.beginIndex + 1,
+            'endIndex': mention.endIndex + 1,
+            'headIndex': mention.headIndex + 1,
+            'sentNum': sent_num,
+            'position': [sent_num, mention.position],
+            'isRepresentativeMention': i == chain.representative
+        })
+    return mentions
+
+
+def decode_document(buf):
+    """
+    Given the bytes the server sent back for a 'serialized' request, returns
+    a dict with the 'sentences' and 'corefs' keys, in the same shape as the
+    JSON output, so that it can be used anywhere a JSON annotation is.
+    """
+    if Document is None:
+        raise ImportError('Decoding protobuf output needs corenlp-protobuf '
+                          '(pip install corenlp-protobuf)')
+    doc = Document()
+    parseFromDelimitedString(doc, buf)
+
+    sentences = []
+    for sentence in doc.sentence:
+        tokens = [_decode_token(token, i + 1)
+                  for i, token in enumerate(sentence.token)]
+        decoded = {'index': sentence.sentenceIndex, 'tokens': tokens}
+        if sentence.HasField('enhancedPlusPlusDependencies'):
+            decoded['enhancedPlusPlusDependencies'] = _decode_dependencies(
+                sentence.enhancedPlusPlusDependencies, tokens)
+        sentences.append(decoded)
+
+    corefs = {}
+    for chain in doc.corefChain:
+        corefs[unicode(chain.chainID)] = _decode_coref_chain(chain,
+                                                              sentences)
+
+    return {'sentences': sentences, 'corefs': corefs}
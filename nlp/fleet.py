@@ -0,0 +1,306 @@
+"""
+Starting, warming up, watching and stopping local CoreNLP servers.
+
+Loading the CoreNLP models takes minutes, and is only done when the first
+request that needs them comes in. So after starting each server, we send it a
+small request that uses all the annotators we need, and only call it ready
+once that has come back. While the fleet is running, a background thread
+restarts (and warms up again) any server whose process has died, or which
+has stopped answering: one that hasn't answered a request (see
+nlp/telemetry.py) for a while, and then misses max_ping_failures pings in
+a row. (A busy server can be slow to answer a ping, since the ping waits
+for the same threads as the annotations, so one missed ping isn't enough.)
+
+You need to have CoreNLP downloaded, with CORENLP_HOME (or corenlp_home)
+pointing at the folder with its jars, and java on the PATH.
+
+Usage (runs until interrupted):
+python nlp/fleet.py --ports 9000 9001 --heap 6g --threads 4
+"""
+import argparse
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from telemetry import get_telemetry
+from utils import ANNOTATOR_ORDER, CoreNLPClient
+
+
+CORENLP_HOME = os.environ.get('CORENLP_HOME', os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), '../stanford-corenlp'))
+
+WARM_UP_TEXT = ('Ann Smith met her husband Jim at the office. '
+                '"It went well," Mr. Smith said.')
+
+# By default, we warm up everything but openie.
+DEFAULT_WARM_UP_ANNOTATORS = ANNOTATOR_ORDER[:ANNOTATOR_ORDER.index('natlog')]
+
+
+class CoreNLPServer(object):
+    """
+    One CoreNLP server process, on a given port, with its own heap size
+    (like '4g'), number of threads, and request timeout (in seconds).
+    """
+
+    def __init__(self, port, heap='4g', threads=4, timeout=60.,
+                 corenlp_home=CORENLP_HOME, log_dir=None):
+        self.port = port
+        self.heap = heap
+        self.threads = threads
+        self.timeout = timeout
+        self.corenlp_home = corenlp_home
+        self.log_dir = log_dir
+        self.process = None
+        self.restarts = 0
+        # Pings missed in a row.
+        self.ping_failures = 0
+        self._client = CoreNLPClient('http://localhost:{}'.format(port),
+                                     pool_size=1)
+
+    def command(self):
+        return ['java', '-mx{}'.format(self.heap),
+                '-cp', os.path.join(self.corenlp_home, '*'),
+                'edu.stanford.nlp.pipeline.StanfordCoreNLPServer',
+                '-port', str(self.port),
+                '-threads', str(self.threads),
+                '-timeout', str(int(self.timeout * 1000))]
+
+    def start(self):
+        log = open(os.devnull, 'w')
+        if self.log_dir is not None:
+            log = open(os.path.join(
+                self.log_dir, 'corenlp_{}.log'.format(self.port)), 'a')
+        self.process = subprocess.Popen(self.command(), stdout=log,
+                                        stderr=subprocess.STDOUT)
+        log.close()
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def url(self):
+        return self._client.url
+
+    def ping(self, timeout=5):
+        return self._client.ping(timeout=timeout)
+
+    def warm_up(self, annotators=DEFAULT_WARM_UP_ANNOTATORS,
+                max_wait=900.):
+        """
+        Waits until the server is up, and then sends it a request with all
+        the annotators, so that it loads their models. Returns True once
+        that request is answered, and False if the process dies or it takes
+        longer than max_wait seconds.
+        """
+        deadline = time.time() + max_wait
+        while time.time() < deadline:
+            if not self.is_running():
+                return False
+            if self._client.ping(timeout=1):
+                break
+            time.sleep(1)
+
+        while time.time() < deadline:
+            if not self.is_running():
+                return False
+            try:
+                ann = self._client.annotate(WARM_UP_TEXT, properties={
+                    'annotators': ','.join(annotators),
+                    'outputFormat': 'json'
+                })
+                if type(ann) is dict:
+                    return True
+            except Exception:
+                pass
+            time.sleep(5)
+        return False
+
+    def stop(self, grace=10.):
+        """
+        Asks the server to stop, and kills it if it hasn't after grace
+        seconds.
+        """
+        if not self.is_running():
+            return
+        self.process.terminate()
+        deadline = time.time() + grace
+        while self.process.poll() is None and time.time() < deadline:
+            time.sleep(0.1)
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+class CoreNLPFleet(object):
+    """
+    A set of local CoreNLP servers, one per port, which are started and
+    warmed up together, restarted if they crash or hang, and stopped
+    together. Can be used as a context manager:
+
+    with CoreNLPFleet([9000, 9001], heap='6g') as fleet:
+        client = CoreNLPDispatcher(fleet.ports)
+        ...
+    """
+
+    def __init__(self, ports, heap='4g', threads=4, timeout=60.,
+                 corenlp_home=CORENLP_HOME, log_dir=None,
+                 annotators=DEFAULT_WARM_UP_ANNOTATORS, check_every=30.,
+                 max_restarts=10, ping_timeout=30., max_ping_failures=3):
+        """
+        Arguments:
+            ports: a list of ports, one per server.
+            heap, threads, timeout: for each server (see CoreNLPServer).
+            annotators: the annotators to warm the servers up with.
+            check_every: how often (in seconds) to check on the servers.
+            max_restarts: how often to restart a server before giving up.
+            ping_timeout, max_ping_failures: a server that is still
+            running is restarted once it has missed max_ping_failures
+            pings in a row (each of which waits ping_timeout seconds),
+            and not answered any other request in the meantime.
+        """
+        self.ports = list(ports)
+        self.annotators = annotators
+        self.check_every = check_every
+        self.max_restarts = max_restarts
+        self.ping_timeout = ping_timeout
+        self.max_ping_failures = max_ping_failures
+        self.servers = [CoreNLPServer(port, heap=heap, threads=threads,
+                                      timeout=timeout,
+                                      corenlp_home=corenlp_home,
+                                      log_dir=log_dir)
+                        for port in self.ports]
+        self._stopping = threading.Event()
+        self._monitor = None
+
+    def _start_and_warm_up(self, servers):
+        """
+        Starts the given servers, and warms them up in parallel. Returns the
+        ports of the ones that didn't come up.
+        """
+        for server in servers:
+            server.start()
+        failed = []
+
+        def warm_up(server):
+            if not server.warm_up(self.annotators):
+                failed.append(server.port)
+
+        threads = [threading.Thread(target=warm_up, args=(server,))
+                   for server in servers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return failed
+
+    def start(self):
+        """
+        Starts all the servers, and returns once they have all warmed up.
+        Raises RuntimeError (after stopping all of them) if any of them
+        didn't.
+        """
+        print time.ctime(), 'Starting CoreNLP servers on ports', self.ports
+        failed = self._start_and_warm_up(self.servers)
+        if len(failed) > 0:
+            self.stop()
+            raise RuntimeError(
+                'CoreNLP servers on ports {} did not start'.format(failed))
+        print time.ctime(), 'CoreNLP servers ready'
+
+        self._monitor = threading.Thread(target=self._watch)
+        self._monitor.daemon = True
+        self._monitor.start()
+
+    def _needs_restart(self, server):
+        """
+        Whether the server's process has died, or it has stopped answering.
+        """
+        if not server.is_running():
+            return True
+        last_answer = get_telemetry().last_answer(server.url())
+        if (last_answer is not None and
+                time.time() - last_answer < self.check_every):
+            # It answered one of our requests since we last checked.
+            server.ping_failures = 0
+            return False
+        if server.ping(timeout=self.ping_timeout):
+            server.ping_failures = 0
+            return False
+        server.ping_failures += 1
+        print time.ctime(), 'CoreNLP server on port', server.port, \
+            'missed a ping ({} in a row)'.format(server.ping_failures)
+        return server.ping_failures >= self.max_ping_failures
+
+    def _watch(self):
+        while not self._stopping.wait(self.check_every):
+            for server in self.servers:
+                if self._stopping.is_set():
+                    return
+                if (server.restarts >= self.max_restarts or
+                        not self._needs_restart(server)):
+                    continue
+                print time.ctime(), 'Restarting CoreNLP server on port', \
+                    server.port
+                server.stop()
+                server.restarts += 1
+                server.ping_failures = 0
+                self._start_and_warm_up([server])
+
+    def stop(self):
+        self._stopping.set()
+        for server in self.servers:
+            server.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Run a fleet of local CoreNLP servers')
+    parser.add_argument('--ports', type=int, nargs='+', default=[9000])
+    parser.add_argument('--heap', default='4g',
+                        help='Java heap size for each server.')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='Threads for each server.')
+    parser.add_argument('--timeout', type=float, default=60.,
+                        help='Seconds before a server gives up on a request.')
+    parser.add_argument('--ping_timeout', type=float, default=30.,
+                        help='Seconds to wait for a server to answer a '
+                             'ping.')
+    parser.add_argument('--max_ping_failures', type=int, default=3,
+                        help='Restart a server that misses this many pings '
+                             'in a row.')
+    parser.add_argument('--corenlp_home', default=CORENLP_HOME)
+    parser.add_argument('--log_dir', default=None)
+    parser.add_argument('--ready_file', default=None,
+                        help='A file to create once the servers are ready.')
+    args = parser.parse_args()
+
+    fleet = CoreNLPFleet(args.ports, heap=args.heap, threads=args.threads,
+                         timeout=args.timeout, corenlp_home=args.corenlp_home,
+                         log_dir=args.log_dir, ping_timeout=args.ping_timeout,
+                         max_ping_failures=args.max_ping_failures)
+
+    # Stop the servers when we're killed, as well as on Ctrl-C.
+    def handle_sigterm(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    try:
+        fleet.start()
+        if args.ready_file is not None:
+            open(args.ready_file, 'w').close()
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fleet.stop()
+        if args.ready_file is not None and os.path.exists(args.ready_file):
+            os.remove(args.ready_file)
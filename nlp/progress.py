@@ -0,0 +1,331 @@
+"""
+Progress of an annotation run: how many articles of each shard (e.g. a month
+of the NYT) are done, how fast they're going (articles and characters a
+second), how many fail, and when each shard and the whole run should be
+done.
+
+The drivers (see analysis/annotate_corpus.py) record every article as it's
+done, and print a line of progress now and then. Given a status file, a
+background thread also rewrites it (atomically, as JSON) every few seconds,
+with the progress and the state of every CoreNLP server, so that another
+process can keep an eye on the run:
+python nlp/progress.py status.json --watch 10
+
+A run whose status file hasn't been updated for a while has died; one that
+hasn't finished an article for a while, or with a server that hasn't
+answered a request for a while, is stuck.
+
+The rates (and so the ETAs) are over the last RATE_WINDOW_SECONDS. The ETAs
+go by articles, so when the longest articles go first (--longest_first),
+they start out pessimistic.
+"""
+import argparse
+import collections
+import json
+import os
+import tempfile
+import threading
+import time
+
+from cache import set_default_permissions
+from telemetry import get_telemetry
+
+
+RATE_WINDOW_SECONDS = 300.
+
+
+def format_duration(seconds):
+    """
+    Like 1:02:03, or - if we don't know.
+    """
+    if seconds is None:
+        return '-'
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+
+class _Counts(object):
+    """
+    Running totals of the articles done (of one shard, or all of them), and
+    those done in the last window_seconds, for the rates.
+    """
+
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+        self.articles = 0
+        self.chars = 0
+        self.failures = 0
+        self.duplicates = 0
+        self.started = None
+        self.last_done = None
+        # (time, chars, failed) of the recent articles.
+        self._recent = collections.deque()
+
+    def add(self, now, chars, failed, duplicate):
+        if self.started is None:
+            self.started = now
+        self.articles += 1
+        self.chars += chars
+        self.failures += int(failed)
+        self.duplicates += int(duplicate)
+        self.last_done = now
+        self._recent.append((now, chars, failed))
+
+    def rates(self, now):
+        """
+        Returns articles a second, characters a second and the fraction that
+        failed, over the last window_seconds (or since we started, if that's
+        less).
+        """
+        while (len(self._recent) > 0 and
+               self._recent[0][0] < now - self.window_seconds):
+            self._recent.popleft()
+        if self.started is None:
+            return 0., 0., None
+        seconds = max(min(self.window_seconds, now - self.started), 1e-9)
+        num_failed = sum(int(failed) for _, _, failed in self._recent)
+        error_rate = None
+        if len(self._recent) > 0:
+            error_rate = num_failed / float(len(self._recent))
+        return (len(self._recent) / seconds,
+                sum(chars for _, chars, _ in self._recent) / seconds,
+                error_rate)
+
+    def summary(self, now, expected=None):
+        articles_per_second, chars_per_second, recent_error_rate = (
+            self.rates(now))
+        annotated = self.articles - self.duplicates
+        summary = {
+            'articles': self.articles,
+            'expected_articles': expected,
+            'chars': self.chars,
+            'failures': self.failures,
+            'duplicates': self.duplicates,
+            'error_rate': self.failures / float(max(annotated, 1)),
+            'recent_error_rate': recent_error_rate,
+            'articles_per_second': articles_per_second,
+            'chars_per_second': chars_per_second,
+            'seconds_since_last_article': (
+                None if self.last_done is None else now - self.last_done),
+            'eta_seconds': None,
+        }
+        if expected is not None:
+            remaining = max(expected - self.articles, 0)
+            if remaining == 0:
+                summary['eta_seconds'] = 0.
+            elif articles_per_second > 0:
+                summary['eta_seconds'] = remaining / articles_per_second
+        return summary
+
+
+class AnnotationProgress(object):
+    """
+    The progress of a run, shard by shard. Shards are added with add_shard,
+    told how many articles they'll have with expect (if we know), and every
+    article that's done (annotated, failed, or found to be a duplicate) is
+    recorded with record. client, if given, is the CoreNLPDispatcher, for
+    the state of the servers. Safe to share between threads.
+    """
+
+    def __init__(self, client=None, window_seconds=RATE_WINDOW_SECONDS):
+        self.client = client
+        self.window_seconds = window_seconds
+        self.started = time.time()
+        self._total = _Counts(window_seconds)
+        self._shards = collections.OrderedDict()
+        self._expected = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._status_file = None
+
+    def add_shard(self, shard):
+        with self._lock:
+            if shard not in self._shards:
+                self._shards[shard] = _Counts(self.window_seconds)
+
+    def expect(self, shard, articles):
+        """
+        The shard has this many articles to do in this run (including those
+        already done).
+        """
+        self.add_shard(shard)
+        with self._lock:
+            self._expected[shard] = articles
+
+    def record(self, shard, chars, failed=False, duplicate=False):
+        self.add_shard(shard)
+        now = time.time()
+        with self._lock:
+            self._shards[shard].add(now, chars, failed, duplicate)
+            self._total.add(now, chars, failed, duplicate)
+
+    def _servers(self, now):
+        """
+        The state of each server: requests in flight, consecutive failures
+        and whether it's in rotation (from the dispatcher), and how many
+        requests it has done, how fast, and how long ago the last one
+        finished (from the telemetry).
+        """
+        servers = collections.OrderedDict()
+        if self.client is not None and hasattr(self.client, 'status'):
+            for url, in_flight, failures, in_rotation in self.client.status():
+                servers[url] = {'url': url, 'in_flight': in_flight,
+                                'consecutive_failures': failures,
+                                'in_rotation': in_rotation}
+        for stats in get_telemetry().summary():
+            server = servers.setdefault(stats['url'], {'url': stats['url']})
+            server['requests'] = server.get('requests', 0) + stats['requests']
+            server['failures'] = server.get('failures', 0) + stats['failures']
+            server['timeouts'] = server.get('timeouts', 0) + stats['timeouts']
+            server['chars_per_second'] = max(
+                server.get('chars_per_second', 0.), stats['chars_per_second'])
+            if stats['last_request'] is not None:
+                server['seconds_since_last_request'] = min(
+                    server.get('seconds_since_last_request', float('inf')),
+                    now - stats['last_request'])
+        return servers.values()
+
+    def summary(self, finished=False):
+        now = time.time()
+        with self._lock:
+            shards = []
+            eta_seconds = 0.
+            for shard, counts in self._shards.iteritems():
+                summary = counts.summary(now, self._expected.get(shard))
+                summary['shard'] = shard
+                shards.append(summary)
+                if summary['expected_articles'] is None:
+                    eta_seconds = None
+            expected = None
+            if eta_seconds is not None and len(shards) > 0:
+                expected = sum(shard['expected_articles'] for shard in shards)
+            summary = self._total.summary(now, expected)
+        summary.update({
+            'started': self.started,
+            'updated': now,
+            'elapsed_seconds': now - self.started,
+            'finished': finished,
+            'shards': shards,
+            'servers': self._servers(now),
+        })
+        return summary
+
+    def format_line(self):
+        """
+        One line of progress for the log.
+        """
+        return format_progress_line(self.summary())
+
+    def dump(self, path, finished=False):
+        """
+        Writes the summary to path as JSON, replacing it atomically (like
+        AnnotationTelemetry.dump).
+        """
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.summary(finished), f, indent=1)
+        set_default_permissions(tmp_path)
+        os.rename(tmp_path, path)
+
+    def start(self, status_file, every_seconds=10.):
+        """
+        Rewrites status_file every every_seconds, from a background thread,
+        until stop is called.
+        """
+        self._status_file = status_file
+
+        def keep_dumping():
+            while not self._stop.wait(every_seconds):
+                try:
+                    self.dump(status_file)
+                except (IOError, OSError) as e:
+                    print 'Could not write {}: {}'.format(status_file, e)
+
+        self.dump(status_file)
+        self._thread = threading.Thread(target=keep_dumping)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread, and writes the status file one last
+        time, as finished.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.dump(self._status_file, finished=True)
+
+
+def format_progress_line(summary):
+    return '{:.2f} articles/s, {:.0f} chars/s, {:.1%} failed, ETA {}'.format(
+        summary['articles_per_second'], summary['chars_per_second'],
+        summary['error_rate'], format_duration(summary['eta_seconds']))
+
+
+def format_status(status):
+    """
+    Returns the status (as written by AnnotationProgress.dump) as a few
+    tables: the whole run, each shard, and each server.
+    """
+    def rate(value):
+        return '-' if value is None else '{:.1%}'.format(value)
+
+    def ago(seconds):
+        return '-' if seconds is None else '{:.0f}s'.format(seconds)
+
+    lines = ['{} (started {}), updated {} ago{}'.format(
+        'Finished' if status['finished'] else 'Running',
+        time.ctime(status['started']),
+        ago(time.time() - status['updated']),
+        '' if status['finished'] else ', ETA {}'.format(
+            format_duration(status['eta_seconds'])))]
+    lines.append('')
+    lines.append('{:<32} {:>15} {:>9} {:>10} {:>7} {:>7} {:>6} {:>9}'.format(
+        'shard', 'articles', 'art/s', 'chars/s', 'errors', 'recent',
+        'idle', 'ETA'))
+    for s in status['shards'] + [dict(status, shard='all')]:
+        lines.append(
+            '{:<32} {:>15} {:>9.2f} {:>10.0f} {:>7} {:>7} {:>6} {:>9}'.format(
+                s['shard'], '{}/{}'.format(
+                    s['articles'], '?' if s['expected_articles'] is None
+                    else s['expected_articles']),
+                s['articles_per_second'], s['chars_per_second'],
+                rate(s['error_rate']), rate(s['recent_error_rate']),
+                ago(s['seconds_since_last_article']),
+                format_duration(s['eta_seconds'])))
+    lines.append('')
+    lines.append('{:<24} {:>9} {:>8} {:>6} {:>6} {:>9} {:>6} {:>8}'.format(
+        'server', 'in flight', 'requests', 'fails', 't/outs', 'chars/s',
+        'idle', 'in use'))
+    for s in status['servers']:
+        lines.append(
+            '{:<24} {:>9} {:>8} {:>6} {:>6} {:>9.0f} {:>6} {:>8}'.format(
+                s['url'], s.get('in_flight', '-'), s.get('requests', 0),
+                s.get('failures', 0), s.get('timeouts', 0),
+                s.get('chars_per_second', 0.),
+                ago(s.get('seconds_since_last_request')),
+                {True: 'yes', False: 'no'}.get(s.get('in_rotation'), '-')))
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Show the status file of an annotation run')
+    parser.add_argument('status_file')
+    parser.add_argument('--watch', type=float, default=None,
+                        help='Show it again every this many seconds.')
+    args = parser.parse_args()
+
+    while True:
+        with open(args.status_file, 'r') as f:
+            print format_status(json.load(f))
+        if args.watch is None:
+            break
+        time.sleep(args.watch)
+        print
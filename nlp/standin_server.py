@@ -0,0 +1,239 @@
+"""
+A small HTTP server that answers like a StanfordCoreNLP server, for load
+testing the annotation drivers, the webapp demo and anything else that talks
+to CoreNLP, without needing a JVM with 4+ GB of models.
+
+It answers a text with the stored annotation of that same text if it has
+one (from annotation TSVs we've already produced, looked up by a hash of the
+text), and otherwise with a synthetic annotation that has the same shape as
+CoreNLP's JSON (so the analysis pipeline runs on it), but none of its
+linguistics. Every answer is delayed according to a configurable latency
+distribution; like the real server, it only works on a fixed number of
+requests at a time, and answers with its timeout message if a request would
+take longer than its timeout.
+
+Usage:
+python nlp/standin_server.py --port 9000 --threads 4 \
+    --replay annotated/manual/ann.tsv --latency lognormal:0,0.5
+"""
+import argparse
+import BaseHTTPServer
+import hashlib
+import json
+import random
+import re
+import SocketServer
+import threading
+import time
+import urlparse
+
+from utils import normalize_text
+
+
+TIMEOUT_MESSAGE = 'CoreNLP request timed out. Your document may be too long.'
+
+
+def text_hash(text):
+    return hashlib.sha1(normalize_text(text)).hexdigest()
+
+
+class ReplayIndex(object):
+    """
+    Finds stored annotations by the hash of their text. Only the position of
+    each line is kept in memory; the annotation is read from the TSV when it
+    is asked for.
+    """
+
+    def __init__(self, tsv_filenames):
+        self._locations = {}
+        for filename in tsv_filenames:
+            with open(filename, 'r') as f:
+                offset = 0
+                for line in f:
+                    _, data, ann = line.rstrip('\n').split('\t')
+                    # We only index lines with real annotations, and not the
+                    # error messages that were written when CoreNLP failed.
+                    if ann.startswith('{'):
+                        text = json.loads(data).get('text')
+                        if text is not None:
+                            self._locations[text_hash(text)] = (filename,
+                                                                offset)
+                    offset += len(line)
+
+    def __len__(self):
+        return len(self._locations)
+
+    def get(self, text):
+        location = self._locations.get(text_hash(text))
+        if location is None:
+            return None
+        filename, offset = location
+        with open(filename, 'r') as f:
+            f.seek(offset)
+            return f.readline().rstrip('\n').split('\t')[2]
+
+
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+_TOKEN_RE = re.compile(r"\w+(?:'\w+)?|[^\w\s]")
+
+
+def synthetic_annotation(text):
+    """
+    Makes up an annotation of text with the same shape as CoreNLP's JSON:
+    sentences split at full stops, tokens split at spaces and punctuation,
+    capitalized words that don't start a sentence tagged as PERSON, and a
+    dependency parse with just a ROOT. There are no coref chains.
+    """
+    sentences = []
+    sent_start = 0
+    for sent_text in _SENTENCE_END_RE.split(text):
+        sent_start = text.find(sent_text, sent_start)
+        tokens = []
+        prev_end = sent_start
+        for match in _TOKEN_RE.finditer(sent_text):
+            word = match.group()
+            begin = sent_start + match.start()
+            is_name = len(tokens) > 0 and word[0].isupper()
+            tokens.append({
+                'index': len(tokens) + 1,
+                'word': word,
+                'originalText': word,
+                'lemma': word.lower(),
+                'pos': 'NNP' if is_name else 'NN',
+                'ner': 'PERSON' if is_name else 'O',
+                'speaker': 'PER0',
+                'before': text[prev_end:begin],
+                'after': '',
+                'characterOffsetBegin': begin,
+                'characterOffsetEnd': begin + len(word)
+            })
+            if len(tokens) > 1:
+                tokens[-2]['after'] = tokens[-1]['before']
+            prev_end = begin + len(word)
+        sent_start += len(sent_text)
+        if len(tokens) == 0:
+            continue
+        sentences.append({
+            'index': len(sentences),
+            'tokens': tokens,
+            'enhancedPlusPlusDependencies': [{
+                'dep': 'ROOT',
+                'governor': 0,
+                'governorGloss': 'ROOT',
+                'dependent': 1,
+                'dependentGloss': tokens[0]['word']
+            }]
+        })
+    return {'sentences': sentences, 'corefs': {}}
+
+
+def parse_latency(spec):
+    """
+    Turns a latency spec into a function that returns a latency in seconds.
+    Specs are 'fixed:SECONDS', 'uniform:LOW,HIGH', 'exponential:MEAN' or
+    'lognormal:MU,SIGMA' (of the log of the latency in seconds).
+    """
+    kind, _, params = spec.partition(':')
+    params = [float(p) for p in params.split(',')]
+    if kind == 'fixed':
+        return lambda: params[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(params[0], params[1])
+    if kind == 'exponential':
+        return lambda: random.expovariate(1. / params[0])
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(params[0], params[1])
+    raise ValueError('Unknown latency distribution: {}'.format(spec))
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    The server. replay is a ReplayIndex (or None), latency a function giving
+    the base latency of a request, seconds_per_char the extra latency per
+    character of text, threads how many requests it works on at once and
+    timeout (in seconds) when it gives up on a request.
+    """
+    daemon_threads = True
+
+    def __init__(self, port, replay=None, latency=lambda: 0.,
+                 seconds_per_char=0., threads=4, timeout=15.):
+        BaseHTTPServer.HTTPServer.__init__(self, ('localhost', port),
+                                           StandInHandler)
+        self.replay = replay
+        self.latency = latency
+        self.seconds_per_char = seconds_per_char
+        self.timeout = timeout
+        self.workers = threading.Semaphore(threads)
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    # Keep-alive, like the real server.
+    protocol_version = 'HTTP/1.1'
+
+    def _respond(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # The real server serves its web page here; we just say we're alive.
+        self._respond(200, 'ok', 'text/plain')
+
+    def do_POST(self):
+        text = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        query = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+        properties = json.loads(query.get('properties', ['{}'])[0])
+        if properties.get('outputFormat', 'json') != 'json':
+            self._respond(400, 'The stand-in server only does JSON output.',
+                          'text/plain')
+            return
+
+        server = self.server
+        with server.workers:
+            latency = server.latency() + server.seconds_per_char * len(text)
+            if latency > server.timeout:
+                time.sleep(server.timeout)
+                self._respond(500, TIMEOUT_MESSAGE, 'text/plain')
+                return
+            time.sleep(latency)
+
+        ann = server.replay.get(text) if server.replay else None
+        if ann is None:
+            ann = json.dumps(synthetic_annotation(text))
+        self._respond(200, ann)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='A stand-in for a CoreNLP server')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--replay', nargs='*', default=[],
+                        help='Annotation TSVs to replay annotations from.')
+    parser.add_argument('--latency', default='fixed:0',
+                        help='fixed:S, uniform:LOW,HIGH, exponential:MEAN '
+                             'or lognormal:MU,SIGMA (in seconds).')
+    parser.add_argument('--ms_per_char', type=float, default=0.,
+                        help='Extra latency per character of text.')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='How many requests to work on at once.')
+    parser.add_argument('--timeout', type=float, default=15.,
+                        help='Seconds after which a request times out.')
+    args = parser.parse_args()
+
+    replay = None
+    if len(args.replay) > 0:
+        replay = ReplayIndex(args.replay)
+        print time.ctime(), 'Indexed {} annotations'.format(len(replay))
+
+    server = StandInServer(args.port, replay=replay,
+                           latency=parse_latency(args.latency),
+                           seconds_per_char=args.ms_per_char / 1000.,
+                           threads=args.threads, timeout=args.timeout)
+    print time.ctime(), 'Listening on port {}'.format(args.port)
+    server.serve_forever()
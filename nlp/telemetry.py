@@ -0,0 +1,181 @@
+"""
+Telemetry for our requests to CoreNLP servers: how long they take, how much
+we send and get back, how many time out, and how many characters a second
+each server gets through, broken down by server and by annotator set.
+
+Every CoreNLPClient records its requests in the shared telemetry (see
+get_telemetry), so the drivers can print a summary, or export it to a file,
+when they're done.
+"""
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+
+from cache import set_default_permissions
+
+
+# The upper bounds (in seconds) of the latency histogram buckets. They double
+# from 50ms to about 7 minutes; slower requests go in one last bucket.
+LATENCY_BUCKETS = [0.05 * 2 ** i for i in range(14)]
+
+
+class _RequestStats(object):
+    """
+    Running totals for the requests to one server with one annotator set.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.chars = 0
+        self.total_latency = 0.
+        self.max_latency = 0.
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        # When the last request finished.
+        self.last_request = None
+
+    def add(self, latency, request_bytes, response_bytes, chars, failed,
+            timed_out):
+        self.requests += 1
+        self.failures += int(failed)
+        self.timeouts += int(timed_out)
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+        self.chars += chars
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.latency_counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.last_request = time.time()
+
+    def latency_percentile(self, fraction):
+        """
+        Returns the upper bound of the histogram bucket the given fraction
+        of requests fall within (or the slowest latency seen, if that's in
+        the last bucket).
+        """
+        target = fraction * self.requests
+        seen = 0
+        for i, count in enumerate(self.latency_counts):
+            seen += count
+            if seen >= target and count > 0:
+                if i < len(LATENCY_BUCKETS):
+                    return min(LATENCY_BUCKETS[i], self.max_latency)
+                return self.max_latency
+        return self.max_latency
+
+    def summary(self):
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'request_bytes': self.request_bytes,
+            'response_bytes': self.response_bytes,
+            'mean_latency': self.total_latency / max(self.requests, 1),
+            'p50_latency': self.latency_percentile(0.5),
+            'p90_latency': self.latency_percentile(0.9),
+            'p99_latency': self.latency_percentile(0.99),
+            'max_latency': self.max_latency,
+            'last_request': self.last_request,
+            'chars_per_second': self.chars / max(self.total_latency, 1e-9),
+            'latency_histogram': zip(LATENCY_BUCKETS + [None],
+                                     self.latency_counts)
+        }
+
+
+class AnnotationTelemetry(object):
+    """
+    Collects request statistics for every (server URL, annotator set) pair.
+    Safe to share between threads.
+    """
+
+    def __init__(self):
+        self._stats = {}
+        # When each server last answered a request (even with an error).
+        self._last_answers = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def record(self, url, annotators, latency, request_bytes, response_bytes,
+               chars, failed=False, timed_out=False, answered=True):
+        """
+        Records one request. annotators is the comma-separated annotator
+        list, as sent to the server; chars is the length of the text;
+        answered is False if we got no answer at all (e.g. the connection
+        was refused).
+        """
+        with self._lock:
+            key = (url, annotators)
+            if key not in self._stats:
+                self._stats[key] = _RequestStats()
+            self._stats[key].add(latency, request_bytes, response_bytes,
+                                 chars, failed, timed_out)
+            if answered:
+                self._last_answers[url] = time.time()
+
+    def last_answer(self, url):
+        """
+        When the server at url last answered a request, or None if it
+        hasn't yet.
+        """
+        with self._lock:
+            return self._last_answers.get(url)
+
+    def summary(self):
+        """
+        Returns a list of summaries (dicts of totals and latency
+        percentiles), one for every server and annotator set.
+        """
+        with self._lock:
+            summaries = []
+            for (url, annotators), stats in sorted(self._stats.iteritems()):
+                summary = stats.summary()
+                summary['url'] = url
+                summary['annotators'] = annotators
+                summaries.append(summary)
+            return summaries
+
+    def format_summary(self):
+        """
+        Returns the summary as a table, one line per server and annotator
+        set.
+        """
+        lines = ['{:<24} {:>8} {:>6} {:>6} {:>8} {:>8} {:>8} {:>9}  {}'.format(
+            'server', 'requests', 'fails', 't/outs', 'p50 (s)', 'p90 (s)',
+            'p99 (s)', 'chars/s', 'annotators')]
+        for s in self.summary():
+            lines.append(
+                '{:<24} {:>8} {:>6} {:>6} {:>8.2f} {:>8.2f} {:>8.2f} '
+                '{:>9.0f}  {}'.format(
+                    s['url'], s['requests'], s['failures'], s['timeouts'],
+                    s['p50_latency'], s['p90_latency'], s['p99_latency'],
+                    s['chars_per_second'], s['annotators']))
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        """
+        Writes the summary to path as JSON. The file is replaced atomically,
+        so it can be read by another process while we keep updating it.
+        """
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'started': self.started, 'updated': time.time(),
+                       'stats': self.summary()}, f, indent=1)
+        set_default_permissions(tmp_path)
+        os.rename(tmp_path, path)
+
+
+_telemetry = AnnotationTelemetry()
+
+
+def get_telemetry():
+    """
+    Returns the telemetry that all CoreNLPClients record their requests in.
+    """
+    return _telemetry
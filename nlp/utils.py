@@ -1,11 +1,335 @@
-from pycorenlp import StanfordCoreNLP
+import json
+import Queue
+import threading
+import time
 
+import requests
+from requests.adapters import HTTPAdapter
 
-def annotate_corenlp(text, annotators=['pos'], output_format='json', port=9000):
+from cache import get_default_cache
+from chunking import (join_batch, merge_annotations, split_batch_annotation,
+                      split_into_chunks)
+from corenlp_proto import PROTOBUF_PROPERTIES, decode_document
+from telemetry import get_telemetry
+
+
+UNICODE_ASCII_MAP = {
+    0x2018: u'\'',
+    0x2019: u'\'',
+    0x201c: u'\"',
+    0x201d: u'\"'
+}
+
+# For every CoreNLP annotator, the annotators that have to run before it.
+ANNOTATOR_REQUIREMENTS = {
+    'tokenize': [],
+    'ssplit': ['tokenize'],
+    'pos': ['tokenize', 'ssplit'],
+    'lemma': ['tokenize', 'ssplit', 'pos'],
+    'ner': ['tokenize', 'ssplit', 'pos', 'lemma'],
+    'parse': ['tokenize', 'ssplit', 'pos'],
+    'depparse': ['tokenize', 'ssplit', 'pos'],
+    # dcoref finds its mentions in the constituency parse, so it needs parse.
+    'dcoref': ['tokenize', 'ssplit', 'pos', 'lemma', 'ner', 'parse'],
+    'quote': ['tokenize', 'ssplit'],
+    'natlog': ['tokenize', 'ssplit', 'pos', 'lemma', 'depparse'],
+    'openie': ['tokenize', 'ssplit', 'pos', 'lemma', 'depparse', 'natlog'],
+}
+
+# The order in which CoreNLP runs the annotators.
+ANNOTATOR_ORDER = ['tokenize', 'ssplit', 'pos', 'lemma', 'ner', 'parse',
+                   'depparse', 'dcoref', 'quote', 'natlog', 'openie']
+
+# Which annotators produce each part of the annotation.
+ANNOTATION_SOURCES = {
+    'tokens': ['tokenize', 'ssplit'],
+    'pos': ['pos'],
+    'lemma': ['lemma'],
+    'ner': ['ner'],
+    'parse': ['parse'],
+    'basicDependencies': ['depparse'],
+    'enhancedDependencies': ['depparse'],
+    'enhancedPlusPlusDependencies': ['depparse'],
+    'corefs': ['dcoref'],
+    # The 'speaker' of quoted tokens is the id of a dcoref mention.
+    'speaker': ['quote', 'dcoref'],
+    'openie': ['openie'],
+}
+
+
+def get_annotators(annotations):
+    """
+    Returns the smallest list of annotators (in the order CoreNLP has to run
+    them) that produces all the given parts of the annotation, which are
+    keys of ANNOTATION_SOURCES (like 'ner' or 'corefs').
+    """
+    needed = set()
+    to_visit = []
+    for annotation in annotations:
+        to_visit.extend(ANNOTATION_SOURCES[annotation])
+    while len(to_visit) > 0:
+        annotator = to_visit.pop()
+        if annotator not in needed:
+            needed.add(annotator)
+            to_visit.extend(ANNOTATOR_REQUIREMENTS[annotator])
+    return [a for a in ANNOTATOR_ORDER if a in needed]
+
+
+# How many keep-alive connections each client holds open to its server.
+# This is also the most requests a single client will have in flight at once.
+DEFAULT_POOL_SIZE = 16
+
+
+class CoreNLPClient(object):
+    """
+    A long-lived client for one StanfordCoreNLP server.
+
+    Unlike pycorenlp's StanfordCoreNLP, which we used to build afresh for every
+    article (and which sends 'Connection: close' with every request), this
+    keeps a pool of keep-alive HTTP connections to the server and reuses them
+    across calls. Every request is recorded in the shared telemetry (see
+    nlp/telemetry.py). It can be shared between threads: the underlying urllib3
+    pool hands each request its own connection and blocks when all pool_size
+    connections are busy.
+    """
+
+    def __init__(self, url='http://localhost:9000',
+                 pool_size=DEFAULT_POOL_SIZE, timeout=None):
+        """
+        Arguments:
+            url: the URL of the CoreNLP server.
+            pool_size: the number of connections to keep open to the server.
+            timeout: seconds to wait for the server before giving up
+            (None means wait forever, which is what pycorenlp did).
+        """
+        self.url = url
+        self.timeout = timeout
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              pool_block=True)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def annotate(self, text, properties=None):
+        """
+        Sends text to the server, with the given CoreNLP properties.
+        Returns the parsed JSON if outputFormat is json and the server sent
+        back valid JSON, the raw bytes (a str) if outputFormat is
+        serialized, and otherwise the response text as unicode. Raises
+        AnnotationError if the server answers with an error (which is what
+        it does when, for instance, the request timed out), and
+        requests.RequestException if it doesn't answer at all.
+        """
+        if properties is None:
+            properties = {}
+        annotators = properties.get('annotators', '')
+        start = time.time()
+        try:
+            r = self._session.post(
+                self.url, params={'properties': json.dumps(properties)},
+                data=text, timeout=self.timeout)
+        except requests.RequestException as e:
+            get_telemetry().record(
+                self.url, annotators, time.time() - start, len(text), 0,
+                len(text), failed=True,
+                timed_out=isinstance(e, requests.Timeout), answered=False)
+            raise
+        failed = r.status_code != 200
+        timed_out = failed and 'timed out' in r.text
+        get_telemetry().record(
+            self.url, annotators, time.time() - start, len(text),
+            len(r.content), len(text), failed=failed, timed_out=timed_out)
+        if failed:
+            # Like 'CoreNLP request timed out. Your document may be too
+            # long.'
+            raise AnnotationError(r.text, timed_out)
+
+        if properties.get('outputFormat') == 'serialized':
+            return r.content
+        output = r.text
+        if properties.get('outputFormat') == 'json':
+            try:
+                output = json.loads(output, strict=True)
+            except ValueError:
+                pass
+        return output
+
+    def ping(self, timeout=5):
+        """
+        Returns True if the server answers at all within timeout seconds.
+        """
+        try:
+            self._session.get(self.url, timeout=timeout)
+        except requests.RequestException:
+            return False
+        return True
+
+    def close(self):
+        self._session.close()
+
+
+class _Endpoint(object):
+    """
+    Book-keeping for one server behind a CoreNLPDispatcher.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.in_flight = 0
+        # Number of failures since the last successful request.
+        self.failures = 0
+        # We don't send requests to this server before this time.
+        self.down_until = 0.
+
+
+def _endpoint_url(endpoint):
+    """
+    Endpoints can be given either as a port on localhost, or as a full URL.
+    """
+    if isinstance(endpoint, int) or endpoint.isdigit():
+        return 'http://localhost:{}'.format(endpoint)
+    return endpoint
+
+
+class CoreNLPDispatcher(object):
+    """
+    Spreads annotation requests over several CoreNLP servers.
+
+    Each request goes to the server with the fewest requests in flight.
+    A server that fails max_failures times in a row (connection errors,
+    timeouts, and error replies, like the server's own timeout message, all
+    count as failures) is taken out of rotation for retry_after seconds,
+    after which it gets requests again; a single success puts it back to
+    normal. A request that couldn't get through to one server is retried on
+    the others before we give up on it; one that a server answered with an
+    error isn't (another server would most likely time out on the same
+    text too), and the AnnotationError is raised.
+
+    Has the same annotate() method as CoreNLPClient, so it can be passed as
+    the client to annotate_corenlp, and can be shared between threads.
+    """
+
+    def __init__(self, endpoints, max_failures=3, retry_after=60.,
+                 timeout=None, pool_size=DEFAULT_POOL_SIZE):
+        """
+        Arguments:
+            endpoints: a list of ports (on localhost) or URLs of servers.
+            max_failures: consecutive failures before we stop using a server.
+            retry_after: seconds to wait before trying a failed server again.
+            timeout: per-request timeout in seconds (see CoreNLPClient).
+        """
+        if len(endpoints) == 0:
+            raise ValueError('Need at least one CoreNLP endpoint.')
+        self.max_failures = max_failures
+        self.retry_after = retry_after
+        self._endpoints = [
+            _Endpoint(CoreNLPClient(_endpoint_url(e), pool_size=pool_size,
+                                    timeout=timeout))
+            for e in endpoints]
+        self._lock = threading.Lock()
+
+    def _acquire(self, exclude):
+        """
+        Picks the server for the next request, skipping those in exclude.
+        Prefers healthy servers with the fewest requests in flight; if every
+        server is down, picks the one that comes back up soonest.
+        Returns None if there is no server left to try.
+        """
+        with self._lock:
+            candidates = [e for e in self._endpoints if e not in exclude]
+            if len(candidates) == 0:
+                return None
+            now = time.time()
+            healthy = [e for e in candidates if e.down_until <= now]
+            if len(healthy) > 0:
+                endpoint = min(healthy, key=lambda e: e.in_flight)
+            else:
+                endpoint = min(candidates, key=lambda e: e.down_until)
+            endpoint.in_flight += 1
+            return endpoint
+
+    def _release(self, endpoint, succeeded):
+        with self._lock:
+            endpoint.in_flight -= 1
+            self._record(endpoint, succeeded)
+
+    def _record(self, endpoint, succeeded):
+        # Assumes self._lock is held.
+        if succeeded:
+            endpoint.failures = 0
+            endpoint.down_until = 0.
+        else:
+            endpoint.failures += 1
+            if endpoint.failures >= self.max_failures:
+                endpoint.down_until = time.time() + self.retry_after
+
+    def annotate(self, text, properties=None):
+        tried = []
+        last_error = None
+        while True:
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                raise last_error
+            tried.append(endpoint)
+            try:
+                output = endpoint.client.annotate(text, properties)
+            except requests.RequestException as e:
+                self._release(endpoint, False)
+                last_error = e
+                continue
+            except AnnotationError:
+                self._release(endpoint, False)
+                raise
+            self._release(endpoint, True)
+            return output
+
+    def status(self):
+        """
+        Returns a list of (url, requests in flight, consecutive failures,
+        is it in rotation?) for every server.
+        """
+        now = time.time()
+        with self._lock:
+            return [(e.client.url, e.in_flight, e.failures,
+                     e.down_until <= now) for e in self._endpoints]
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(port=9000, host='localhost'):
+    """
+    Returns the shared CoreNLPClient for the server at host:port, creating it
+    the first time it is asked for.
+    """
+    url = 'http://{}:{}'.format(host, port)
+    with _clients_lock:
+        if url not in _clients:
+            _clients[url] = CoreNLPClient(url)
+        return _clients[url]
+
+
+def normalize_text(text):
+    """
+    Turns text into exactly what we send to the server: unicode is turned
+    into ASCII (with curly quotes made straight, and other non-ASCII
+    characters dropped), and '' is replaced with a double quote.
+    """
+    if type(text) is unicode:
+        text = text.translate(UNICODE_ASCII_MAP).encode(
+            'ascii', 'ignore')
+
+    # To replace double quotes with single quotes
+    return text.replace("''", '"')
+
+
+def annotate_corenlp(text, annotators=['pos'], output_format='json', port=9000,
+                     client=None, use_cache=True, cache=None):
     """
     Helper function to get the CoreNLP output.
     Usage:
-    You need to install pycorenlp (using pip install corenlp) and have your
+    You need to install requests (using pip install requests) and have your
     StanfordCoreNLP server running on port (default 9000) using the instructions
     at http://stanfordnlp.github.io/CoreNLP/corenlp-server.html
     Arguments:
@@ -14,22 +338,364 @@ def annotate_corenlp(text, annotators=['pos'], output_format='json', port=9000):
         (The table with all the annotators can be found at
         http://stanfordnlp.github.io/CoreNLP/annotators.html. You just need to
         put the property name from that table into this list. (Ex: 'pos', 'ner')
+        output_format: 'json', or 'protobuf' to have the server send its much
+        smaller serialized output, which we decode into the same
+        sentences/corefs view as the JSON (see nlp/corenlp_proto.py).
+        client: the CoreNLPClient (or CoreNLPDispatcher) to send the request
+        through. By default, we use the shared client for the server on
+        localhost:port, so that connections are reused across calls.
+        use_cache: whether to look the text up in the on-disk annotation
+        cache first (and store the annotation there if it wasn't found).
+        cache: the AnnotationCache to use; by default, the one in
+        GENDERMEME_CACHE_DIR (see nlp/cache.py).
     """
-    if type(text) is unicode:
-        UNICODE_ASCII_MAP = {
-            0x2018: u'\'',
-            0x2019: u'\'',
-            0x201c: u'\"',
-            0x201d: u'\"'
-        }
-        text = text.translate(UNICODE_ASCII_MAP).encode(
-            'ascii', 'ignore')
+    text = normalize_text(text)
 
-    # To replace double quotes with single quotes
-    text = text.replace("''", '"')
+    if use_cache:
+        if cache is None:
+            cache = get_default_cache()
+        key = cache.key(text, annotators, output_format)
+        ann = cache.get(key)
+        if ann is not None:
+            return ann
 
-    nlp = StanfordCoreNLP('http://localhost:{}'.format(port))
-    return nlp.annotate(text, properties={
+    if client is None:
+        client = get_client(port)
+    properties = {
         'annotators': ','.join(annotators),
         'outputFormat': output_format
-        })
+        }
+    if output_format == 'protobuf':
+        properties.update(PROTOBUF_PROPERTIES)
+    ann = client.annotate(text, properties=properties)
+    if output_format == 'protobuf' and type(ann) is str:
+        ann = decode_document(ann)
+
+    # We only cache real annotations (and not, say, JSON that didn't parse).
+    if use_cache and type(ann) is dict:
+        cache.put(key, ann)
+    return ann
+
+
+class PendingAnnotation(object):
+    """
+    The result of annotate_corenlp_async: an annotation that is being
+    computed in a background thread.
+    """
+
+    def __init__(self, func, *args, **kwargs):
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+        def run():
+            try:
+                self._result = func(*args, **kwargs)
+            except Exception as e:
+                self._error = e
+            self._done.set()
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Waits (up to timeout seconds, or forever if None) for the
+        annotation, and returns it. Re-raises any error the request raised.
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError('Annotation not done after {}s'.format(timeout))
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+def annotate_corenlp_async(text, annotators=['pos'], output_format='json',
+                           port=9000, client=None, use_cache=True):
+    """
+    Same as annotate_corenlp, but returns immediately with a
+    PendingAnnotation; call .result() on it to get the annotation.
+    """
+    return PendingAnnotation(annotate_corenlp, text, annotators=annotators,
+                             output_format=output_format, port=port,
+                             client=client, use_cache=use_cache)
+
+
+# Marks the end of the input (or of a worker's output) in
+# annotate_corenlp_many's queues.
+_DONE = object()
+
+
+def annotate_corenlp_many(items, annotators=['pos'], output_format='json',
+                          port=9000, client=None, max_in_flight=8,
+                          use_cache=True, max_chunk_chars=None, retries=0,
+                          backoff=1., batch_chars=None):
+    """
+    Annotates many texts concurrently, with at most max_in_flight requests
+    to the server(s) at any time. CoreNLP servers are multi-threaded, so this
+    keeps them much busier than annotating one article at a time.
+
+    Arguments:
+        items: an iterable of (id, text) pairs. It is consumed lazily, from a
+        background thread, only a little ahead of the requests being sent.
+        max_in_flight: the number of requests to have outstanding at once.
+        max_chunk_chars: if given, texts longer than this are annotated in
+        chunks (see annotate_corenlp_chunked).
+        retries, backoff: how often to retry failed texts, and how long to
+        wait before doing so (see annotate_corenlp_retrying).
+        batch_chars: if given, consecutive texts are grouped into batches of
+        up to this many characters, and each batch is sent to the server as
+        one request (see annotate_corenlp_batch). Texts longer than this are
+        sent on their own.
+        The rest of the arguments are as for annotate_corenlp.
+
+    Yields (id, annotation, error) triples in the order the requests finish
+    (which is generally not the order of items). error is None if we got an
+    annotation, and otherwise the exception we got instead (an
+    AnnotationError if the server sent back an error message), in which case
+    annotation is None.
+    """
+    if client is None:
+        client = get_client(port)
+
+    in_queue = Queue.Queue(maxsize=max_in_flight)
+    out_queue = Queue.Queue()
+    feeder_error = []
+
+    def feed():
+        # We put lists of items on the queue: each list is one batch, or,
+        # if we're not batching, just one item.
+        try:
+            batch = []
+            batch_size = 0
+            for item in items:
+                text_size = len(item[1])
+                if batch_chars is None or text_size >= batch_chars:
+                    in_queue.put([item])
+                    continue
+                if batch_size + text_size > batch_chars:
+                    in_queue.put(batch)
+                    batch, batch_size = [], 0
+                batch.append(item)
+                batch_size += text_size
+            if len(batch) > 0:
+                in_queue.put(batch)
+        except Exception as e:
+            feeder_error.append(e)
+        for _ in range(max_in_flight):
+            in_queue.put(_DONE)
+
+    def work():
+        while True:
+            batch = in_queue.get()
+            if batch is _DONE:
+                out_queue.put(_DONE)
+                return
+            if len(batch) > 1:
+                try:
+                    results = annotate_corenlp_batch(
+                        [text for _, text in batch], annotators=annotators,
+                        output_format=output_format, client=client,
+                        use_cache=use_cache, retries=retries, backoff=backoff)
+                except Exception as e:
+                    # (Like a full disk when caching.) Every text of the
+                    # batch gets the error, rather than this thread dying
+                    # without saying it's done.
+                    results = [(None, e)] * len(batch)
+                for (_id, _), (ann, error) in zip(batch, results):
+                    out_queue.put((_id, ann, error))
+                continue
+
+            _id, text = batch[0]
+            try:
+                ann = annotate_corenlp_retrying(
+                    text, annotators=annotators, output_format=output_format,
+                    client=client, use_cache=use_cache,
+                    max_chunk_chars=max_chunk_chars, retries=retries,
+                    backoff=backoff)
+                out_queue.put((_id, ann, None))
+            except Exception as e:
+                out_queue.put((_id, None, e))
+
+    threads = [threading.Thread(target=feed)]
+    threads.extend(threading.Thread(target=work)
+                   for _ in range(max_in_flight))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    num_workers_done = 0
+    while num_workers_done < max_in_flight:
+        # We poll with a timeout because a blocking get() can't be
+        # interrupted with Ctrl-C in Python 2.
+        try:
+            result = out_queue.get(timeout=1)
+        except Queue.Empty:
+            continue
+        if result is _DONE:
+            num_workers_done += 1
+        else:
+            yield result
+
+    # If reading the input failed, we raise that here, after all the
+    # requests that were already sent have been yielded.
+    if len(feeder_error) > 0:
+        raise feeder_error[0]
+
+
+def annotate_corenlp_chunked(text, max_chunk_chars, annotators=['pos'],
+                             output_format='json', port=9000, client=None,
+                             use_cache=True):
+    """
+    Like annotate_corenlp, but if text is longer than max_chunk_chars, splits
+    it at paragraph boundaries into chunks of about that size, annotates the
+    chunks in parallel and stitches their annotations together (see
+    nlp/chunking.py). Useful for articles so long that the server would
+    time out on them.
+
+    If any of the chunks can't be annotated, raises the error it got.
+    """
+    text = normalize_text(text)
+    chunks = split_into_chunks(text, max_chunk_chars)
+    if len(chunks) == 1:
+        return annotate_corenlp(text, annotators=annotators,
+                                output_format=output_format, port=port,
+                                client=client, use_cache=use_cache)
+
+    anns = [None] * len(chunks)
+    for chunk_i, ann, error in annotate_corenlp_many(
+            enumerate(chunk_text for _, chunk_text in chunks),
+            annotators=annotators, output_format=output_format, port=port,
+            client=client, max_in_flight=len(chunks), use_cache=use_cache):
+        if error is not None:
+            raise error
+        anns[chunk_i] = ann
+    return merge_annotations(anns, [offset for offset, _ in chunks])
+
+
+class AnnotationError(Exception):
+    """
+    Raised when we couldn't get an annotation for a text, even after
+    retrying. timed_out says whether (the last attempt) failed because the
+    request timed out.
+    """
+
+    def __init__(self, reason, timed_out=False):
+        Exception.__init__(self, reason)
+        self.timed_out = timed_out
+
+
+def annotate_corenlp_retrying(text, annotators=['pos'], output_format='json',
+                              port=9000, client=None, use_cache=True,
+                              max_chunk_chars=None, retries=2, backoff=1.):
+    """
+    Like annotate_corenlp (or annotate_corenlp_chunked, if max_chunk_chars is
+    given), but tries again, up to retries times, if the request fails or
+    the server sends back an error instead of an annotation. We wait backoff
+    seconds before the first retry, and twice as long before every retry
+    after that. If an attempt timed out, the next one annotates the text in
+    chunks half the size (of the text, or of the chunks we just tried).
+
+    Only for the json and protobuf output formats. Raises AnnotationError if
+    the last attempt fails too.
+    """
+    text = normalize_text(text)
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        try:
+            if max_chunk_chars is None:
+                ann = annotate_corenlp(text, annotators=annotators,
+                                       output_format=output_format,
+                                       port=port, client=client,
+                                       use_cache=use_cache)
+            else:
+                ann = annotate_corenlp_chunked(
+                    text, max_chunk_chars, annotators=annotators,
+                    output_format=output_format, port=port, client=client,
+                    use_cache=use_cache)
+        except requests.Timeout as e:
+            reason, timed_out = repr(e), True
+        except requests.RequestException as e:
+            reason, timed_out = repr(e), False
+        except AnnotationError as e:
+            reason, timed_out = e.message, e.timed_out
+        else:
+            if type(ann) is dict:
+                return ann
+            # Not an annotation (e.g. JSON that didn't parse).
+            reason, timed_out = ann, False
+
+        if timed_out:
+            max_chunk_chars = min(max_chunk_chars or len(text), len(text)) / 2
+
+    raise AnnotationError(reason, timed_out)
+
+
+def annotate_corenlp_batch(texts, annotators=['pos'], output_format='json',
+                           port=9000, client=None, use_cache=True, retries=2,
+                           backoff=1.):
+    """
+    Annotates several (short) texts with a single request: they are joined
+    with boundary markers between them, and the annotation split back into
+    one annotation per text (see join_batch and split_batch_annotation in
+    nlp/chunking.py). This saves the per-request overhead, which is most of
+    the cost of annotating a short text.
+
+    Texts that are in the annotation cache aren't sent at all. Texts that
+    CoreNLP tangled up with another text in the batch (through a coref chain
+    or a quote speaker), and all the texts of a batch whose request failed,
+    are annotated on their own instead, with annotate_corenlp_retrying.
+
+    Returns a list with an (annotation, error) pair for every text, where
+    error is None if we got the annotation and the exception we got
+    otherwise.
+    """
+    if client is None:
+        client = get_client(port)
+    if use_cache:
+        cache = get_default_cache()
+
+    texts = [normalize_text(text) for text in texts]
+    anns = [None] * len(texts)
+    if use_cache:
+        for i, text in enumerate(texts):
+            anns[i] = cache.get(cache.key(text, annotators, output_format))
+
+    to_annotate = [i for i, ann in enumerate(anns) if ann is None]
+    if len(to_annotate) > 1:
+        joined_text, offsets = join_batch([texts[i] for i in to_annotate])
+        try:
+            # We don't cache the batch itself, but the texts in it.
+            batch_ann = annotate_corenlp_retrying(
+                joined_text, annotators=annotators,
+                output_format=output_format, client=client, use_cache=False,
+                retries=0)
+            doc_anns = split_batch_annotation(batch_ann, offsets)
+        except (AnnotationError, requests.RequestException, ValueError):
+            doc_anns = [None] * len(to_annotate)
+
+        for i, ann in zip(to_annotate, doc_anns):
+            if ann is not None:
+                anns[i] = ann
+                if use_cache:
+                    cache.put(cache.key(texts[i], annotators, output_format),
+                              ann)
+
+    results = []
+    for text, ann in zip(texts, anns):
+        if ann is not None:
+            results.append((ann, None))
+            continue
+        try:
+            results.append((annotate_corenlp_retrying(
+                text, annotators=annotators, output_format=output_format,
+                client=client, use_cache=use_cache, retries=retries,
+                backoff=backoff), None))
+        except Exception as e:
+            results.append((None, e))
+    return results
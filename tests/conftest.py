@@ -0,0 +1,12 @@
+"""
+The analysis scripts import each other as top-level modules (they're run as
+python analysis/annotate_corpus.py), and import nlp from the root of the
+repo, so both go on the path.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+for path in [ROOT, os.path.join(ROOT, 'analysis')]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
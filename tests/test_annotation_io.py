@@ -0,0 +1,155 @@
+import gzip
+import os
+
+import pytest
+
+from annotation_io import (AnnotationOutput, _compress,
+                           _truncate_partial_member, iter_annotation_lines,
+                           iter_member_lines, iter_members, read_member)
+
+# Batches of lines, big enough that the compressed members take a few
+# chunks of the small chunk sizes below.
+BATCHES = ['a\t{}\n'.format(i) * (i + 1) for i in range(5)] + [
+    ''.join('b\t{}\n'.format(i) for i in range(2000))]
+
+
+def write_members(tmpdir, codec, batches=BATCHES):
+    """
+    Writes each batch as a member, and returns the path and the (offset,
+    length) of each member.
+    """
+    path = str(tmpdir.join('ann.tsv.' + codec))
+    members = []
+    with open(path, 'wb') as f:
+        for batch in batches:
+            data = _compress(batch, codec)
+            members.append((f.tell(), len(data)))
+            f.write(data)
+    return path, members
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'bz2'])
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 1 << 20])
+def test_iter_members(tmpdir, codec, chunk_size):
+    path, members = write_members(tmpdir, codec)
+    assert list(iter_members(path, codec, chunk_size=chunk_size)) == members
+    assert [read_member(path, codec, offset, length)
+            for offset, length in members] == BATCHES
+
+
+def member_lines(path, codec, **kwargs):
+    """
+    The lines of each member (by offset), and the members' lengths.
+    """
+    lines = {}
+    lengths = {}
+    for offset, length, member_lines in iter_member_lines(path, codec,
+                                                          **kwargs):
+        lines.setdefault(offset, []).extend(member_lines)
+        if length is not None:
+            lengths[offset] = length
+    return lines, lengths
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'bz2'])
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 1 << 20])
+def test_iter_member_lines(tmpdir, codec, chunk_size):
+    path, members = write_members(tmpdir, codec)
+    lines, lengths = member_lines(path, codec, chunk_size=chunk_size)
+    assert lengths == dict(members)
+    assert [''.join(lines[offset]) for offset, _ in members] == BATCHES
+
+
+def test_one_big_member_is_read_as_it_goes(tmpdir):
+    # Like a TSV gzipped by hand: one member, which we don't want to hold
+    # in memory all at once.
+    path = str(tmpdir.join('ann.tsv.gz'))
+    lines = ['{}\t{{}}\t{}\n'.format(i, 'x' * (i % 100))
+             for i in range(20000)]
+    f = gzip.open(path, 'wb')
+    f.write(''.join(lines))
+    f.close()
+
+    pieces = list(iter_member_lines(path, 'gzip', chunk_size=4096))
+    assert len(pieces) > 10
+    assert max(len(piece_lines) for _, _, piece_lines in pieces) < 2000
+    assert [length for _, length, _ in pieces[:-1]] == [None] * (
+        len(pieces) - 1)
+    assert pieces[-1][1] == os.path.getsize(path)
+    assert [line for _, _, piece_lines in pieces
+            for line in piece_lines] == lines
+
+
+def test_read_gzipped_by_hand(tmpdir):
+    out_fn = str(tmpdir.join('ann.tsv'))
+    lines = ['a{}\t{{}}\tnull\n'.format(i) for i in range(1000)]
+    f = gzip.open(out_fn + '.gz', 'wb')
+    f.write(''.join(lines))
+    f.close()
+    assert list(iter_annotation_lines(out_fn)) == lines
+    # The manifest, made from the file, has them all in its one member.
+    output = AnnotationOutput(out_fn, codec='gzip')
+    assert set(output.load()) == set(line.split('\t')[0] for line in lines)
+    output.close()
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'bz2'])
+def test_iter_members_from_start(tmpdir, codec):
+    path, members = write_members(tmpdir, codec)
+    offset, length = members[3]
+    assert next(iter_members(path, codec, start=offset)) == (offset, length)
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'bz2'])
+@pytest.mark.parametrize('chunk_size', [7, 1 << 20])
+def test_iter_members_stops_at_cut_off_member(tmpdir, codec, chunk_size):
+    path, members = write_members(tmpdir, codec)
+    offset, length = members[-1]
+    with open(path, 'r+b') as f:
+        f.truncate(offset + length / 2)
+    assert (list(iter_members(path, codec, chunk_size=chunk_size)) ==
+            members[:-1])
+    # The whole lines of the cut-off member still come out.
+    lines, lengths = member_lines(path, codec, chunk_size=chunk_size)
+    assert lengths == dict(members[:-1])
+    assert BATCHES[-1].startswith(''.join(lines.get(offset, [])))
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'bz2'])
+def test_iter_members_empty(tmpdir, codec):
+    path, _ = write_members(tmpdir, codec, [])
+    assert list(iter_members(path, codec)) == []
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'bz2'])
+def test_truncate_partial_member(tmpdir, codec):
+    path, members = write_members(tmpdir, codec)
+    end = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(_compress('c\t1\n' * 100, codec)[:20])
+
+    _truncate_partial_member(path, codec, start=members[2][0])
+    assert os.path.getsize(path) == end
+    assert list(iter_members(path, codec)) == members
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'bz2'])
+def test_truncate_partial_member_bad_start(tmpdir, codec):
+    path, members = write_members(tmpdir, codec)
+    end = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(_compress('c\t1\n' * 100, codec)[:20])
+
+    # Neither the middle of a member nor past the end of the file is the
+    # start of a member, so it goes through the whole file instead.
+    for start in [members[2][0] + 1, end + 1000]:
+        _truncate_partial_member(path, codec, start=start)
+        assert os.path.getsize(path) == end
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'bz2'])
+def test_truncate_partial_member_whole_file(tmpdir, codec):
+    path, members = write_members(tmpdir, codec)
+    size = os.path.getsize(path)
+    _truncate_partial_member(path, codec, start=members[-1][0])
+    assert os.path.getsize(path) == size
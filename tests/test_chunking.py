@@ -0,0 +1,141 @@
+import copy
+import re
+
+import pytest
+
+from nlp.chunking import (join_batch, merge_annotations,
+                          split_batch_annotation, split_into_chunks)
+
+_TOKEN_RE = re.compile(r'\w+|[^\w\s]', re.UNICODE)
+
+
+def fake_annotate(text, names=()):
+    """
+    Something shaped like CoreNLP's JSON annotation of text: a sentence ends
+    at every '.', and each of names (a single token) is a coref chain of all
+    its occurrences, with the first as the representative mention.
+    """
+    sentences = [{'index': 0, 'tokens': []}]
+    matches = list(_TOKEN_RE.finditer(text))
+    for i, match in enumerate(matches):
+        sentence = sentences[-1]
+        previous_end = matches[i - 1].end() if i > 0 else 0
+        next_start = (matches[i + 1].start() if i + 1 < len(matches)
+                      else len(text))
+        sentence['tokens'].append({
+            'index': len(sentence['tokens']) + 1,
+            'word': match.group(),
+            'characterOffsetBegin': match.start(),
+            'characterOffsetEnd': match.end(),
+            'before': text[previous_end:match.start()],
+            'after': text[match.end():next_start],
+        })
+        if match.group() == '.' and i + 1 < len(matches):
+            sentences.append({'index': len(sentences), 'tokens': []})
+
+    corefs = {}
+    chain_ids = {}
+    mention_id = 0
+    for sentence in sentences:
+        num_mentions = 0
+        for token in sentence['tokens']:
+            if token['word'] not in names:
+                continue
+            mention_id += 1
+            num_mentions += 1
+            chain_id = chain_ids.setdefault(token['word'], unicode(mention_id))
+            chain = corefs.setdefault(chain_id, [])
+            chain.append({
+                'id': mention_id,
+                'text': token['word'],
+                'type': 'PROPER',
+                'sentNum': sentence['index'] + 1,
+                'startIndex': token['index'],
+                'endIndex': token['index'] + 1,
+                'isRepresentativeMention': len(chain) == 0,
+                'position': [sentence['index'] + 1, num_mentions],
+            })
+    return {'sentences': sentences, 'corefs': corefs}
+
+
+def without_whitespace(ann):
+    """
+    The annotation without the whitespace around tokens (which a chunk
+    doesn't know about at its edges).
+    """
+    ann = copy.deepcopy(ann)
+    for sentence in ann['sentences']:
+        for token in sentence['tokens']:
+            del token['before'], token['after']
+    return ann
+
+
+TEXT = (u'Smith met Jones. Smith spoke.\n'
+        u'Jones left. Then Brown came.\n'
+        u'Brown and Smith talked.\n')
+NAMES = [u'Smith', u'Jones', u'Brown']
+
+
+def test_merge_annotations_like_whole_text():
+    chunks = split_into_chunks(TEXT, 35)
+    assert len(chunks) == 3
+    assert u''.join(chunk for _, chunk in chunks) == TEXT
+
+    anns = [fake_annotate(chunk, NAMES) for _, chunk in chunks]
+    merged = merge_annotations(anns, [offset for offset, _ in chunks])
+    assert (without_whitespace(merged) ==
+            without_whitespace(fake_annotate(TEXT, NAMES)))
+
+
+def test_merge_annotations_last_name_only():
+    first = fake_annotate(u'Jane Smith spoke.\n', [u'Jane'])
+    # 'Jane Smith' as one name.
+    first['corefs'][u'1'][0]['text'] = u'Jane Smith'
+    second = fake_annotate(u'Smith left.\n', [u'Smith'])
+    merged = merge_annotations([first, second], [0, 18])
+    assert list(merged['corefs']) == [u'1']
+    chain = merged['corefs'][u'1']
+    assert [m['id'] for m in chain] == [1, 2]
+    assert [m['sentNum'] for m in chain] == [1, 2]
+    assert [m['isRepresentativeMention'] for m in chain] == [True, False]
+
+
+def test_merge_annotations_keeps_chains_of_one_chunk_apart():
+    # CoreNLP kept these apart, so we don't merge them by name.
+    ann = fake_annotate(u'Smith met Smith.\n', [u'Smith'])
+    ann['corefs'][u'2'] = [ann['corefs'][u'1'].pop()]
+    ann['corefs'][u'2'][0]['isRepresentativeMention'] = True
+    merged = merge_annotations([ann], [0])
+    assert sorted(merged['corefs']) == [u'1', u'2']
+
+
+DOCS = [u'Smith met Jones. Smith spoke.', u'Brown left.', u'Then it rained.']
+
+
+def test_split_batch_annotation_like_each_document():
+    text, offsets = join_batch(DOCS)
+    doc_anns = split_batch_annotation(fake_annotate(text, NAMES), offsets)
+    assert doc_anns == [fake_annotate(doc, NAMES) for doc in DOCS]
+
+
+def test_split_batch_annotation_chain_across_documents():
+    text, offsets = join_batch([u'Smith spoke.', u'Smith left.', u'Fine.'])
+    doc_anns = split_batch_annotation(fake_annotate(text, NAMES), offsets)
+    assert doc_anns[:2] == [None, None]
+    assert doc_anns[2] == fake_annotate(u'Fine.')
+
+
+def test_split_batch_annotation_speaker_in_another_document():
+    text, offsets = join_batch(DOCS)
+    ann = fake_annotate(text, NAMES)
+    # Someone in the first document says something in the second.
+    ann['sentences'][3]['tokens'][0]['speaker'] = u'1'
+    doc_anns = split_batch_annotation(ann, offsets)
+    assert doc_anns[0] == fake_annotate(DOCS[0], NAMES)
+    assert doc_anns[1] is None
+
+
+def test_split_batch_annotation_missing_boundary():
+    text, offsets = join_batch(DOCS)
+    with pytest.raises(ValueError):
+        split_batch_annotation(fake_annotate(text, NAMES), offsets + [0])
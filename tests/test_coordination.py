@@ -0,0 +1,72 @@
+import os
+
+from annotate_corpus import articles_stratified
+from annotation_io import AnnotationOutput
+from coordination import NodeShard, get_node_output_path, merge_node_outputs
+from sampling import load_strata, save_strata
+
+
+class FakeSource(object):
+    """
+    Ten articles in two strata, without article_strata (like TechCrunch).
+    """
+    name = 'fake'
+
+    def __init__(self, out_fn):
+        self.out_fn = out_fn
+
+    def output_filename(self):
+        return self.out_fn
+
+    def articles(self, skip):
+        for i in range(10):
+            art_id = 'a{}'.format(i)
+            if not skip(art_id):
+                yield art_id, {'stratum': u'S{}'.format(i % 2)}, 'Text.'
+
+    @staticmethod
+    def stratum(art_id, art_data):
+        return art_data['stratum']
+
+
+class FakeLease(object):
+
+    def __init__(self, node):
+        self.node = node
+        self.lost = False
+
+
+def write_tsv(path, art_ids):
+    # (With its manifest, which is where the other nodes read the ids.)
+    output = AnnotationOutput(path, codec='none')
+    output.load()
+    for art_id in art_ids:
+        output.write('{}\t{{}}\tnull\n'.format(art_id))
+    output.close()
+
+
+def test_taken_over_shard_counts_all_strata(tmpdir):
+    out_fn = str(tmpdir.join('fake.tsv'))
+    source = FakeSource(out_fn)
+    done_elsewhere = ['a0', 'a1', 'a2', 'a3', 'a4', 'a5']
+    write_tsv(get_node_output_path(out_fn, 'node1'), done_elsewhere)
+
+    shard = NodeShard(source, FakeLease('node2'))
+    art_ids = [art_id for _, art_id, _, _ in articles_stratified(
+        [shard], [lambda art_id: False])]
+    assert sorted(art_ids) == ['a6', 'a7', 'a8', 'a9']
+    assert load_strata(shard.output_filename()) == {u'S0': 5, u'S1': 5}
+
+
+def test_merge_takes_the_most_of_each_stratum(tmpdir):
+    out_fn = str(tmpdir.join('fake.tsv'))
+    for node, art_ids, strata in [
+            ('node1', ['a0', 'a1'], {u'S0': 5, u'S1': 5}),
+            ('node2', ['a2'], {u'S0': 2, u'S1': 2, u'S2': 1})]:
+        path = get_node_output_path(out_fn, node)
+        write_tsv(path, art_ids)
+        save_strata(path, strata)
+
+    assert merge_node_outputs(out_fn, codec='none') == 3
+    assert load_strata(out_fn) == {u'S0': 5, u'S1': 5, u'S2': 1}
+    assert not os.path.exists(get_node_output_path(out_fn, 'node1'))
@@ -0,0 +1,115 @@
+import argparse
+import json
+
+import annotate_corpus
+from annotate_corpus import add_annotation_arguments, annotate_sources
+from annotation_io import (FailureJournal, get_failure_journal_path,
+                           iter_annotation_lines)
+from dedup import DUPLICATE_KEY, Deduplicator
+
+TEXT = u'Ann Smith was elected mayor of the city on Tuesday night.'
+OTHER_TEXT = u'The museum will open a new wing for modern art in the spring.'
+
+
+def test_pending_until_confirmed(tmpdir):
+    path = str(tmpdir.join('dedup_index.tsv'))
+    dedup = Deduplicator(path)
+    dedup.load()
+    assert dedup.check('a', TEXT) is None
+    assert dedup.is_pending('a')
+    # A duplicate is found while the canonical article is pending...
+    assert dedup.check('b', TEXT.upper()) == 'a'
+    # ... but it's only kept once it's confirmed.
+    assert tmpdir.join('dedup_index.tsv').read() == ''
+    dedup.confirm('a')
+    assert not dedup.is_pending('a')
+    dedup.close()
+
+    dedup = Deduplicator(path)
+    dedup.load()
+    assert dedup.check('c', TEXT) == 'a'
+    assert not dedup.is_pending('a')
+    dedup.close()
+
+
+def test_discarded(tmpdir):
+    path = str(tmpdir.join('dedup_index.tsv'))
+    dedup = Deduplicator(path)
+    dedup.load()
+    assert dedup.check('a', TEXT) is None
+    assert dedup.check('b', OTHER_TEXT) is None
+    dedup.discard('a')
+    assert len(dedup) == 1
+    # The next copy (exact or near) is canonical instead.
+    assert dedup.check('c', TEXT + u' More.') is None
+    assert dedup.check('d', TEXT) == 'c'
+    dedup.confirm('b')
+    dedup.confirm('c')
+    dedup.close()
+    assert [line.split('\t')[0] for line in
+            tmpdir.join('dedup_index.tsv').readlines()] == ['b', 'c']
+
+
+class FakeSource(object):
+    name = 'fake'
+
+    def __init__(self, out_fn, articles):
+        self.out_fn = out_fn
+        self._articles = articles
+
+    def output_filename(self):
+        return self.out_fn
+
+    def articles(self, skip):
+        for art_id, text in self._articles:
+            if not skip(art_id):
+                yield art_id, {}, text
+
+
+def fake_annotate_many(failing_texts):
+    def annotate_many(items, **kwargs):
+        # All the articles are read first, so that their duplicates are
+        # found while the canonical articles are still pending.
+        for _id, text in list(items):
+            if text in failing_texts:
+                yield _id, None, ValueError('Too long')
+            else:
+                yield _id, {'text': text}, None
+    return annotate_many
+
+
+def annotate(monkeypatch, source, dedup, failing_texts=(), extra_args=()):
+    parser = argparse.ArgumentParser()
+    add_annotation_arguments(parser)
+    args = parser.parse_args(['--codec', 'none'] + list(extra_args))
+    monkeypatch.setattr(annotate_corpus, 'annotate_corenlp_many',
+                        fake_annotate_many(failing_texts))
+    dedup.load()
+    annotate_sources([source], args, None, dedup)
+    dedup.close()
+
+    lines = {}
+    for line in iter_annotation_lines(source.out_fn):
+        art_id, art_data, ann = line.rstrip('\n').split('\t')
+        lines[art_id] = (json.loads(art_data).get(DUPLICATE_KEY),
+                         json.loads(ann))
+    return lines
+
+
+def test_duplicates_of_a_failed_article(tmpdir, monkeypatch):
+    out_fn = str(tmpdir.join('fake.tsv'))
+    dedup_fn = str(tmpdir.join('dedup_index.tsv'))
+    source = FakeSource(out_fn, [('a', TEXT), ('b', OTHER_TEXT),
+                                 ('c', TEXT), ('d', OTHER_TEXT)])
+
+    lines = annotate(monkeypatch, source, Deduplicator(dedup_fn),
+                     failing_texts=[TEXT])
+    # c doesn't point to a, which failed, but fails with it.
+    assert lines == {'b': (None, {'text': OTHER_TEXT}), 'd': ('b', None)}
+    assert sorted(FailureJournal(get_failure_journal_path(out_fn)).load()) == [
+        'a', 'c']
+
+    lines = annotate(monkeypatch, source, Deduplicator(dedup_fn),
+                     extra_args=['--retry_failed'])
+    assert lines['a'] == (None, {'text': TEXT})
+    assert lines['c'] == ('a', None)
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from nyt_index import NYTIndex, _categorize, _concatenate
+
+DESCRIPTORS = [
+    u'Arts|Politics',
+    u'Art',
+    u'',
+    u'ART AND MUSIC|Art',
+    u'Politics|Art Deco',
+    u'A',
+    u'AA',
+    u'AAA|A\xe9',
+]
+
+
+def write_index(tmpdir, descriptors=DESCRIPTORS, old_format=False):
+    """
+    Writes an index of articles with the given descriptors (the other columns
+    don't matter), and returns its path.
+    """
+    n = len(descriptors)
+    columns = dict((key, np.zeros(n, dtype=np.int16))
+                   for key in NYTIndex.COLUMNS)
+    columns['id'] = np.array(['a{}'.format(i) for i in range(n)])
+    for key in ['news_desk', 'section']:
+        columns[key + '_codes'], columns[key + '_table'] = _categorize(
+            [u''] * n)
+    for key, values in [('descriptors', descriptors), ('byline', [u''] * n)]:
+        if old_format:
+            columns[key] = np.array(values, dtype=unicode)
+        else:
+            columns[key + '_buffer'], columns[key + '_offsets'] = (
+                _concatenate(values))
+    path = str(tmpdir.join('index.npz'))
+    np.savez_compressed(path, **columns)
+    return path
+
+
+def matching(index, descriptors):
+    return [int(art_id[1:]) for art_id in
+            index.ids(index.mask(descriptors=descriptors))]
+
+
+@pytest.mark.parametrize('old_format', [False, True])
+def test_whole_descriptors(tmpdir, old_format):
+    index = NYTIndex(write_index(tmpdir, old_format=old_format))
+    assert index.strings('descriptors') == DESCRIPTORS
+    # Not Arts, ART AND MUSIC or Art Deco.
+    assert matching(index, ['Art']) == [1, 3]
+    assert matching(index, ['Politics']) == [0, 4]
+    assert matching(index, ['Arts', 'Art Deco']) == [0, 4]
+    assert matching(index, ['Music']) == []
+    # Matches that overlap, or run on into the next article.
+    assert matching(index, ['A']) == [5]
+    assert matching(index, ['AA']) == [6]
+    assert matching(index, [u'A\xe9']) == [7]
+    assert matching(index, ['']) == [2]
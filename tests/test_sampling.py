@@ -0,0 +1,88 @@
+import math
+import random
+
+import pytest
+
+from sampling import Z_95, stratified_estimate
+
+
+def test_everything_sampled():
+    samples = {'a': [(1, 2), (3, 4)], 'b': [(0, 4)]}
+    estimate = stratified_estimate(samples, {'a': 2, 'b': 1})
+    assert estimate.value == pytest.approx(4 / 10.)
+    assert estimate.low == estimate.high == estimate.value
+    assert (estimate.sampled, estimate.population, estimate.covered) == (
+        3, 3, 1.)
+
+
+def test_mean_of_one_stratum():
+    ys = [1., 2., 4., 7.]
+    estimate = stratified_estimate({'a': [(y, 1) for y in ys]}, {'a': 10})
+    mean = sum(ys) / len(ys)
+    variance = sum((y - mean) ** 2 for y in ys) / (len(ys) - 1)
+    error = Z_95 * math.sqrt((1 - 4 / 10.) * variance / 4)
+    assert estimate.value == pytest.approx(mean)
+    assert estimate.low == pytest.approx(mean - error)
+    assert estimate.high == pytest.approx(mean + error)
+
+
+def test_strata_weighted_by_size():
+    # Half of a in the sample, all of b: each stratum's means count by its
+    # size, not by how many were sampled.
+    samples = {'a': [(1, 1), (1, 1)], 'b': [(0, 1)]}
+    estimate = stratified_estimate(samples, {'a': 4, 'b': 1})
+    assert estimate.value == pytest.approx(4 / 5.)
+
+
+def test_unsampled_and_unknown_strata():
+    samples = {'a': [(1, 1), (0, 1)], 'b': [(5, 1)], 'c': [(9, 1)]}
+    estimate = stratified_estimate(samples, {'a': 2, 'b': 0, 'd': 6})
+    # Only a counts: b has no articles, c isn't in the population, and d
+    # hasn't been sampled.
+    assert estimate.value == pytest.approx(0.5)
+    assert (estimate.sampled, estimate.population, estimate.covered) == (
+        2, 8, 0.25)
+
+
+def test_nothing_to_estimate_from():
+    assert stratified_estimate({}, {'a': 3}) is None
+    assert stratified_estimate({'a': [(0, 0)]}, {'a': 3}) is None
+
+
+def test_singleton_strata():
+    # The one article of b gets the variance of a.
+    samples = {'a': [(0, 1), (2, 1), (4, 1)], 'b': [(3, 1)]}
+    with_b = stratified_estimate(samples, {'a': 30, 'b': 30})
+    without_b = stratified_estimate({'a': samples['a']}, {'a': 30})
+    assert with_b.high - with_b.low > without_b.high - without_b.low
+    assert not math.isinf(with_b.high)
+
+    # With nothing to pool, we don't know.
+    only_singletons = stratified_estimate({'a': [(1, 1)], 'b': [(2, 1)]},
+                                          {'a': 5, 'b': 5})
+    assert math.isinf(only_singletons.high)
+
+
+def test_coverage():
+    random_state = random.Random(0)
+    population = {}
+    articles = {}
+    for stratum, female_share in [('a', 0.2), ('b', 0.4), ('c', 0.3)]:
+        articles[stratum] = []
+        for _ in range(random_state.randint(200, 400)):
+            x = random_state.randint(1, 10)
+            y = sum(random_state.random() < female_share for _ in range(x))
+            articles[stratum].append((y, x))
+        population[stratum] = len(articles[stratum])
+    truth = (sum(y for a in articles.values() for y, _ in a) /
+             float(sum(x for a in articles.values() for _, x in a)))
+
+    covered = 0
+    num_tries = 1000
+    for _ in range(num_tries):
+        samples = dict((stratum, random_state.sample(a, len(a) / 10))
+                       for stratum, a in articles.items())
+        estimate = stratified_estimate(samples, population)
+        covered += int(estimate.low <= truth <= estimate.high)
+    # About 95% of the 95% confidence intervals should have the truth.
+    assert 0.92 <= covered / float(num_tries) <= 0.98
@@ -0,0 +1,128 @@
+import xml.etree.cElementTree as ET
+
+import pytest
+
+from sources import (NYT_MULTIPLE_XPATHS, NYT_PAGE_NUMBER_XPATH,
+                     NYT_SINGLE_XPATHS, NYT_SINGLE_XPATHS_CONTENT,
+                     parse_nyt_article)
+
+
+def parse_with_xpaths(article_id, xml, all_pages):
+    """
+    How we used to parse an article: the whole of it, with ElementTree's
+    find for each of the XPATHS.
+    """
+    root = ET.fromstring(xml)
+    page_number_node = root.find(NYT_PAGE_NUMBER_XPATH)
+    if page_number_node is None:
+        return None
+    page_number = int(page_number_node.attrib['content'])
+    if not all_pages and page_number != 1:
+        return None
+
+    data = {'id': article_id, 'page_number': page_number}
+    for key, xpath in NYT_SINGLE_XPATHS.iteritems():
+        node = root.find(xpath)
+        if node is not None:
+            if key in ['text', 'lead']:
+                data[key] = '\n'.join([el.text for el in node])
+            else:
+                data[key] = node.text
+    for key, xpath in NYT_SINGLE_XPATHS_CONTENT.iteritems():
+        node = root.find(xpath)
+        if node is not None:
+            data[key] = node.attrib['content']
+    for key, xpath in NYT_MULTIPLE_XPATHS.iteritems():
+        data[key] = [node.text for node in root.findall(xpath)]
+
+    if 'text' not in data:
+        return None
+    if data['text'].startswith('LEAD'):
+        data['text'] = data['text'][data['text'].index('\n') + 1:]
+    data['text'] = data['text'].replace("''", '"')
+    return data
+
+
+HEAD = '''<head>
+    <title>Hi</title>
+    {page}
+    <meta content="Metropolitan Desk" name="dsk"/>
+    <meta content="New York and Region; Front Page" name="online_sections"/>
+    <docdata>
+      <doc-id id-string="0000001"/>
+      <identified-content>
+        <classifier class="indexing_service" type="descriptor">POLITICS</classifier>
+        <classifier class="indexing_service" type="descriptor">ELECTIONS</classifier>
+        <classifier class="online_producer" type="general_descriptor">Politics</classifier>
+        <person class="indexing_service">SMITH, ANN</person>
+        <org class="online_producer">City Hall</org>
+      </identified-content>
+    </docdata>
+  </head>'''
+
+BODY = '''<body>
+    <body.head>
+      <hedline><hl1>Headline &amp; More</hl1></hedline>
+      <byline class="print_byline">By JOHN DOE</byline>
+      <byline class="print_byline">By SOMEONE ELSE</byline>
+      <byline class="normalized_byline">Doe, John</byline>
+    </body.head>
+    <body.content>
+      <block class="lead_paragraph"><p>LEAD: It began.</p></block>
+      {text}
+    </body.content>
+  </body>'''
+
+TEXT = ('<block class="full_text"><p>LEAD: It began.</p>'
+        "<p>Ann Smith said ''hello.''</p><p>Caf&#233; time.</p></block>")
+
+
+def nyt_xml(page=1, text=TEXT, body_first=False):
+    head = HEAD.format(page='' if page is None else
+                       '<meta content="{}" name="print_page_number"/>'.format(
+                           page))
+    body = BODY.format(text=text)
+    if body_first:
+        head, body = body, head
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<nitf version="-//IPTC//DTD NITF 3.3//EN">\n'
+            '  {}\n  {}\n</nitf>\n'.format(head, body))
+
+
+def test_parse_nyt_article():
+    data = parse_nyt_article('1990_01_01_0000001', nyt_xml(), False)
+    assert data == parse_with_xpaths('1990_01_01_0000001', nyt_xml(), False)
+    assert data['page_number'] == 1
+    assert data['headline'] == 'Headline & More'
+    # The first match, like find.
+    assert data['print_byline'] == 'By JOHN DOE'
+    assert data['news_desk'] == 'Metropolitan Desk'
+    assert data['descriptors'] == ['POLITICS', 'ELECTIONS']
+    assert data['general_online_descriptors'] == ['Politics']
+    assert data['online_organizations'] == ['City Hall']
+    assert data['locations'] == []
+    assert data['text'] == u'Ann Smith said "hello."\nCaf\xe9 time.'
+
+
+@pytest.mark.parametrize('all_pages', [False, True])
+@pytest.mark.parametrize('page', [None, 1, 7])
+@pytest.mark.parametrize('text', [TEXT, ''])
+@pytest.mark.parametrize('body_first', [False, True])
+def test_parse_nyt_article_like_xpaths(all_pages, page, text, body_first):
+    # (With the <body> first, it's parsed as a whole.)
+    xml = nyt_xml(page, text, body_first)
+    assert (parse_nyt_article('1990_01_01_0000001', xml, all_pages) ==
+            parse_with_xpaths('1990_01_01_0000001', xml, all_pages))
+
+
+def test_parse_nyt_article_other_pages():
+    assert parse_nyt_article('1990_01_01_0000001', nyt_xml(7), False) is None
+    data = parse_nyt_article('1990_01_01_0000001', nyt_xml(7), True)
+    assert data['page_number'] == 7
+
+
+def test_parse_nyt_article_without_page_or_text():
+    assert parse_nyt_article('1990_01_01_0000001', nyt_xml(None),
+                             True) is None
+    assert parse_nyt_article('1990_01_01_0000001', nyt_xml(text=''),
+                             True) is None
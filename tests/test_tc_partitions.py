@@ -0,0 +1,54 @@
+import json
+
+from tc_partitions import (iter_techcrunch, iter_techcrunch_json,
+                           partition_techcrunch)
+
+
+def article(timestamp, title):
+    return {'timestamp': timestamp, 'title': title}
+
+
+def write_json(tmpdir, text):
+    path = tmpdir.join('techcrunch_everything.json')
+    path.write(text)
+    return str(path)
+
+
+def test_iter_techcrunch_json_matches_json_load(tmpdir):
+    articles = {
+        'http://tc/a': article('2012-03-01 10:00:00', u'A {"tricky": "one"}'),
+        'http://tc/b': article('2012-04-02 11:00:00', u'B \xe9'),
+        'http://tc/c': article('2011-12-31 23:59:59', u'C' * 1000),
+    }
+    path = write_json(tmpdir, json.dumps(articles, indent=1))
+    # A tiny chunk size, so that values span many chunks.
+    assert dict(iter_techcrunch_json(path, chunk_size=7)) == articles
+
+
+def test_iter_techcrunch_json_empty(tmpdir):
+    path = write_json(tmpdir, ' { } ')
+    assert list(iter_techcrunch_json(path)) == []
+
+
+def test_iter_techcrunch_json_repeated_url_last_wins(tmpdir):
+    text = ('{"http://tc/a": {"timestamp": "2012-03-01", "title": "old"},\n'
+            ' "http://tc/b": {"timestamp": "2012-03-02", "title": "b"},\n'
+            ' "http://tc/a": {"timestamp": "2012-04-01", "title": "new"}}')
+    path = write_json(tmpdir, text)
+    articles = list(iter_techcrunch_json(path, chunk_size=16))
+    assert dict(articles) == json.loads(text)
+    assert [url for url, _ in articles] == ['http://tc/b', 'http://tc/a']
+    assert articles[1][1]['title'] == 'new'
+
+
+def test_partition_repeated_url_once(tmpdir):
+    text = ('{"http://tc/a": {"timestamp": "2012-03-01", "title": "old"},\n'
+            ' "http://tc/a": {"timestamp": "2012-04-01", "title": "new"}}')
+    path = write_json(tmpdir, text)
+    partitions = str(tmpdir.join('partitions'))
+    assert partition_techcrunch(path, partitions) == 1
+    assert list(iter_techcrunch(partitions, 2012, 3)) == []
+    assert [data['title'] for _, data in
+            iter_techcrunch(partitions, 2012)] == ['new']
+    assert (list(iter_techcrunch(partitions, 2012)) ==
+            list(iter_techcrunch(path, 2012)))
@@ -0,0 +1,40 @@
+import errno
+import threading
+
+from nlp import utils
+
+
+def annotate_many(items, **kwargs):
+    """
+    Runs annotate_corenlp_many in a thread, so that a hang fails the test
+    rather than hanging it. Returns its results, or None if it hung.
+    """
+    results = []
+
+    def run():
+        results.extend(utils.annotate_corenlp_many(
+            items, client=object(), max_in_flight=2, use_cache=False,
+            **kwargs))
+        results.append('finished')
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    thread.join(30)
+    if not results or results[-1] != 'finished':
+        return None
+    return results[:-1]
+
+
+def test_batch_error_fails_the_batch(monkeypatch):
+    error = IOError(errno.ENOSPC, 'No space left on device')
+
+    def annotate_corenlp_batch(texts, **kwargs):
+        raise error
+
+    monkeypatch.setattr(utils, 'annotate_corenlp_batch',
+                        annotate_corenlp_batch)
+    items = [(i, 'Short text {}.'.format(i)) for i in range(6)]
+    results = annotate_many(items, batch_chars=100)
+    assert results is not None
+    assert sorted(results) == [(i, None, error) for i in range(6)]